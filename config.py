@@ -11,4 +11,24 @@ GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME")
 BQ_DATASET_ID = "eau_potable_mel" 
 
 if not GCP_PROJECT_ID:
-    print("FATAL: La variable d'environnement GCP_PROJECT_ID n'est pas définie.")
\ No newline at end of file
+    print("FATAL: La variable d'environnement GCP_PROJECT_ID n'est pas définie.")
+
+# Profil d'écriture des fichiers Parquet de GCS/processed (lus par BigQuery, DuckDB/Arrow et l'application)
+PROCESSED_PARQUET_COMPRESSION = os.getenv("PROCESSED_PARQUET_COMPRESSION", "zstd").lower()
+# Seuls ces codecs acceptent un niveau de compression (snappy, lz4 ou none le refusent à l'écriture)
+PARQUET_CODECS_WITH_LEVEL = {"zstd", "gzip", "brotli"}
+
+PROCESSED_PARQUET_PROFILE = {
+    "compression": PROCESSED_PARQUET_COMPRESSION,
+    "compression_level": (
+        int(os.getenv("PROCESSED_PARQUET_COMPRESSION_LEVEL", "6"))
+        if PROCESSED_PARQUET_COMPRESSION in PARQUET_CODECS_WITH_LEVEL else None
+    ),
+    # Nombre de lignes par row group : assez grand pour bien compresser, assez petit pour que
+    # les statistiques min/max permettent d'ignorer des row groups à la lecture
+    "row_group_size": int(os.getenv("PROCESSED_PARQUET_ROW_GROUP_SIZE", "131072")),
+    "write_statistics": True,
+}
+
+# Fenêtre (en mois) du taux de non-conformité calculé par commune pour la carte choroplèthe
+CONFORMITE_WINDOW_MONTHS = int(os.getenv("CONFORMITE_WINDOW_MONTHS", "12"))
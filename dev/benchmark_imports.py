@@ -0,0 +1,138 @@
+# dev/benchmark_imports.py
+"""
+Mesure le temps d'import à froid des points d'entrée de l'application et du pipeline
+(python -X importtime, un interpréteur neuf par mesure).
+
+Usage :
+    python dev/benchmark_imports.py                      # cibles par défaut
+    python dev/benchmark_imports.py main src.utils.data_loader --repeat 5 --top 15
+    python dev/benchmark_imports.py --output import_times.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+from typing import Dict, Any, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules importés au démarrage d'une page Streamlit ou d'une exécution du pipeline
+DEFAULT_TARGETS = [
+    "main",
+    "src.utils.data_loader",
+    "src.load.load_to_bq",
+    "src.etl.process_resultats_qualite",
+    "folium",
+]
+
+# ----------------------------------------------------------------------
+# Mesure
+# ----------------------------------------------------------------------
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """
+    Analyse la sortie de -X importtime :
+    'import time: self [us] | cumulative | imported package'.
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, package = line[len("import time:"):].split("|", 2)
+        entries.append({
+            "package": package.strip(),
+            # Profondeur dans l'arbre des imports (indentation de 2 espaces par niveau)
+            "depth": (len(package) - len(package.lstrip()) - 1) // 2,
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+        })
+    return entries
+
+def measure_import(target: str) -> Dict[str, Any]:
+    """Importe `target` dans un interpréteur neuf et retourne le détail des temps d'import."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    entries = parse_importtime(result.stderr)
+    error = None
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"code retour {result.returncode}"
+
+    return {
+        # Seuls les imports de premier niveau sont additionnés (le cumul inclut déjà les sous-imports)
+        "total_ms": sum(e["cumulative_ms"] for e in entries if e["depth"] == 0),
+        "entries": entries,
+        "error": error,
+    }
+
+def benchmark_target(target: str, repeat: int, top: int) -> Dict[str, Any]:
+    """Mesure `repeat` fois un import et retient la médiane et les paquets les plus coûteux."""
+    runs = [measure_import(target) for _ in range(repeat)]
+    totals = [run["total_ms"] for run in runs]
+
+    # Paquets de premier niveau (ex. 'geopandas', 'google.cloud.bigquery') de la dernière mesure
+    top_level = sorted(
+        (e for e in runs[-1]["entries"] if e["depth"] <= 1),
+        key=lambda e: e["cumulative_ms"],
+        reverse=True,
+    )[:top]
+
+    return {
+        "target": target,
+        "median_ms": round(statistics.median(totals), 1),
+        "min_ms": round(min(totals), 1),
+        "max_ms": round(max(totals), 1),
+        "error": runs[-1]["error"],
+        "slowest": [
+            {"package": e["package"].strip(), "cumulative_ms": round(e["cumulative_ms"], 1)}
+            for e in top_level
+        ],
+    }
+
+# ----------------------------------------------------------------------
+# Rapport
+# ----------------------------------------------------------------------
+
+def print_report(results: List[Dict[str, Any]]):
+    print("\n⏱️  Temps d'import à froid (médiane)")
+    print("---------------------------------------------------------")
+    for result in results:
+        status = f"❌ {result['error']}" if result["error"] else "✅"
+        print(f"{result['target']:<40} {result['median_ms']:>9.1f} ms  {status}")
+        for package in result["slowest"]:
+            print(f"    {package['package']:<36} {package['cumulative_ms']:>9.1f} ms")
+    print("---------------------------------------------------------")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark des temps d'import à froid.")
+    parser.add_argument("targets", nargs="*", default=DEFAULT_TARGETS, help="Modules à importer.")
+    parser.add_argument("--repeat", type=int, default=3, help="Nombre de mesures par module.")
+    parser.add_argument("--top", type=int, default=10, help="Nombre de paquets détaillés par module.")
+    parser.add_argument("--output", help="Fichier JSON où enregistrer les résultats (suivi dans le temps).")
+    args = parser.parse_args()
+
+    results = [benchmark_target(target, args.repeat, args.top) for target in args.targets]
+    print_report(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                {"date": datetime.now().isoformat(timespec="seconds"), "python": sys.version.split()[0], "results": results},
+                f,
+                indent=2,
+                ensure_ascii=False,
+            )
+        print(f"💾 Résultats enregistrés dans {args.output}")
+
+    # Code retour non nul si un import échoue (utilisable en CI)
+    sys.exit(1 if any(result["error"] for result in results) else 0)
+
+if __name__ == "__main__":
+    main()
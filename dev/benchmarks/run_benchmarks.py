@@ -0,0 +1,220 @@
+# dev/benchmarks/run_benchmarks.py
+"""
+Benchmark de bout en bout du pipeline, entièrement hors ligne : données Hubeau synthétiques,
+serveur HTTP local à la place de l'API, système de fichiers local à la place de GCS et de BigQuery.
+
+Mesure get_data_from_endpoint_paginated, transform_and_normalize_data, save_df_to_gcs et
+load_parquet_and_deduplicate, puis enregistre les résultats dans dev/benchmarks/results/
+et les compare à la mesure précédente.
+
+Usage :
+    python dev/benchmarks/run_benchmarks.py                         # 100k et 1M lignes
+    python dev/benchmarks/run_benchmarks.py --rows 100000 1000000 10000000 --repeat 3
+    python dev/benchmarks/run_benchmarks.py --extract-max-rows 0    # sans l'extraction HTTP
+"""
+
+import argparse
+import glob
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, Any, Callable
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(os.path.dirname(BENCHMARKS_DIR))
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+
+# Configuration factice : aucun appel ne sort de la machine
+BENCHMARK_BUCKET = "benchmark"
+BENCHMARK_PROJECT = "benchmark"
+os.environ.setdefault("GCP_PROJECT_ID", BENCHMARK_PROJECT)
+os.environ.setdefault("GCS_BUCKET_NAME", BENCHMARK_BUCKET)
+os.environ["HUBEAU_PAGE_DELAY_S"] = "0"
+sys.path.insert(0, REPO_ROOT)
+
+import numpy as np
+
+from synthetic_data import generate_resultats_dis, generate_communes_udi, CRITERE_MOA_MEL
+from stubs import HubeauStubServer, LocalBigQueryClient
+
+from src.api import get_resultats_qualite
+from src.etl import process_resultats_qualite
+from src.load import load_to_bq, key_index
+from src.utils.storage import LocalStorage, set_storage
+
+# ----------------------------------------------------------------------
+# Mesure
+# ----------------------------------------------------------------------
+
+def time_call(func: Callable, repeat: int, setup: Callable = None) -> Dict[str, Any]:
+    """Exécute `func` `repeat` fois (après `setup` éventuel, non chronométré) et retourne les durées."""
+    durations = []
+    result = None
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        started_at = time.perf_counter()
+        result = func(*args)
+        durations.append(time.perf_counter() - started_at)
+    return {
+        'median_s': round(statistics.median(durations), 4),
+        'min_s': round(min(durations), 4),
+        'runs': len(durations),
+        'result': result,
+    }
+
+def install_local_services(workdir: str):
+    """Branche les modules du pipeline sur les substituts locaux de GCS et BigQuery."""
+    storage = LocalStorage(os.path.join(workdir, "gcs", BENCHMARK_BUCKET))
+    bq_client = LocalBigQueryClient(os.path.join(workdir, "bigquery"))
+
+    set_storage(BENCHMARK_BUCKET, storage)
+    load_to_bq.get_bq_client = lambda: bq_client
+    return storage, bq_client
+
+# ----------------------------------------------------------------------
+# Scénarios
+# ----------------------------------------------------------------------
+
+def benchmark_scale(n_rows: int, repeat: int, extract_max_rows: int, seed: int) -> Dict[str, Any]:
+    print(f"\n🧪 Benchmark à {n_rows:,} lignes".replace(",", " "))
+    df_qualite = generate_resultats_dis(n_rows, seed=seed)
+    df_udi = generate_communes_udi(seed=seed)
+    results: Dict[str, Any] = {}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        _, bq_client = install_local_services(workdir)
+
+        # 1. Extraction paginée depuis le serveur HTTP local
+        if n_rows <= extract_max_rows:
+            with HubeauStubServer({'resultats_dis': df_qualite, 'communes_udi': df_udi}) as server:
+                get_resultats_qualite.BASE_URL = server.base_url
+                timing = time_call(
+                    lambda: get_resultats_qualite.get_data_from_endpoint_paginated({"code_departement": "59"}),
+                    repeat
+                )
+            results['get_data_from_endpoint_paginated'] = {**timing, 'result': None, 'rows': len(timing['result'])}
+        else:
+            print(f"   ⏭️ Extraction HTTP ignorée au-delà de {extract_max_rows} lignes.")
+
+        # 2. Transformation et normalisation
+        codes_mel = process_resultats_qualite.get_commune_codes_from_moa(df_qualite, CRITERE_MOA_MEL)
+        timing = time_call(
+            process_resultats_qualite.transform_and_normalize_data,
+            repeat,
+            setup=lambda: (df_qualite.copy(), df_udi.copy(), codes_mel)
+        )
+        tables_dict = timing['result']
+        results['transform_and_normalize_data'] = {
+            **timing, 'result': None, 'rows_out': {name: len(df) for name, df in tables_dict.items()}
+        }
+
+        # 3. Écriture des tables normalisées dans le bucket local
+        timing = time_call(
+            lambda: [process_resultats_qualite.save_df_to_gcs(df, BENCHMARK_BUCKET, name) for name, df in tables_dict.items()],
+            repeat
+        )
+        processed_dir = os.path.join(workdir, "gcs", BENCHMARK_BUCKET, "processed")
+        results['save_df_to_gcs'] = {
+            **timing, 'result': None,
+            'bytes_written': sum(os.path.getsize(path) for path in glob.glob(os.path.join(processed_dir, "*.parquet"))),
+        }
+
+        # 4. Déduplication de la table de faits, la moitié des clés étant déjà « chargée »
+        table_name = 'resultats_mesures'
+        primary_keys = load_to_bq.TABLE_PRIMARY_KEYS[table_name]
+        table_id = f"{BENCHMARK_PROJECT}.{load_to_bq.BQ_DATASET_ID}.{table_name}"
+        df_mesures = tables_dict[table_name]
+        df_already_loaded = df_mesures.iloc[: len(df_mesures) // 2]
+        bq_client.load_table_from_dataframe(df_already_loaded, table_id)
+        key_index.save_key_index(
+            np.unique(key_index.build_composite_keys(df_already_loaded, primary_keys)),
+            BENCHMARK_BUCKET, table_name, len(df_already_loaded)
+        )
+        timing = time_call(
+            lambda: load_to_bq.load_parquet_and_deduplicate(
+                f"gs://{BENCHMARK_BUCKET}/processed/{table_name}.parquet", table_name, primary_keys, table_id
+            ),
+            repeat
+        )
+        results['load_parquet_and_deduplicate'] = {
+            **timing, 'result': None, 'rows_in': len(df_mesures), 'rows_out': len(timing['result'])
+        }
+
+    for result in results.values():
+        result.pop('result', None)
+    return results
+
+# ----------------------------------------------------------------------
+# Résultats
+# ----------------------------------------------------------------------
+
+def get_git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "inconnu"
+
+def load_previous_results() -> Dict[str, Any] | None:
+    """Retourne le fichier de résultats le plus récent (noms horodatés), ou None."""
+    paths = sorted(glob.glob(os.path.join(RESULTS_DIR, "*.json")))
+    if not paths:
+        return None
+    with open(paths[-1], encoding="utf-8") as f:
+        return json.load(f)
+
+def print_comparison(current: Dict[str, Any], previous: Dict[str, Any] | None):
+    """Affiche les médianes et leur évolution par rapport à la mesure précédente (même volume)."""
+    print("\n⏱️  Résultats (médiane)")
+    print("---------------------------------------------------------")
+    for scale, benchmarks in current['scales'].items():
+        previous_benchmarks = (previous or {}).get('scales', {}).get(scale, {})
+        for name, result in benchmarks.items():
+            line = f"{int(scale):>10} lignes  {name:<34} {result['median_s']:>9.3f} s"
+            if name in previous_benchmarks:
+                before = previous_benchmarks[name]['median_s']
+                if before > 0:
+                    delta = (result['median_s'] - before) / before * 100
+                    flag = " ⚠️" if delta > 10 else ""
+                    line += f"  ({delta:+.1f} % vs {previous['revision']}){flag}"
+            print(line)
+    print("---------------------------------------------------------")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hors ligne du pipeline ETL.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000], help="Volumes de resultats_dis à générer.")
+    parser.add_argument("--repeat", type=int, default=1, help="Nombre de mesures par fonction.")
+    parser.add_argument("--extract-max-rows", type=int, default=1_000_000,
+                        help="Volume maximal pour l'extraction HTTP (sérialisation JSON coûteuse au-delà).")
+    parser.add_argument("--seed", type=int, default=0, help="Graine du générateur de données.")
+    parser.add_argument("--no-save", action="store_true", help="N'enregistre pas les résultats.")
+    args = parser.parse_args()
+
+    previous = load_previous_results()
+    current = {
+        'date': datetime.now().isoformat(timespec="seconds"),
+        'revision': get_git_revision(),
+        'python': sys.version.split()[0],
+        'repeat': args.repeat,
+        'scales': {
+            str(n_rows): benchmark_scale(n_rows, args.repeat, args.extract_max_rows, args.seed)
+            for n_rows in args.rows
+        },
+    }
+    print_comparison(current, previous)
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{current['revision']}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2, ensure_ascii=False)
+        print(f"💾 Résultats enregistrés dans {os.path.relpath(path, REPO_ROOT)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# dev/benchmarks/stubs.py
+"""
+Substituts locaux des services externes pour les benchmarks hors ligne :
+- HubeauStubServer : serveur HTTP local servant des pages JSON comme l'API Hubeau,
+- LocalBigQueryClient : cible de chargement BigQuery (une table = un fichier Parquet local).
+GCS est remplacé par le backend local de src/utils/storage.py (LocalStorage).
+"""
+
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+from urllib.parse import urlparse, parse_qs
+
+import pandas as pd
+from google.api_core import exceptions
+
+# ----------------------------------------------------------------------
+# API Hubeau
+# ----------------------------------------------------------------------
+
+class HubeauStubServer:
+    """
+    Sert les DataFrames fournis ({endpoint: df}) sous /api/v1/qualite_eau_potable/<endpoint>,
+    avec la pagination de l'API (paramètres page et size, réponse {'count', 'data'}).
+    """
+
+    def __init__(self, datasets: Dict[str, pd.DataFrame]):
+        self.datasets = datasets
+        handler = self._make_handler()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address
+        return f"http://{host}:{port}/api/v1/qualite_eau_potable/"
+
+    def _make_handler(self):
+        datasets = self.datasets
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                endpoint = url.path.rstrip("/").rsplit("/", 1)[-1]
+                if endpoint not in datasets:
+                    self.send_error(404)
+                    return
+
+                query = parse_qs(url.query)
+                page = int(query.get('page', ['1'])[0])
+                size = int(query.get('size', ['20'])[0])
+                df = datasets[endpoint]
+                page_df = df.iloc[(page - 1) * size: page * size]
+
+                body = page_df.to_json(orient="records", force_ascii=False)
+                payload = f'{{"count": {len(df)}, "first": null, "data": {body}}}'.encode("utf-8")
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                # Pas de journal par requête pendant les mesures
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+# ----------------------------------------------------------------------
+# BigQuery
+# ----------------------------------------------------------------------
+
+class LocalLoadJob:
+    def __init__(self, output_rows: int):
+        self.job_id = uuid.uuid4().hex
+        self.output_rows = output_rows
+
+    def result(self):
+        return self
+
+class LocalTable:
+    def __init__(self, num_rows: int, modified: datetime):
+        self.num_rows = num_rows
+        self.modified = modified
+        self.labels = {}
+
+class LocalBigQueryClient:
+    """
+    Cible de chargement BigQuery locale : chaque table est un fichier Parquet
+    <root>/<projet.dataset.table>.parquet. Seules les opérations de chargement du pipeline sont couvertes.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _table_path(self, table_id: str) -> str:
+        return os.path.join(self.root, f"{table_id}.parquet")
+
+    def get_table(self, table_id: str) -> LocalTable:
+        path = self._table_path(table_id)
+        if not os.path.exists(path):
+            raise exceptions.NotFound(table_id)
+        import pyarrow.parquet as pq
+        return LocalTable(
+            pq.ParquetFile(path).metadata.num_rows,
+            datetime.fromtimestamp(os.path.getmtime(path), tz=timezone.utc),
+        )
+
+    def load_table_from_dataframe(self, df: pd.DataFrame, table_id: str, job_config=None) -> LocalLoadJob:
+        path = self._table_path(table_id)
+        output_rows = len(df)
+        append = job_config is not None and str(job_config.write_disposition).endswith("APPEND")
+        if append and os.path.exists(path):
+            df = pd.concat([pd.read_parquet(path), df], ignore_index=True)
+        df.to_parquet(path, index=False)
+        return LocalLoadJob(output_rows)
+
+    def read_table(self, table_id: str) -> pd.DataFrame:
+        return pd.read_parquet(self._table_path(table_id))
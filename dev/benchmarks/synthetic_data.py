@@ -0,0 +1,106 @@
+# dev/benchmarks/synthetic_data.py
+"""
+Générateur de données synthétiques au format des endpoints Hubeau
+`resultats_dis` et `communes_udi` (mêmes colonnes, mêmes types que les réponses de l'API).
+"""
+
+import numpy as np
+import pandas as pd
+
+CRITERE_MOA_MEL = "MEL - MÉTROPOLE EUROP. DE LILLE"
+
+# Ordres de grandeur du département du Nord
+NB_COMMUNES = 650
+NB_COMMUNES_MEL = 95
+NB_PARAMETRES = 400
+# Nombre moyen de paramètres mesurés par prélèvement
+PARAMETRES_PAR_PRELEVEMENT = 30
+NB_RESEAUX = 300
+
+CONCLUSIONS = np.array([
+    "Eau d'alimentation conforme aux exigences de qualité en vigueur pour l'ensemble des paramètres mesurés.",
+    "Eau d'alimentation non-conforme aux limites de qualité pour les paramètres bactériologiques.",
+    "Eau d'alimentation conforme aux limites de qualité et non conforme aux références de qualité.",
+], dtype=object)
+
+def get_communes(rng: np.random.Generator) -> pd.DataFrame:
+    """Communes du département : codes INSEE, noms et maîtrise d'ouvrage (MEL ou non)."""
+    codes = np.sort(rng.choice(np.arange(59001, 59999), size=NB_COMMUNES, replace=False)).astype(str)
+    nom_moa = np.where(
+        np.arange(NB_COMMUNES) < NB_COMMUNES_MEL,
+        CRITERE_MOA_MEL,
+        np.char.add("SIDEN-SIAN SECTEUR ", (np.arange(NB_COMMUNES) % 12).astype(str)).astype(object),
+    )
+    return pd.DataFrame({
+        'code_commune': codes,
+        'nom_commune': np.char.add("COMMUNE ", codes).astype(object),
+        'code_reseau': np.char.add("059000", (np.arange(NB_COMMUNES) % NB_RESEAUX).astype(str)).astype(object),
+        'nom_moa': rng.permutation(nom_moa),
+    })
+
+def generate_resultats_dis(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """Résultats d'analyses (`resultats_dis`) : environ PARAMETRES_PAR_PRELEVEMENT lignes par prélèvement."""
+    rng = np.random.default_rng(seed)
+    communes = get_communes(rng)
+
+    n_prelevements = max(1, n_rows // PARAMETRES_PAR_PRELEVEMENT)
+    prelevement_idx = np.sort(rng.integers(0, n_prelevements, size=n_rows))
+    commune_of_prelevement = rng.integers(0, NB_COMMUNES, size=n_prelevements)
+    commune_idx = commune_of_prelevement[prelevement_idx]
+    parametre_idx = rng.integers(0, NB_PARAMETRES, size=n_rows)
+
+    dates = pd.Timestamp("2016-01-01", tz="UTC") + pd.to_timedelta(
+        rng.integers(0, 3650 * 24 * 3600, size=n_prelevements), unit="s"
+    )
+    resultat = np.round(rng.gamma(2.0, 5.0, size=n_rows), 3)
+    is_alpha = rng.random(n_rows) < 0.1
+    conclusion_idx = rng.choice(len(CONCLUSIONS), size=n_prelevements, p=[0.9, 0.05, 0.05])
+    code_parametre = (1000 + parametre_idx).astype(str)
+
+    return pd.DataFrame({
+        'code_departement': "59",
+        'nom_departement': "Nord",
+        'code_prelevement': np.char.add("05900", (100000 + prelevement_idx).astype(str)).astype(object),
+        'code_parametre': code_parametre.astype(object),
+        'code_parametre_se': np.char.add("SE", code_parametre).astype(object),
+        'code_parametre_cas': None,
+        'libelle_parametre': np.char.add("Paramètre ", code_parametre).astype(object),
+        'libelle_parametre_maj': np.char.add("PARAMETRE ", code_parametre).astype(object),
+        'libelle_parametre_web': None,
+        'code_type_parametre': np.where(parametre_idx % 3 == 0, "N", "A").astype(object),
+        'code_lieu_analyse': "P",
+        'resultat_alphanumerique': np.where(is_alpha, "<LQ", resultat.astype(str)).astype(object),
+        'resultat_numerique': np.where(is_alpha, 0.0, resultat),
+        'libelle_unite': np.where(parametre_idx % 2 == 0, "mg/L", "µg/L").astype(object),
+        'code_unite': np.where(parametre_idx % 2 == 0, "162", "133").astype(object),
+        'limite_qualite_parametre': np.where(parametre_idx % 5 == 0, "<=50 mg/L", None).astype(object),
+        'reference_qualite_parametre': None,
+        'code_commune': communes['code_commune'].to_numpy()[commune_idx],
+        'nom_commune': communes['nom_commune'].to_numpy()[commune_idx],
+        'nom_uge': np.char.add("UGE ", (commune_idx % 20).astype(str)).astype(object),
+        'nom_distributeur': np.where(commune_idx % 2 == 0, "ILEO", "SOURCEO").astype(object),
+        'nom_moa': communes['nom_moa'].to_numpy()[commune_idx],
+        'date_prelevement': dates.strftime("%Y-%m-%dT%H:%M:%SZ").to_numpy()[prelevement_idx],
+        'conclusion_conformite_prelevement': CONCLUSIONS[conclusion_idx][prelevement_idx],
+        'conformite_limites_bact_prelevement': np.where(conclusion_idx == 1, "N", "C").astype(object)[prelevement_idx],
+        'conformite_limites_pc_prelevement': "C",
+        'conformite_references_bact_prelevement': "C",
+        'conformite_references_pc_prelevement': "C",
+    })
+
+def generate_communes_udi(seed: int = 0, annees=(2022, 2023, 2024)) -> pd.DataFrame:
+    """Rattachement communes / UDI (`communes_udi`) : une ligne par commune, réseau et année."""
+    rng = np.random.default_rng(seed)
+    communes = get_communes(rng)
+    frames = []
+    for annee in annees:
+        frames.append(pd.DataFrame({
+            'code_commune': communes['code_commune'],
+            'nom_commune': communes['nom_commune'],
+            'nom_quartier': "-",
+            'code_reseau': communes['code_reseau'],
+            'nom_reseau': communes['code_reseau'].radd("RESEAU "),
+            'debut_alim': f"{annee}-01-01",
+            'annee': str(annee),
+        }))
+    return pd.concat(frames, ignore_index=True)
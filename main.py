@@ -2,84 +2,223 @@
 
 import sys
 import os
+import argparse
 from datetime import datetime
-
-# --- Imports des étapes ETL ---
-
-# Étape 1: Extraction des UDI (Département 59)
-from src.api.get_udi import main_cloud_ready as extract_communes_udi
-
-# Étape 1: Extraction des Résultats de Qualité (Département 59)
-# NOTE: Vous devez avoir un script similaire appelé 'get_resultats_qualite.py'
-# qui récupère les 1.8M de lignes et les sauve dans GCS/raw.
-try:
-    from src.api.get_resultats_qualite import main as extract_qualite_eau
-except ImportError:
-    print("Avertissement: Le script 'get_resultats_qualite.py' n'est pas trouvé.")
-    sys.exit(1)
-
-
-# Étape 2: Transformation (Inclut maintenant le filtrage des communes MEL)
-from src.etl.process_resultats_qualite import main_cloud_ready as transform_qualite_eau
-
-# Étape 3: Chargement BigQuery
-from src.load.load_to_bq import main as load_data_to_bq 
-
-
-def run_pipeline():
+from functools import partial
+from typing import Dict, Any, List
+
+from config import GCS_BUCKET_NAME, GCP_PROJECT_ID
+from src.pipeline.scheduler import run_stages, run_module_function, print_run_summary, STATUS_FAILED, DEFAULT_MAX_WORKERS
+from src.pipeline.metrics import build_run_report, get_report_object_name, save_run_report
+from src.pipeline.profiling import PROFILE_ENABLED, get_profile_run_dir
+from src.pipeline.territories import (
+    DEFAULT_TERRITORY,
+    PIPELINE_TERRITORIES,
+    TERRITORIES,
+    get_territory,
+    get_departements,
+    get_raw_folder,
+    get_processed_prefix,
+    get_bq_dataset,
+)
+
+# --- Étapes ETL (imports différés) ---
+# Chaque étape (et ses dépendances lourdes : pandas, clients Google Cloud...) n'est importée
+# qu'au moment de son exécution : une exécution partielle ne paie que ce qu'elle utilise.
+
+def extract_communes_udi(code_departement: str):
+    # Étape 1: Extraction des UDI d'un département (GCS/raw/<département>/)
+    from src.api.get_udi import main_cloud_ready
+    main_cloud_ready(code_departement)
+
+def extract_qualite_eau(code_departement: str):
+    # Étape 1: Extraction des Résultats de Qualité d'un département (GCS/raw/<département>/)
+    # NOTE: Vous devez avoir un script similaire appelé 'get_resultats_qualite.py'
+    # qui récupère les 1.8M de lignes et les sauve dans GCS/raw.
+    try:
+        from src.api.get_resultats_qualite import main
+    except ImportError:
+        print("Avertissement: Le script 'get_resultats_qualite.py' n'est pas trouvé.")
+        sys.exit(1)
+    main(code_departement)
+
+def load_table_to_bq(territory_slug: str, table_name: str):
+    # Étape 3: Chargement BigQuery d'une table d'un territoire (les tables sont indépendantes).
+    # Les différentiels ne sont écrits que si l'étape d'alertes, qui les consomme, fait partie du graphe
+    from src.load.load_to_bq import ensure_dataset, load_table
+    dataset_id = get_bq_dataset(territory_slug)
+    ensure_dataset(GCP_PROJECT_ID, dataset_id)
+    load_table(GCP_PROJECT_ID, dataset_id, GCS_BUCKET_NAME, table_name, get_processed_prefix(territory_slug),
+               save_deltas=ALERTS_ENABLED)
+
+def refresh_app_tables(territory_slug: str):
+    # Étape 3b: Tables de service de l'application. La décision de reconstruire revient à
+    # l'ordonnanceur : l'étape n'est lancée que si une table chargée est plus récente que
+    # les tables de service (ou avec --force), d'où tables_changed=True
+    from src.load.load_to_bq import refresh_serving_tables_if_needed
+    refresh_serving_tables_if_needed(GCP_PROJECT_ID, get_bq_dataset(territory_slug), tables_changed=True)
+
+def publish_alerts(territory_slug: str):
+    # Étape 3c: Alertes de non-conformité sur les lignes nouvellement chargées (diffusion via X)
+    from src.twitter.post_tweet import run_alerts
+    run_alerts(territory_slug)
+
+def prepare_geojson():
+    # Étape 4: Contours des communes de la MEL (filtrage, GeoParquet, variantes simplifiées)
+    from src.etl.prepare_geojson import main
+    main()
+
+# --- Graphe des étapes ---
+
+# Les extractions sont rejouées au-delà de cet âge (une reprise le jour même ne réinterroge pas l'API)
+EXTRACT_MAX_AGE_HOURS = int(os.getenv("EXTRACT_MAX_AGE_HOURS", "20"))
+
+PROCESSED_TABLES = ['prelevements', 'parametres', 'communes_reseau', 'resultats_mesures', 'cube_parametres']
+
+# Les alertes ne font partie du graphe qu'avec un diffuseur réel (le diffuseur "file", d'essai,
+# ne consomme pas les différentiels). Sans alertes, le chargement n'écrit pas de différentiels :
+# personne ne les supprimerait et le dossier deltas/ grossirait sans limite
+ALERTS_ENABLED = os.getenv("ALERT_PUBLISHER", "file") != "file"
+
+def build_pipeline_stages(territory_slugs: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Graphe des étapes pour un ensemble de territoires :
+    - une extraction par département (partagée par les territoires qui le couvrent),
+    - par territoire : transformation (processus de travail, limitée par le CPU),
+      chargement des tables dans son dataset, tables de service et alertes (si ALERTS_ENABLED),
+    - contours GeoJSON (MEL uniquement, utilisés par l'application).
+    """
+    stages: Dict[str, Dict[str, Any]] = {}
+
+    for dep in get_departements(territory_slugs):
+        raw_folder = get_raw_folder(dep)
+        stages[f'extract_udi_{dep}'] = {
+            'run': partial(extract_communes_udi, dep),
+            'depends_on': [],
+            'inputs': [],
+            'outputs': [f"gs:{raw_folder}/udi_"],
+            'max_age_hours': EXTRACT_MAX_AGE_HOURS,
+            'retries': 1,
+        }
+        stages[f'extract_qualite_{dep}'] = {
+            'run': partial(extract_qualite_eau, dep),
+            'depends_on': [],
+            'inputs': [],
+            'outputs': [f"gs:{raw_folder}/qualite_eau_"],
+            'max_age_hours': EXTRACT_MAX_AGE_HOURS,
+            'retries': 1,
+        }
+
+    for slug in territory_slugs:
+        departements = get_territory(slug)['departements']
+        prefix = get_processed_prefix(slug)
+        dataset_id = get_bq_dataset(slug)
+
+        stages[f'transform_{slug}'] = {
+            # Fonction de module (importable par un processus "spawn") : le module n'est
+            # importé que dans le processus de travail
+            'run': partial(run_module_function, "src.etl.process_resultats_qualite", "main_cloud_ready", slug),
+            'process': True,
+            'depends_on': [f'extract_{source}_{dep}' for dep in departements for source in ('udi', 'qualite')],
+            'inputs': [f"gs:{get_raw_folder(dep)}/{source}_" for dep in departements for source in ('udi', 'qualite_eau')],
+            'outputs': [f"gs:{prefix}/{table}.parquet" for table in PROCESSED_TABLES],
+        }
+        for table in PROCESSED_TABLES:
+            stages[f'load_{slug}_{table}'] = {
+                'run': partial(load_table_to_bq, slug, table),
+                'depends_on': [f'transform_{slug}'],
+                'inputs': [f"gs:{prefix}/{table}.parquet"],
+                'outputs': [f"bq:{dataset_id}.{table}"],
+            }
+        stages[f'serving_tables_{slug}'] = {
+            'run': partial(refresh_app_tables, slug),
+            'depends_on': [f'load_{slug}_{table}' for table in PROCESSED_TABLES],
+            'inputs': [f"bq:{dataset_id}.{table}" for table in PROCESSED_TABLES],
+            'outputs': [f"bq:{dataset_id}.commune_latest_results", f"bq:{dataset_id}.commune_conformite"],
+        }
+        if ALERTS_ENABLED:
+            stages[f'alerts_{slug}'] = {
+                # Sans sortie déclarée : exécutée à chaque fois (ne lit que les différentiels en attente)
+                'run': partial(publish_alerts, slug),
+                'depends_on': [f'load_{slug}_{table}' for table in PROCESSED_TABLES],
+                'inputs': [],
+                'outputs': [],
+            }
+
+    if DEFAULT_TERRITORY in territory_slugs:
+        stages['geojson'] = {
+            'run': prepare_geojson,
+            'depends_on': [f'load_{DEFAULT_TERRITORY}_communes_reseau'],
+            'inputs': ["bq:communes_reseau", "gs:Geojson/communes-5m.geojson"],
+            'outputs': [
+                "gs:Geojson/communes_filtrees.parquet",
+                "gs:Geojson/communes_filtrees_fin.parquet",
+                "gs:Geojson/communes_filtrees_moyen.parquet",
+                "gs:Geojson/communes_filtrees_grossier.parquet",
+            ],
+        }
+
+    return stages
+
+
+def run_pipeline(stage_names=None, force: bool = False, max_workers: int = DEFAULT_MAX_WORKERS,
+                 profile: bool = PROFILE_ENABLED, territory_slugs: List[str] = None):
     """
-    Orchestre les trois étapes du pipeline ETL : Extraction, Transformation et Chargement.
+    Orchestre les étapes du pipeline ETL (Extraction, Transformation, Chargement, GeoJSON)
+    selon leurs dépendances : les étapes indépendantes tournent en parallèle et les étapes
+    dont les sorties sont à jour sont ignorées.
     """
+    territory_slugs = territory_slugs or PIPELINE_TERRITORIES
     start_time = datetime.now()
     print(f"🚀 Démarrage du pipeline ETL de l'eau potable à {start_time.strftime('%Y-%m-%d %H:%M:%S')}...")
+    print(f"🗺️ Territoires : {', '.join(territory_slugs)}")
 
-    # --- 1. EXTRACTION (API -> GCS/raw) ---
-    try:
-        print("\n--- ÉTAPE 1: Extraction des données API vers GCS (raw) ---")
-        
-        # 1a. Extraction des UDI (Liste des UDI par commune du 59)
-        extract_communes_udi()      
-        
-        # 1b. Extraction des résultats de qualité (Les 1.8M de lignes)
-        extract_qualite_eau()       
-        
-        print("✅ Étape 1 complétée: Données brutes stockées dans GCS.")
-    except Exception as e:
-        print(f"❌ Échec critique lors de l'extraction: {e}")
-        # Arrêter le pipeline si l'extraction échoue
-        sys.exit(1)
+    profile_dir = get_profile_run_dir(start_time) if profile else None
+    if profile_dir:
+        print(f"🔬 Mode profilage : étapes exécutées une à une, artefacts dans {profile_dir}")
 
+    pipeline_stages = build_pipeline_stages(territory_slugs)
+    results = run_stages(pipeline_stages, stage_names, force=force, max_workers=max_workers, profile_dir=profile_dir)
+    print_run_summary(results)
 
-    # --- 2. TRANSFORMATION (GCS/raw -> GCS/processed) ---
-    # Cette étape filtre les données pour la MEL et crée les 4 tables normalisées.
-    try:
-        print("\n--- ÉTAPE 2: Transformation et Normalisation (Filtrage MEL) ---")
-        transform_qualite_eau() 
-        print("✅ Étape 2 complétée: 4 tables normalisées créées sur GCS (processed).")
-    except Exception as e:
-        print(f"❌ Échec critique lors de la transformation: {e}")
-        sys.exit(1)
-
+    # --- FIN DU PIPELINE ---
+    end_time = datetime.now()
+    duration = end_time - start_time
 
-    # --- 3. CHARGEMENT (GCS/processed -> BigQuery) ---
+    # Rapport JSON (statut, durée, lignes, octets, pages API, octets BQ, mémoire par étape) dans GCS/reports
+    report = build_run_report(start_time, end_time, results)
     try:
-        print("\n--- ÉTAPE 3: Chargement dans BigQuery ---")
-        load_data_to_bq()
-        print("✅ Étape 3 complétée: Données chargées dans BigQuery.")
+        save_run_report(report, GCS_BUCKET_NAME, get_report_object_name(start_time))
     except Exception as e:
-        print(f"❌ Échec critique lors du chargement dans BigQuery: {e}")
-        sys.exit(1)
-
+        print(f"⚠️ Rapport d'exécution non enregistré : {e}")
 
-    # --- FIN DU PIPELINE ---
-    end_time = datetime.now()
-    duration = end_time - start_time
+    failed = [name for name, result in results.items() if result['status'] == STATUS_FAILED]
     print("\n---------------------------------------------------------")
-    print(f"🚀 PIPELINE ETL TERMINÉ avec succès à {end_time.strftime('%Y-%m-%d %H:%M:%S')}")
+    if failed:
+        print(f"❌ PIPELINE ETL EN ÉCHEC à {end_time.strftime('%Y-%m-%d %H:%M:%S')} (étapes : {', '.join(failed)})")
+        territory_args = ''.join(f" --territory {slug}" for slug in territory_slugs)
+        print(f"   Reprise : python main.py{territory_args} --stage {' --stage '.join(failed)}")
+    else:
+        print(f"🚀 PIPELINE ETL TERMINÉ avec succès à {end_time.strftime('%Y-%m-%d %H:%M:%S')}")
     print(f"Durée totale d'exécution : {duration}")
     print("---------------------------------------------------------")
 
+    if failed:
+        sys.exit(1)
+
 
 if __name__ == "__main__":
     # La fonction principale à exécuter dans l'environnement GitHub Actions
-    run_pipeline()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Pipeline ETL de l'eau potable (Hubeau -> GCS -> BigQuery).")
+    parser.add_argument("--territory", action="append", choices=list(TERRITORIES),
+                        help="Territoire à traiter (répétable). Par défaut : PIPELINE_TERRITORIES (mel).")
+    parser.add_argument("--stage", action="append",
+                        help="Étape à exécuter (répétable, ex. transform_mel). Par défaut : tout le graphe.")
+    parser.add_argument("--force", action="store_true", help="Exécute les étapes même si leurs sorties sont à jour.")
+    parser.add_argument("--max-workers", type=int, default=DEFAULT_MAX_WORKERS, help="Nombre d'étapes exécutées en parallèle.")
+    parser.add_argument("--profile", action="store_true", default=PROFILE_ENABLED,
+                        help="Profile chaque étape (cProfile + tracemalloc). Équivaut à PIPELINE_PROFILE=1.")
+    args = parser.parse_args()
+
+    run_pipeline(args.stage, force=args.force, max_workers=args.max_workers, profile=args.profile,
+                 territory_slugs=args.territory)
@@ -1,17 +1,22 @@
 # pages_streamlit/1_Carte_Interactive.py
 
 import streamlit as st
-import geopandas as gpd
+import hashlib
+import json
 import pandas as pd
 from streamlit_folium import st_folium
 import folium
 
 # ⭐️ Importation des fonctions de chargement et de requêtage BQ
 from src.utils.data_loader import (
-    load_mel_geojson_data, 
-    load_communes_df_from_geojson, 
-    get_latest_results_for_commune 
+    load_mel_communes_gdf, 
+    GEOJSON_LEVELS,
+    load_map_data,
+    get_latest_results,
+    get_query_cache_stats,
+    get_object_cache_stats
 ) 
+from src.etl.conformite import is_mesure_en_depassement, parse_limite_qualite
 
 # =================================================================
 #                     APPLICATION STREAMLIT (UI ONLY)
@@ -20,50 +25,194 @@ from src.utils.data_loader import (
 st.title("🗺️ Carte Interactive des Communes de la MEL")
 
 # --- 1. Chargement des données (Appel des fonctions mises en cache) ---
-mel_contours_filtered = load_mel_geojson_data()
+# Niveau de détail des contours : les variantes simplifiées sont bien plus légères à transmettre au navigateur
+geojson_level = st.sidebar.selectbox(
+    "Niveau de détail des contours",
+    GEOJSON_LEVELS,
+    help="Les contours simplifiés s'affichent plus vite ; 'complet' correspond à la pleine résolution."
+)
+communes_gdf = load_mel_communes_gdf(geojson_level)
 
-if mel_contours_filtered is None:
+if communes_gdf is None:
     st.stop()
 
-# Conversion en DataFrame pour les détails administratifs
-df_data = load_communes_df_from_geojson(mel_contours_filtered)
+# DataFrame (non-géo) des attributs pour les détails administratifs
+df_data = pd.DataFrame(communes_gdf.drop(columns="geometry"))
 
 if df_data.empty:
     st.error("❌ Impossible de créer le DataFrame de détails administratifs.")
     st.stop()
 
-st.success(f"✅ Données GeoJSON chargées et prêtes pour {len(mel_contours_filtered['features'])} communes.")
+st.success(f"✅ Contours chargés et prêts pour {len(communes_gdf)} communes.")
+
+# Préchargement des dernières analyses et de la conformité de toutes les communes
+# (deux requêtes BigQuery exécutées en parallèle)
+refresh_requested = st.sidebar.button("🔄 Rafraîchir les résultats d'analyse")
+if refresh_requested:
+    # Vide le cache Streamlit et réinterroge BigQuery sans passer par le cache disque des requêtes
+    load_map_data.clear()
+
+latest_results_index, conformite_index = load_map_data(_refresh=refresh_requested)
+
+cache_stats = get_query_cache_stats()
+st.sidebar.caption(
+    f"Cache des requêtes : {cache_stats['hits']} succès / {cache_stats['misses']} échecs "
+    f"({cache_stats['entries']} entrées, {cache_stats['size_bytes'] / 1e6:.1f} Mo)"
+)
+object_cache_stats = get_object_cache_stats()
+st.sidebar.caption(
+    f"Cache des fichiers GCS : {object_cache_stats['hits']} succès / {object_cache_stats['misses']} échecs "
+    f"({object_cache_stats['entries']} entrées, {object_cache_stats['size_bytes'] / 1e6:.1f} Mo)"
+)
 
 
 # --- 2. Création et affichage de la carte Folium ---
 st.subheader("Visualisation du périmètre des communes")
 
+MAP_KEY = "carte_mel"
 mel_center = [50.63, 3.06]
-m = folium.Map(location=mel_center, zoom_start=10, tiles="cartodb positron")
-
-def style_function(feature):
-    return {
-        'fillColor': '#3498db',
-        'color': 'black',
-        'weight': 0.5,
-        'fillOpacity': 0.4
-    }
-
-# Ajout du GeoJson à la carte
-folium.GeoJson(
-    mel_contours_filtered,
-    name="Communes",
-    style_function=style_function,
-    highlight_function=lambda x: {'fillColor': '#f1c40f', 'fillOpacity': 0.7},
-    tooltip=folium.GeoJsonTooltip(
-        fields=['nom', 'code'],
-        aliases=['Commune', 'Code INSEE'],
-        localize=True
+
+# Couleurs du mode "Conformité" (carte choroplèthe)
+CONFORMITE_STYLES = {
+    'non_conforme': ('#e74c3c', "Dernière analyse non conforme"),
+    'non_conformites_recentes': ('#f39c12', "Non-conformités sur la période"),
+    'conforme': ('#2ecc71', "Conforme sur la période"),
+    'sans_donnee': ('#bdc3c7', "Pas d'analyse disponible"),
+}
+
+def get_conformite_status(record: dict | None) -> str:
+    """Classe une commune à partir de son agrégat de conformité."""
+    if not record:
+        return 'sans_donnee'
+    if record.get('dernier_non_conforme'):
+        return 'non_conforme'
+    if (record.get('nb_non_conformes') or 0) > 0:
+        return 'non_conformites_recentes'
+    return 'conforme'
+
+def get_conformite_version(conformite_by_commune: dict | None) -> str | None:
+    """Empreinte stable de l'agrégat de conformité (clé de cache de la couche à la place du dictionnaire)."""
+    if conformite_by_commune is None:
+        return None
+    payload = json.dumps(conformite_by_commune, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# Une couche par niveau de détail et mode d'affichage ; les anciennes versions de l'agrégat sont évincées
+COMMUNES_LAYER_CACHE_ENTRIES = len(GEOJSON_LEVELS) * 2
+# Même durée de vie que les contours en cache (load_mel_communes_gdf) : des contours republiés
+# apparaissent sans redémarrage, y compris en mode "Périmètre" dont la clé ne change jamais
+COMMUNES_LAYER_TTL_S = 3600
+
+@st.cache_resource(show_spinner=False, max_entries=COMMUNES_LAYER_CACHE_ENTRIES, ttl=COMMUNES_LAYER_TTL_S)
+def build_communes_layer_json(geojson_level: str, display_mode: str, conformite_version: str | None,
+                              _conformite_by_commune: dict | None = None) -> str:
+    """
+    Sérialise une seule fois (par niveau de détail, mode d'affichage et version de l'agrégat,
+    pour toutes les sessions) la couche GeoJSON des communes, avec la couleur et le statut de
+    conformité de chaque commune dans ses propriétés. Le texte, immuable, se partage sans risque
+    entre sessions, contrairement aux objets folium modifiés au rendu.
+    L'agrégat (préfixé par _) n'est pas haché : conformite_version le remplace.
+    """
+    gdf_communes = load_mel_communes_gdf(geojson_level)[['nom', 'code', 'geometry']].copy()
+    if _conformite_by_commune is None:
+        gdf_communes['couleur'] = '#3498db'
+    else:
+        statuses = [get_conformite_status(_conformite_by_commune.get(code)) for code in gdf_communes['code']]
+        gdf_communes['couleur'] = [CONFORMITE_STYLES[status][0] for status in statuses]
+        gdf_communes['statut_conformite'] = [CONFORMITE_STYLES[status][1] for status in statuses]
+    return gdf_communes.to_json()
+
+def build_session_map(communes_layer_json: str, with_conformite: bool) -> folium.Map:
+    """
+    Construit la carte de la session (fond de carte et couche des communes avec leurs infobulles)
+    à partir du GeoJSON en cache : les objets folium ne sont jamais partagés entre sessions.
+    """
+    session_map = folium.Map(location=mel_center, zoom_start=10, tiles="cartodb positron")
+
+    tooltip_fields, tooltip_aliases = ['nom', 'code'], ['Commune', 'Code INSEE']
+    if with_conformite:
+        tooltip_fields.append('statut_conformite')
+        tooltip_aliases.append('Conformité')
+
+    fill_opacity = 0.6 if with_conformite else 0.4
+    folium.GeoJson(
+        communes_layer_json,
+        name="Communes",
+        style_function=lambda feature: {
+            'fillColor': feature['properties']['couleur'],
+            'color': 'black',
+            'weight': 0.5,
+            'fillOpacity': fill_opacity
+        },
+        highlight_function=lambda x: {'fillColor': '#f1c40f', 'fillOpacity': 0.7},
+        tooltip=folium.GeoJsonTooltip(
+            fields=tooltip_fields,
+            aliases=tooltip_aliases,
+            localize=True
+        )
+    ).add_to(session_map)
+    return session_map
+
+def get_parametre_statut(df_results: pd.DataFrame) -> pd.Series:
+    """
+    Statut propre à chaque paramètre : résultat comparé à sa limite de qualité
+    (règles partagées avec l'ETL et les alertes, cf. src/etl/conformite.py).
+    """
+    df_mesures = df_results.assign(
+        resultat_numerique=pd.to_numeric(df_results['resultat_numerique'], errors='coerce'),
+        resultat_alphanumerique=df_results['resultat_analyse'],
+    )
+    df_parametres = df_results[['code_parametre', 'limite_qualite_reference']].rename(
+        columns={'limite_qualite_reference': 'limite_qualite_parametre'}
     )
-).add_to(m)
+    depassement = is_mesure_en_depassement(df_mesures, df_parametres)
+    a_une_limite = parse_limite_qualite(df_results['limite_qualite_reference']).notna().any(axis=1)
+
+    statut = pd.Series('— Sans limite', index=df_results.index)
+    statut[a_une_limite] = '✅ Conforme à la limite'
+    statut[depassement] = '❌ Dépassement'
+    return statut
+
+def build_selection_layer(code_insee: str | None) -> folium.FeatureGroup:
+    """Couche dynamique ne contenant que le contour de la commune sélectionnée."""
+    selection_layer = folium.FeatureGroup(name="Sélection")
+    if code_insee:
+        selected = communes_gdf[communes_gdf["code"] == code_insee]
+        if not selected.empty:
+            folium.GeoJson(
+                selected[["code", "geometry"]],
+                style_function=lambda x: {'fillColor': '#f1c40f', 'color': '#e67e22', 'weight': 2, 'fillOpacity': 0.6}
+            ).add_to(selection_layer)
+    return selection_layer
+
+# Mode d'affichage : périmètre seul ou conformité (agrégat précalculé, sans requête par commune)
+display_mode = st.sidebar.radio("Mode d'affichage", ["Périmètre", "Conformité"])
+conformite_by_commune = None
+if display_mode == "Conformité":
+    conformite_by_commune = conformite_index
+    st.sidebar.markdown("<br>".join(
+        f"<span style='color:{color}'>■</span> {label}" for color, label in CONFORMITE_STYLES.values()
+    ), unsafe_allow_html=True)
 
-# Affichage de la carte et capture du clic
-map_data = st_folium(m, width=900, height=600)
+# Dernier clic connu (état du composant de la carte au début de cette exécution)
+previous_map_state = st.session_state.get(MAP_KEY) or {}
+previous_click = previous_map_state.get("last_active_drawing") or {}
+selected_code = str(previous_click.get("properties", {}).get("code", "")) or None
+
+# Affichage de la carte et capture du clic : seule la couche de sélection change d'une exécution à l'autre
+map_data = st_folium(
+    build_session_map(
+        build_communes_layer_json(
+            geojson_level, display_mode, get_conformite_version(conformite_by_commune), conformite_by_commune
+        ),
+        with_conformite=conformite_by_commune is not None
+    ),
+    key=MAP_KEY,
+    feature_group_to_add=build_selection_layer(selected_code),
+    returned_objects=["last_active_drawing"],
+    width=900,
+    height=600
+)
 
 # --- 3. Lecture du clic utilisateur et affichage des résultats ---
 st.divider()
@@ -82,38 +231,46 @@ if clicked_feature and "properties" in clicked_feature:
     # ⭐️ AFFICHAGE DES DERNIERS RÉSULTATS DE QUALITÉ (BIGQUERY)
     # -----------------------------------------------------
     
-    st.subheader(f"🔬 Résultats de la dernière analyse de qualité de l'eau")
+    st.subheader("🔬 Résultats de la dernière analyse de qualité de l'eau")
 
-    df_results = get_latest_results_for_commune(code_insee)
+    df_results = get_latest_results(code_insee, latest_results_index)
 
     if not df_results.empty:
         # Récupération de la date du prélèvement le plus récent
         last_date = df_results['date_prelevement'].iloc[0].strftime('%d/%m/%Y')
         st.info(f"Base de l'analyse : Résultats du prélèvement effectué le **{last_date}**.")
+
+        # Conformité bactériologique : conclusion du prélèvement, identique pour tous ses paramètres
+        conformite_bact = df_results['conformite_bact_prelevement'].iloc[0]
+        conformite_bact_label = (
+            '✅ Conforme' if conformite_bact in ('A', 'C')
+            else ('❌ Non conforme' if conformite_bact in ('B', 'N') else '⚠️ Non renseignée')
+        )
+        st.caption(f"Conformité bactériologique du prélèvement : {conformite_bact_label}")
+        conclusion = df_results['conclusion_conformite_prelevement'].iloc[0]
+        if isinstance(conclusion, str) and conclusion.strip():
+            st.caption(f"Conclusion sanitaire : {conclusion}")
+
+        # Statut de chaque paramètre par rapport à sa propre limite de qualité
+        df_results['Statut du paramètre'] = get_parametre_statut(df_results)
         
         # Préparation du DataFrame pour l'affichage
         df_results = df_results.rename(columns={
             'libelle_parametre': 'Paramètre',
             'resultat_analyse': 'Résultat',
             'libelle_unite': 'Unité',
-            'limite_qualite_reference': 'Limite de Qualité (Référence)',
-            'conclusion_conformite': 'Conformité'
+            'limite_qualite_reference': 'Limite de Qualité (Référence)'
         })
 
         # Mise en forme : combinaison valeur + unité
         df_results['Résultat (Unité)'] = df_results['Résultat'].astype(str) + ' ' + df_results['Unité'].fillna('')
         
-        # Mise en valeur de la conformité
-        df_results['Conformité'] = df_results['Conformité'].apply(
-            lambda x: '✅ Conforme' if x == 'A' else ('❌ Non Conforme' if x == 'B' else '⚠️ NC/Donnée')
-        )
-        
         # Sélection des colonnes finales
         df_display_results = df_results[[
             'Paramètre',
             'Résultat (Unité)',
             'Limite de Qualité (Référence)',
-            'Conformité'
+            'Statut du paramètre'
         ]].set_index('Paramètre')
         
         st.dataframe(df_display_results, use_container_width=True)
@@ -0,0 +1,112 @@
+# pages/2_Recherche.py
+
+import streamlit as st
+import pandas as pd
+
+# ⭐️ Importation des fonctions de recherche spatiale et de chargement des résultats
+from src.utils.data_loader import (
+    CommunesIndexUnavailableError,
+    find_commune_for_point,
+    find_communes_for_points,
+    geocode_address,
+    load_address_lookup,
+    load_latest_results_for_all_communes,
+    get_latest_results,
+    ADDRESS_LOOKUP_PATH
+)
+
+# =================================================================
+#                     APPLICATION STREAMLIT (UI ONLY)
+# =================================================================
+
+st.title("🔎 Qu'y a-t-il dans l'eau de mon robinet ?")
+st.markdown("Retrouvez la commune de la MEL desservant une adresse ou des coordonnées, et sa dernière analyse.")
+
+latest_results_index = load_latest_results_for_all_communes()
+
+def show_commune_results(commune: dict):
+    """Affiche la commune trouvée et les résultats de sa dernière analyse."""
+    st.success(f"📍 Commune : **{commune['nom_commune']}** (Code INSEE : {commune['code_commune']})")
+
+    df_results = get_latest_results(commune["code_commune"], latest_results_index)
+    if df_results.empty:
+        st.warning("Aucun résultat d'analyse de qualité de l'eau trouvé pour cette commune.")
+        return
+
+    last_date = df_results['date_prelevement'].iloc[0].strftime('%d/%m/%Y')
+    st.info(f"Base de l'analyse : Résultats du prélèvement effectué le **{last_date}**.")
+    df_display_results = df_results.rename(columns={
+        'libelle_parametre': 'Paramètre',
+        'resultat_analyse': 'Résultat',
+        'libelle_unite': 'Unité',
+        'limite_qualite_reference': 'Limite de Qualité (Référence)'
+    })[['Paramètre', 'Résultat', 'Unité', 'Limite de Qualité (Référence)']].set_index('Paramètre')
+    st.dataframe(df_display_results, use_container_width=True)
+
+# Contours indisponibles : distinct d'un point hors MEL
+INDEX_UNAVAILABLE_MESSAGE = "❌ Contours des communes indisponibles pour le moment : recherche impossible, réessayez plus tard."
+
+tab_coordonnees, tab_adresse, tab_fichier = st.tabs(["📐 Coordonnées", "🏠 Adresse", "📄 Fichier CSV"])
+
+# --- 1. Recherche par coordonnées ---
+with tab_coordonnees:
+    col_lat, col_lon = st.columns(2)
+    latitude = col_lat.number_input("Latitude", value=50.6292, format="%.6f")
+    longitude = col_lon.number_input("Longitude", value=3.0573, format="%.6f")
+
+    if st.button("Rechercher la commune", key="recherche_coordonnees"):
+        try:
+            commune = find_commune_for_point(longitude, latitude)
+        except CommunesIndexUnavailableError:
+            st.error(INDEX_UNAVAILABLE_MESSAGE)
+        else:
+            if commune is None:
+                st.warning("Ce point n'est situé dans aucune commune de la MEL.")
+            else:
+                show_commune_results(commune)
+
+# --- 2. Recherche par adresse (géocodage local) ---
+with tab_adresse:
+    if load_address_lookup() is None:
+        st.info(f"Fichier de géocodage local introuvable ({ADDRESS_LOOKUP_PATH}). Recherche par adresse indisponible.")
+    else:
+        address = st.text_input("Adresse", placeholder="ex : 1 place de la République Lille")
+        if address:
+            geocoded = geocode_address(address)
+            if geocoded is None:
+                st.warning("Adresse introuvable dans le fichier de géocodage.")
+            else:
+                st.caption(f"Adresse retenue : {geocoded['adresse']} ({geocoded['latitude']:.5f}, {geocoded['longitude']:.5f})")
+                try:
+                    commune = find_commune_for_point(geocoded["longitude"], geocoded["latitude"])
+                except CommunesIndexUnavailableError:
+                    st.error(INDEX_UNAVAILABLE_MESSAGE)
+                else:
+                    if commune is None:
+                        st.warning("Cette adresse n'est située dans aucune commune de la MEL.")
+                    else:
+                        show_commune_results(commune)
+
+# --- 3. Rattachement en lot d'un fichier de points ---
+with tab_fichier:
+    uploaded_file = st.file_uploader("Fichier CSV avec des colonnes 'longitude' et 'latitude'", type="csv")
+    if uploaded_file is not None:
+        df_points = pd.read_csv(uploaded_file)
+        if not {"longitude", "latitude"}.issubset(df_points.columns):
+            st.error("❌ Le fichier doit contenir les colonnes 'longitude' et 'latitude'.")
+        else:
+            try:
+                df_communes = find_communes_for_points(df_points["longitude"], df_points["latitude"])
+            except CommunesIndexUnavailableError:
+                st.error(INDEX_UNAVAILABLE_MESSAGE)
+            else:
+                df_points = pd.concat([df_points.reset_index(drop=True), df_communes], axis=1)
+
+                st.success(f"✅ {df_communes['code_commune'].notna().sum()} points sur {len(df_points)} rattachés à une commune de la MEL.")
+                st.dataframe(df_points, use_container_width=True)
+                st.download_button(
+                    "Télécharger le résultat",
+                    df_points.to_csv(index=False).encode("utf-8"),
+                    file_name="points_communes_mel.csv",
+                    mime="text/csv"
+                )
@@ -0,0 +1,89 @@
+# pages/3_Historique.py
+
+import streamlit as st
+import altair as alt
+
+# ⭐️ Importation des fonctions de chargement (agrégation côté BigQuery)
+from src.utils.data_loader import (
+    load_mel_communes_gdf,
+    get_parametres_for_commune,
+    choose_time_bucket,
+    get_timeseries,
+    TIMESERIES_BUCKETS
+)
+
+# =================================================================
+#                     APPLICATION STREAMLIT (UI ONLY)
+# =================================================================
+
+st.title("📈 Historique des analyses par commune")
+
+BUCKET_LABELS = {"DAY": "Jour", "WEEK": "Semaine", "MONTH": "Mois", "QUARTER": "Trimestre", "YEAR": "Année"}
+
+# --- 1. Choix de la commune ---
+communes_gdf = load_mel_communes_gdf()
+if communes_gdf is None:
+    st.stop()
+
+communes = communes_gdf[["code", "nom"]].sort_values("nom")
+code_insee = st.selectbox(
+    "Commune",
+    communes["code"].tolist(),
+    format_func=lambda code: f"{communes.loc[communes['code'] == code, 'nom'].iloc[0]} ({code})"
+)
+
+# --- 2. Choix du paramètre ---
+df_parametres = get_parametres_for_commune(code_insee)
+if df_parametres.empty:
+    st.warning("Aucun résultat numérique disponible pour cette commune.")
+    st.stop()
+
+parametre = st.selectbox(
+    "Paramètre",
+    df_parametres.to_dict(orient="records"),
+    format_func=lambda p: f"{p['libelle_parametre']} ({p['nb_mesures']} mesures)"
+)
+
+# --- 3. Granularité : automatique selon l'étendue de l'historique, modifiable vers plus grossier ---
+# Les granularités plus fines que auto_bucket dépasseraient TIMESERIES_MAX_POINTS : elles ne sont pas proposées
+auto_bucket = choose_time_bucket(parametre["date_min"], parametre["date_max"])
+bucket_options = list(TIMESERIES_BUCKETS)[list(TIMESERIES_BUCKETS).index(auto_bucket):]
+if len(bucket_options) > 1:
+    bucket = st.select_slider(
+        "Agrégation par période",
+        options=bucket_options,
+        value=auto_bucket,
+        format_func=BUCKET_LABELS.get
+    )
+else:
+    bucket = auto_bucket
+    st.caption(f"Agrégation par période : {BUCKET_LABELS[bucket].lower()}.")
+
+# --- 4. Série agrégée et graphique ---
+df_serie = get_timeseries(code_insee, parametre["code_parametre"], bucket)
+if df_serie.empty:
+    st.warning("Aucune mesure à afficher pour ce paramètre.")
+    st.stop()
+
+unite = parametre.get("libelle_unite") or ""
+st.caption(
+    f"{len(df_serie)} périodes ({BUCKET_LABELS[bucket].lower()}) agrégeant "
+    f"{int(df_serie['nb_mesures'].sum())} mesures. Bande : min/max par période ; ligne : moyenne."
+)
+
+base = alt.Chart(df_serie).encode(x=alt.X("periode:T", title="Période"))
+bande = base.mark_area(opacity=0.25).encode(
+    y=alt.Y("valeur_min:Q", title=f"{parametre['libelle_parametre']} {unite}".strip()),
+    y2="valeur_max:Q"
+)
+ligne = base.mark_line(point=len(df_serie) <= 60).encode(
+    y="valeur_moyenne:Q",
+    tooltip=[
+        alt.Tooltip("periode:T", title="Période"),
+        alt.Tooltip("valeur_min:Q", title="Min"),
+        alt.Tooltip("valeur_moyenne:Q", title="Moyenne", format=".3f"),
+        alt.Tooltip("valeur_max:Q", title="Max"),
+        alt.Tooltip("nb_mesures:Q", title="Mesures")
+    ]
+)
+st.altair_chart(bande + ligne, use_container_width=True)
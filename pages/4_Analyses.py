@@ -0,0 +1,126 @@
+# pages/4_Analyses.py
+
+import streamlit as st
+import altair as alt
+import pandas as pd
+
+# ⭐️ Importation des fonctions de chargement (cube précalculé paramètres x communes x mois)
+from src.utils.data_loader import (
+    load_mel_communes_gdf,
+    load_cube_analyses
+)
+
+# =================================================================
+#                     APPLICATION STREAMLIT (UI ONLY)
+# =================================================================
+
+st.title("🔬 Paramètres fréquents et non-conformités")
+
+PERIODES = {"12 derniers mois": 12, "3 dernières années": 36, "5 dernières années": 60, "Tout l'historique": None}
+TOP_N = 15
+
+# --- 1. Filtres : période et commune ---
+communes_gdf = load_mel_communes_gdf()
+noms_communes = {} if communes_gdf is None else dict(zip(communes_gdf["code"], communes_gdf["nom"]))
+
+periode = st.sidebar.selectbox("Période", list(PERIODES))
+code_commune = st.sidebar.selectbox(
+    "Commune",
+    [""] + sorted(noms_communes, key=noms_communes.get),
+    format_func=lambda code: "Toutes les communes" if not code else f"{noms_communes[code]} ({code})"
+)
+
+# Premier mois de la période (le cube est agrégé par mois)
+nb_mois = PERIODES[periode]
+mois_courant = pd.Timestamp.now(tz="UTC").normalize().replace(day=1)
+mois_debut = mois_courant - pd.DateOffset(months=nb_mois - 1) if nb_mois else pd.Timestamp("1990-01-01", tz="UTC")
+
+# --- 2. Lecture du cube (trois agrégats interrogés en parallèle) ---
+analyses = load_cube_analyses(mois_debut.to_pydatetime(), code_commune)
+df_parametres = analyses.get("parametres", pd.DataFrame())
+if df_parametres.empty:
+    st.warning("Aucune mesure disponible pour cette sélection.")
+    st.stop()
+
+nb_mesures = int(df_parametres["nb_mesures"].sum())
+nb_depassements = int(df_parametres["nb_depassements"].sum())
+col1, col2, col3 = st.columns(3)
+col1.metric("Mesures", f"{nb_mesures:,}".replace(",", " "))
+col2.metric("Paramètres mesurés", len(df_parametres))
+col3.metric("Dépassements de limite", f"{nb_depassements:,}".replace(",", " "),
+            help="Mesures dont le résultat sort de la limite de qualité du paramètre.")
+
+# --- 3. Paramètres les plus fréquemment mesurés ---
+st.subheader(f"Les {TOP_N} paramètres les plus mesurés")
+df_frequents = df_parametres.nlargest(TOP_N, "nb_mesures")
+st.altair_chart(
+    alt.Chart(df_frequents).mark_bar().encode(
+        x=alt.X("nb_mesures:Q", title="Mesures"),
+        y=alt.Y("libelle_parametre:N", sort="-x", title=None),
+        tooltip=[
+            alt.Tooltip("libelle_parametre:N", title="Paramètre"),
+            alt.Tooltip("nb_mesures:Q", title="Mesures"),
+            alt.Tooltip("valeur_moyenne:Q", title="Moyenne", format=".3f"),
+            alt.Tooltip("libelle_unite:N", title="Unité")
+        ]
+    ),
+    use_container_width=True
+)
+
+# --- 4. Paramètres en dépassement ---
+st.subheader("Paramètres en dépassement de la limite de qualité")
+df_depassements = df_parametres[df_parametres["nb_depassements"] > 0].copy()
+if df_depassements.empty:
+    st.success("✅ Aucun dépassement de limite de qualité sur la période.")
+else:
+    df_depassements["taux_depassement"] = df_depassements["nb_depassements"] / df_depassements["nb_mesures"]
+    st.dataframe(
+        df_depassements.sort_values("nb_depassements", ascending=False)[
+            ["libelle_parametre", "nb_depassements", "nb_mesures", "taux_depassement",
+             "valeur_min", "valeur_moyenne", "valeur_max", "libelle_unite"]
+        ],
+        column_config={
+            "libelle_parametre": "Paramètre",
+            "nb_depassements": "Dépassements",
+            "nb_mesures": "Mesures",
+            "taux_depassement": st.column_config.NumberColumn("Taux", format="percent"),
+            "valeur_min": "Min",
+            "valeur_moyenne": st.column_config.NumberColumn("Moyenne", format="%.3f"),
+            "valeur_max": "Max",
+            "libelle_unite": "Unité"
+        },
+        hide_index=True,
+        use_container_width=True
+    )
+
+# --- 5. Évolution mensuelle ---
+df_mois = analyses.get("mois", pd.DataFrame())
+if not df_mois.empty:
+    st.subheader("Évolution mensuelle")
+    base = alt.Chart(df_mois).encode(x=alt.X("mois:T", title="Mois"))
+    st.altair_chart(
+        alt.layer(
+            base.mark_bar(opacity=0.3).encode(y=alt.Y("nb_mesures:Q", title="Mesures")),
+            base.mark_line(color="#e74c3c").encode(y=alt.Y("nb_depassements:Q", title="Dépassements"))
+        ).resolve_scale(y="independent"),
+        use_container_width=True
+    )
+
+# --- 6. Communes (vue toutes communes uniquement) ---
+df_communes = analyses.get("communes", pd.DataFrame())
+if not code_commune and not df_communes.empty:
+    st.subheader("Communes les plus concernées")
+    df_communes["nom_commune"] = df_communes["code_commune"].map(noms_communes).fillna(df_communes["code_commune"])
+    st.dataframe(
+        df_communes.sort_values("nb_depassements", ascending=False).head(TOP_N)[
+            ["nom_commune", "nb_depassements", "nb_prelevements_non_conformes", "nb_mesures"]
+        ],
+        column_config={
+            "nom_commune": "Commune",
+            "nb_depassements": "Dépassements",
+            "nb_prelevements_non_conformes": "Mesures de prélèvements non conformes",
+            "nb_mesures": "Mesures"
+        },
+        hide_index=True,
+        use_container_width=True
+    )
@@ -4,16 +4,21 @@ import requests
 import json
 import os
 import sys
+import io
 from datetime import datetime
-from google.cloud import storage 
 import pandas as pd
 from typing import Dict, Any, List
 from config import GCS_BUCKET_NAME 
+from src.pipeline.territories import get_raw_folder
+from src.pipeline.metrics import record_metric, step
+from src.utils.storage import get_storage
 import time
 
 # URL du point de terminaison pour les résultats d'analyse
 BASE_URL = "https://hubeau.eaufrance.fr/api/v1/qualite_eau_potable/"
 ENDPOINT = "resultats_dis"
+# Pause entre deux pages (courtoisie envers l'API ; 0 pour les benchmarks sur le serveur local)
+PAGE_DELAY_S = float(os.getenv("HUBEAU_PAGE_DELAY_S", "1"))
 
 # ----------------------------------------------------------------------
 # Fonction d'Extraction (Pagination)
@@ -37,6 +42,9 @@ def get_data_from_endpoint_paginated(params: Dict[str, Any] = {}) -> List[Dict[s
             response = requests.get(url, params=current_params)
             response.raise_for_status() # Lève une exception si le statut est une erreur (4xx ou 5xx)
 
+            record_metric('api_pages', 1, endpoint=ENDPOINT)
+            record_metric('bytes_read', len(response.content), endpoint=ENDPOINT)
+
             data = response.json()
             results = data.get('data', [])
             total_count = data.get('count', 0)
@@ -51,7 +59,7 @@ def get_data_from_endpoint_paginated(params: Dict[str, Any] = {}) -> List[Dict[s
 
             page += 1
 
-            time.sleep(1)
+            time.sleep(PAGE_DELAY_S)
 
         except requests.exceptions.RequestException as e:
             print(f"Erreur lors de la requête vers {url}: {e}")
@@ -63,35 +71,42 @@ def get_data_from_endpoint_paginated(params: Dict[str, Any] = {}) -> List[Dict[s
 # Fonction d'Orchestration (Sauvegarde sur GCS)
 # ----------------------------------------------------------------------
 
-def main():
+def main(code_departement: str = "59"):
     if GCS_BUCKET_NAME == "YOUR_DEFAULT_BUCKET_NAME_HERE":
         print("❌ Erreur: Veuillez configurer GCS_BUCKET_NAME dans config.py ou dans vos variables d'environnement.")
         sys.exit(1)
 
-    # Paramètres spécifiques pour le département 59
-    params = {"code_departement": "59"}
+    # Paramètres spécifiques au département (extraction partagée par tous les territoires qui le couvrent)
+    params = {"code_departement": code_departement}
 
-    print("Début du processus de récupération des résultats de qualité de l'eau pour le Nord (59).")
-    data = get_data_from_endpoint_paginated(params)
+    print(f"Début du processus de récupération des résultats de qualité de l'eau pour le département {code_departement}.")
+    with step('api_fetch'):
+        data = get_data_from_endpoint_paginated(params)
 
     if data:
         df = pd.DataFrame(data)
+        record_metric('rows_out', len(df), table='qualite_eau', departement=code_departement)
 
         # Définition du chemin GCS pour le stockage du RAW Data
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        # Chemin GCS : gs://VOTRE_BUCKET/raw/qualite_eau_YYYYMMDD_HHMMSS.parquet
-        gcs_path = f"gs://{GCS_BUCKET_NAME}/raw/qualite_eau_{timestamp}.parquet"
+        # Chemin GCS : gs://VOTRE_BUCKET/raw/<département>/qualite_eau_YYYYMMDD_HHMMSS.parquet
+        gcs_object_name = f"{get_raw_folder(code_departement)}/qualite_eau_{timestamp}.parquet"
+        gcs_path = f"gs://{GCS_BUCKET_NAME}/{gcs_object_name}"
 
         print(f"\n🔄 Sauvegarde du DataFrame ({len(df)} lignes) vers GCS : {gcs_path}")
 
-        # Sauvegarde en Parquet sur GCS (Pandas utilise 'gcsfs' automatiquement pour gs://)
+        # Sauvegarde en Parquet sur GCS via la couche de stockage
         try:
-            df.to_parquet(gcs_path, index=False, engine='pyarrow', compression='snappy')
+            buffer = io.BytesIO()
+            df.to_parquet(buffer, index=False, engine='pyarrow', compression='snappy')
+            with step('gcs_write'):
+                get_storage(GCS_BUCKET_NAME).write_bytes(gcs_object_name, buffer.getvalue())
+            record_metric('bytes_written', buffer.tell(), object=gcs_object_name)
             print(f"✅ Données de qualité sauvegardées dans GCS : {gcs_path}")
             print(f"Total des enregistrements sauvegardés : {len(df)}\n")
 
         except Exception as e:
-            print(f"❌ Erreur lors de la sauvegarde GCS. Vérifiez vos permissions et la configuration PyArrow/gcsfs.")
+            print(f"❌ Erreur lors de la sauvegarde GCS. Vérifiez vos permissions et la configuration PyArrow.")
             print(f"Détails de l'erreur : {e}")
             sys.exit(1)
     else:
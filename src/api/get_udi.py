@@ -3,20 +3,23 @@
 import requests
 import os
 import sys
-import tempfile # Nécessaire pour le contournement GCSFS
+import io
 from datetime import datetime
 import pandas as pd
 from typing import Dict, Any, List
 import time
 
-# Imports Cloud essentiels
-from google.cloud import storage 
 from config import GCS_BUCKET_NAME 
+from src.pipeline.territories import get_raw_folder
+from src.pipeline.metrics import record_metric, step
+from src.utils.storage import get_storage
 
 
 # URL de base de l'API Hubeau
 BASE_URL = "https://hubeau.eaufrance.fr/api/v1/qualite_eau_potable/"
 ENDPOINT = "communes_udi"
+# Pause entre deux pages (courtoisie envers l'API ; 0 pour les benchmarks sur le serveur local)
+PAGE_DELAY_S = float(os.getenv("HUBEAU_PAGE_DELAY_S", "1"))
 
 # ----------------------------------------------------------------------
 # Fonction de Pagination (Réinsérer cette fonction !)
@@ -43,6 +46,9 @@ def get_data_from_endpoint_paginated(params: dict = {}) -> list:
             response = requests.get(url, params=current_params, timeout=60)
             response.raise_for_status() 
             
+            record_metric('api_pages', 1, endpoint=ENDPOINT)
+            record_metric('bytes_read', len(response.content), endpoint=ENDPOINT)
+
             data = response.json()
             results = data.get('data', [])
             total_count = data.get('count', 0)
@@ -56,7 +62,7 @@ def get_data_from_endpoint_paginated(params: dict = {}) -> list:
             
             page += 1
 
-            time.sleep(1)
+            time.sleep(PAGE_DELAY_S)
 
         except requests.exceptions.Timeout:
             print(f"Erreur de timeout après 60 secondes pour la page {page}.")
@@ -71,7 +77,7 @@ def get_data_from_endpoint_paginated(params: dict = {}) -> list:
 # Fonction d'Orchestration (Sauvegarde par Client Natif)
 # ----------------------------------------------------------------------
 
-def main_cloud_ready():
+def main_cloud_ready(code_departement: str = "59"):
     """
     Orchestre l'extraction des UDI et les sauvegarde en Parquet sur GCS
     via le client natif Google Cloud Storage (Contournement de GCSFS).
@@ -80,45 +86,38 @@ def main_cloud_ready():
         print("❌ Échec de l'extraction : GCS_BUCKET_NAME est manquant.")
         sys.exit(1)
 
-    print("Début du processus de récupération des UDI du département du Nord (59).")
-    params = {"code_departement": "59"}
+    print(f"Début du processus de récupération des UDI du département {code_departement}.")
+    params = {"code_departement": code_departement}
     # L'erreur se produit à la ligne suivante:
-    data = get_data_from_endpoint_paginated(params) 
+    with step('api_fetch'):
+        data = get_data_from_endpoint_paginated(params) 
     
     if not data:
         print("❌ Aucune donnée n'a été récupérée. L'extraction s'arrête.")
         sys.exit(1)
 
     df = pd.DataFrame(data)
+    record_metric('rows_out', len(df), table='udi', departement=code_departement)
     
     # 1. Préparation des chemins
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    gcs_object_name = f"raw/udi_mel_{timestamp}.parquet"
+    gcs_object_name = f"{get_raw_folder(code_departement)}/udi_{timestamp}.parquet"
     
-    # --- CONTOURNEMENT DE GCSFS ---
     try:
-        # Créer un fichier temporaire sur le runner GHA
-        with tempfile.TemporaryDirectory() as tmpdir:
-            temp_local_path = os.path.join(tmpdir, "udi_temp.parquet")
-            
-            # Sauvegarde locale du DataFrame en Parquet
-            print(f"\n🔄 Sauvegarde temporaire locale de {len(df)} lignes vers {temp_local_path}")
-            df.to_parquet(temp_local_path, index=False, engine='pyarrow', compression='snappy')
-            
-            # Utilisation du client GCS natif (plus stable)
-            print(f"🔄 Début de l'envoi vers gs://{GCS_BUCKET_NAME}/{gcs_object_name}")
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(GCS_BUCKET_NAME)
-            blob = bucket.blob(gcs_object_name)
-            
-            # Uploader le fichier temporaire
-            blob.upload_from_filename(temp_local_path)
-            
-            print(f"✅ Données UDI sauvegardées dans GCS : {gcs_object_name}")
-            print(f"Total des enregistrements sauvegardés : {len(df)}\n")
+        # Sérialisation en mémoire puis envoi via la couche de stockage (GCS ou local)
+        buffer = io.BytesIO()
+        df.to_parquet(buffer, index=False, engine='pyarrow', compression='snappy')
+
+        print(f"🔄 Début de l'envoi vers gs://{GCS_BUCKET_NAME}/{gcs_object_name}")
+        with step('gcs_write'):
+            get_storage(GCS_BUCKET_NAME).write_bytes(gcs_object_name, buffer.getvalue())
+        record_metric('bytes_written', buffer.tell(), object=gcs_object_name)
+
+        print(f"✅ Données UDI sauvegardées dans GCS : {gcs_object_name}")
+        print(f"Total des enregistrements sauvegardés : {len(df)}\n")
 
     except Exception as e:
-        print(f"❌ Erreur CRITIQUE lors de la sauvegarde GCS par client natif.")
+        print(f"❌ Erreur CRITIQUE lors de la sauvegarde GCS.")
         print(f"Détails de l'erreur : {e}")
         sys.exit(1)
 
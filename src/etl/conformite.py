@@ -0,0 +1,82 @@
+# src/etl/conformite.py
+
+import pandas as pd
+
+# =================================================================
+# RÈGLES DE NON-CONFORMITÉ
+# =================================================================
+# Règles partagées par les tables de service (SQL) et le moteur d'alertes (pandas) :
+# un prélèvement est non conforme si sa conclusion le mentionne ou si les limites
+# bactériologiques ne sont pas respectées ; une mesure est en dépassement si son
+# résultat numérique sort de la limite de qualité du paramètre.
+
+# Expression SQL (BigQuery / DuckDB) de la non-conformité d'un prélèvement
+NON_CONFORMITE_SQL = (
+    "(LOWER(COALESCE(conclusion_conformite_prelevement, '')) LIKE '%non%conforme%' "
+    "OR conformite_limites_bact_prelevement = 'N')"
+)
+
+# Équivalent de LIKE '%non%conforme%' sur la conclusion mise en minuscules
+NON_CONFORME_PATTERN = r"non.*conforme"
+
+# Nombre décimal d'une limite de qualité ("50", "0,1", "6.5")
+_NUMBER_PATTERN = r"(-?\d+(?:[.,]\d+)?)"
+
+# ----------------------------------------------------------------------
+# Prélèvements
+# ----------------------------------------------------------------------
+
+def is_prelevement_non_conforme(df_prelevements: pd.DataFrame) -> pd.Series:
+    """Masque des prélèvements non conformes (même règle que NON_CONFORMITE_SQL)."""
+    conclusion = df_prelevements['conclusion_conformite_prelevement'].fillna("").str.lower()
+    return (
+        conclusion.str.contains(NON_CONFORME_PATTERN, regex=True)
+        | (df_prelevements['conformite_limites_bact_prelevement'] == 'N')
+    )
+
+# ----------------------------------------------------------------------
+# Limites de qualité des paramètres
+# ----------------------------------------------------------------------
+
+def _extract_bound(limites: pd.Series, pattern: str) -> pd.Series:
+    values = limites.str.extract(pattern, expand=False)
+    return pd.to_numeric(values.str.replace(",", ".", regex=False), errors='coerce')
+
+def parse_limite_qualite(limites: pd.Series) -> pd.DataFrame:
+    """
+    Décompose les libellés de limite de qualité de Hubeau ("<=50 mg/L", ">=6,5 et <=9 unité pH",
+    "0 n/(100mL)") en bornes numériques `limite_min` / `limite_max` (NaN si absente).
+    Une valeur sans opérateur est une borne maximale.
+    """
+    limites = limites.astype("string")
+    limite_max = _extract_bound(limites, rf"(?:<=|<|≤)\s*{_NUMBER_PATTERN}")
+    limite_min = _extract_bound(limites, rf"(?:>=|>|≥)\s*{_NUMBER_PATTERN}")
+    sans_operateur = limite_max.isna() & limite_min.isna()
+    limite_max = limite_max.where(~sans_operateur, _extract_bound(limites, rf"^\s*{_NUMBER_PATTERN}"))
+    return pd.DataFrame({'limite_min': limite_min, 'limite_max': limite_max}, index=limites.index)
+
+def is_mesure_en_depassement(df_mesures: pd.DataFrame, df_parametres: pd.DataFrame) -> pd.Series:
+    """
+    Masque des mesures dont le résultat numérique sort de la limite de qualité du paramètre.
+    Les résultats inférieurs au seuil de quantification ("<LQ", résultat numérique à 0)
+    ne sont pas comparés à une borne minimale.
+    """
+    df_limites = parse_limite_qualite(df_parametres['limite_qualite_parametre'])
+    df_limites.index = df_parametres['code_parametre']
+    df_limites = df_limites[~df_limites.index.duplicated()]
+
+    limite_min = df_mesures['code_parametre'].map(df_limites['limite_min'])
+    limite_max = df_mesures['code_parametre'].map(df_limites['limite_max'])
+    valeur = df_mesures['resultat_numerique']
+    sous_seuil = df_mesures['resultat_alphanumerique'].fillna("").astype(str).str.startswith("<")
+    return (valeur > limite_max) | ((valeur < limite_min) & ~sous_seuil)
+
+def find_depassements(df_mesures: pd.DataFrame, df_parametres: pd.DataFrame) -> pd.DataFrame:
+    """
+    Retourne les mesures en dépassement, enrichies du libellé, de l'unité et de la limite
+    de qualité du paramètre.
+    """
+    params_cols = ['code_parametre', 'libelle_parametre', 'libelle_unite', 'limite_qualite_parametre']
+    df_depassements = df_mesures[is_mesure_en_depassement(df_mesures, df_parametres)]
+    df_params = df_parametres[params_cols].drop_duplicates(subset=['code_parametre'])
+    return df_depassements.merge(df_params, on='code_parametre', how='left').reset_index(drop=True)
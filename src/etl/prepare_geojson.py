@@ -1,9 +1,17 @@
 import os
+import io
 import json
+from contextlib import ExitStack
+import ijson
+import numpy as np
 import pandas as pd
-from google.cloud import storage, bigquery
+import geopandas as gpd
+import shapely
+from shapely.geometry import shape, mapping
 import pandas_gbq
 
+from src.utils.storage import get_storage
+
 # =================================================================
 #                         CONFIGURATION
 # =================================================================
@@ -14,6 +22,24 @@ GEOJSON_SOURCE_OBJECT = "Geojson/communes-5m.geojson"
 BIGQUERY_TABLE_COMMUNES = "qualite-eau-473812.eau_potable_mel.communes_reseau"
 GEOJSON_DEST_OBJECT = "Geojson/communes_filtrees.geojson"
 
+# Variantes simplifiées des contours pour l'application : tolérance de simplification en degrés (WGS84)
+# ~0.0002° ≈ 15 m, ~0.0008° ≈ 60 m, ~0.002° ≈ 150 m à la latitude de Lille
+SIMPLIFICATION_LEVELS = {
+    "fin": 0.0002,
+    "moyen": 0.0008,
+    "grossier": 0.002,
+}
+# Nombre de décimales conservées pour les coordonnées des variantes (5 décimales ≈ 1 m)
+COORDINATE_PRECISION = 5
+
+def get_simplified_object_name(level):
+    """Nom de l'objet GCS de la variante simplifiée d'un niveau donné."""
+    return GEOJSON_DEST_OBJECT.replace(".geojson", f"_{level}.geojson")
+
+def get_geoparquet_object_name(geojson_object_name):
+    """Nom de l'objet GCS GeoParquet publié à côté d'un GeoJSON."""
+    return geojson_object_name.replace(".geojson", ".parquet")
+
 # =================================================================
 #                         FONCTIONS CORE OPTIMISÉES
 # =================================================================
@@ -31,26 +57,72 @@ def load_codes_from_bigquery(table_id):
         print(f"ERREUR: Échec de la lecture BigQuery: {e}")
         return None
 
-def load_geojson_from_gcs(bucket_name, object_name):
-    """Charge le fichier GeoJSON brut depuis GCS (utilise l'authentification par défaut)."""
-    print(f"-> Chargement du GeoJSON brut depuis GCS: {object_name}")
+def stream_filter_geojson_from_gcs(bucket_name, object_name, code_sets, output_objects=None):
+    """
+    Filtre le GeoJSON brut depuis GCS en flux, feature par feature (ijson), sans jamais
+    charger le fichier national complet en mémoire.
+    `code_sets` associe un nom de territoire à l'ensemble de ses codes communes : un seul
+    passage sur le fichier source suffit pour découper les contours de plusieurs territoires.
+    Si `output_objects` est fourni ({territoire: objet GCS}), les features retenues y sont
+    écrites au fil de l'eau. Retourne {territoire: liste des features retenues}.
+    """
+    print(f"-> Filtrage en flux du GeoJSON brut depuis GCS: {object_name}")
+    output_objects = output_objects or {}
+    filtered_features = {territory: [] for territory in code_sets}
+
     try:
-        storage_client = storage.Client(project=GCP_PROJECT_ID)
-        blob = storage_client.bucket(bucket_name).blob(object_name)
-        geojson_data_string = blob.download_as_text()
-        return json.loads(geojson_data_string)
+        storage = get_storage(bucket_name)
+
+        # Un flux d'écriture n'est ouvert qu'à la première feature retenue (un territoire sans
+        # feature ne publie rien) ; une exception en cours de lecture annule tous les envois
+        # en cours (sortie du ExitStack) : les objets existants restent intacts.
+        with ExitStack() as stack:
+            writers = {}
+            features_count = 0
+            # Le fichier national est lu depuis le cache disque local s'il n'a pas changé sur GCS
+            source = stack.enter_context(storage.open(object_name, 'rb'))
+            for feature in ijson.items(source, 'features.item', use_float=True):
+                features_count += 1
+                code = str(feature.get('properties', {}).get('code', ''))
+                for territory, codes in code_sets.items():
+                    if code not in codes:
+                        continue
+                    if territory in output_objects:
+                        if territory not in writers:
+                            writers[territory] = stack.enter_context(
+                                storage.open(output_objects[territory], 'w', content_type='application/json')
+                            )
+                            writers[territory].write('{"type": "FeatureCollection", "features": [')
+                        separator = ", " if filtered_features[territory] else ""
+                        writers[territory].write(separator + json.dumps(feature))
+                    filtered_features[territory].append(feature)
+
+            print(f"-> Filtrage terminé sur {features_count} features.")
+
+            for territory, writer in writers.items():
+                writer.write(']}')
+            # Les envois sont finalisés à la sortie du bloc, sans erreur
+
+        for territory, output_object in output_objects.items():
+            if filtered_features[territory]:
+                print(f"-> {len(filtered_features[territory])} features enregistrées vers GCS: {output_object}")
+            else:
+                print(f"AVERTISSEMENT: Aucune feature pour '{territory}', {output_object} n'est pas mis à jour.")
+
+        return filtered_features
     except Exception as e:
-        print(f"ERREUR: Échec du chargement GeoJSON GCS: {e}")
+        print(f"ERREUR: Échec du filtrage GeoJSON GCS: {e}")
         return None
 
-def save_geojson_to_gcs(geojson_data, bucket_name, object_name):
+def save_geojson_to_gcs(geojson_data, bucket_name, object_name, compact=False):
     """Enregistre le fichier GeoJSON filtré sur GCS (utilise l'authentification par défaut)."""
     print(f"-> Enregistrement du GeoJSON filtré vers GCS: {object_name}")
     try:
-        storage_client = storage.Client(project=GCP_PROJECT_ID)
-        blob = storage_client.bucket(bucket_name).blob(object_name)
-        blob.upload_from_string(
-            data=json.dumps(geojson_data),
+        # Encodage compact (sans espaces) pour les variantes destinées au navigateur
+        separators = (',', ':') if compact else None
+        get_storage(bucket_name).write_bytes(
+            object_name,
+            json.dumps(geojson_data, separators=separators).encode('utf-8'),
             content_type='application/json'
         )
         print("-> ENREGISTREMENT TERMINÉ avec succès.")
@@ -59,6 +131,60 @@ def save_geojson_to_gcs(geojson_data, bucket_name, object_name):
         print(f"ERREUR: Échec de l'enregistrement GeoJSON GCS: {e}")
         return False
 
+def save_geoparquet_to_gcs(features, bucket_name, object_name):
+    """
+    Enregistre les communes au format GeoParquet (géométrie WKB, attributs en colonnes) :
+    binaire et colonnaire, il se relit bien plus vite et avec moins de mémoire que le GeoJSON.
+    """
+    print(f"-> Enregistrement du GeoParquet vers GCS: {object_name}")
+    try:
+        gdf = gpd.GeoDataFrame.from_features(features, crs="EPSG:4326")
+        buffer = io.BytesIO()
+        gdf.to_parquet(buffer, index=False, compression='zstd')
+
+        get_storage(bucket_name).write_bytes(object_name, buffer.getvalue())
+        print("-> ENREGISTREMENT TERMINÉ avec succès.")
+        return True
+    except Exception as e:
+        print(f"ERREUR: Échec de l'enregistrement GeoParquet GCS: {e}")
+        return False
+
+def simplify_features(features, tolerance, precision=COORDINATE_PRECISION):
+    """
+    Simplifie les contours des communes en préservant la topologie de l'ensemble :
+    les frontières communes à deux communes sont simplifiées une seule fois (coverage_simplify),
+    ce qui évite les trous ou chevauchements entre communes voisines.
+    Les coordonnées sont ensuite arrondies à `precision` décimales ; les sommets partagés
+    restant identiques, l'arrondi ne crée pas non plus d'interstices.
+    """
+    geometries = np.array([shape(feature['geometry']) for feature in features])
+
+    if hasattr(shapely, "coverage_simplify"):
+        simplified = shapely.coverage_simplify(geometries, tolerance)
+    else:
+        # shapely < 2.1 : simplification géométrie par géométrie (frontières non garanties)
+        print("AVERTISSEMENT: shapely.coverage_simplify indisponible (shapely < 2.1), simplification non topologique.")
+        simplified = shapely.simplify(geometries, tolerance, preserve_topology=True)
+
+    quantized = shapely.transform(simplified, lambda coords: np.round(coords, precision))
+
+    return [
+        {"type": "Feature", "properties": feature.get('properties', {}), "geometry": mapping(geometry)}
+        for feature, geometry in zip(features, quantized)
+    ]
+
+def save_simplified_variants(features, bucket_name):
+    """Produit et enregistre une variante simplifiée et quantifiée par niveau de SIMPLIFICATION_LEVELS."""
+    for level, tolerance in SIMPLIFICATION_LEVELS.items():
+        print(f"-> Simplification des contours (niveau '{level}', tolérance {tolerance}°)...")
+        simplified_geojson = {
+            "type": "FeatureCollection",
+            "features": simplify_features(features, tolerance)
+        }
+        object_name = get_simplified_object_name(level)
+        save_geojson_to_gcs(simplified_geojson, bucket_name, object_name, compact=True)
+        save_geoparquet_to_gcs(simplified_geojson['features'], bucket_name, get_geoparquet_object_name(object_name))
+
 # =================================================================
 #                           MAIN LOGIC
 # =================================================================
@@ -73,29 +199,28 @@ def main():
         print("Opération annulée car aucun code valide n'a été récupéré.")
         return
 
-    # 3. Chargement du GeoJSON brut
-    geojson_brut = load_geojson_from_gcs(GCS_BUCKET_NAME, GEOJSON_SOURCE_OBJECT)
-    if not geojson_brut:
+    # 3. Filtrage en flux du GeoJSON brut et enregistrement du GeoJSON filtré
+    filtered_features = stream_filter_geojson_from_gcs(
+        GCS_BUCKET_NAME,
+        GEOJSON_SOURCE_OBJECT,
+        {"mel": required_codes},
+        {"mel": GEOJSON_DEST_OBJECT}
+    )
+    if filtered_features is None:
         return
 
-    # 4. Filtrage du GeoJSON
-    print(f"-> Filtrage de {len(geojson_brut.get('features', []))} features...")
-    
-    filtered_geojson = {"type": "FeatureCollection", "features": []}
-    
-    for feature in geojson_brut.get('features', []):
-        code = feature.get('properties', {}).get('code', '')
-        if str(code) in required_codes:
-            filtered_geojson['features'].append(feature)
-
-    print(f"-> Filtrage terminé. {len(filtered_geojson['features'])} features conservées.")
+    features = filtered_features["mel"]
+    print(f"-> {len(features)} features conservées.")
     
-    if not filtered_geojson['features']:
+    if not features:
         print("AVERTISSEMENT: Le GeoJSON filtré est vide. Vérifiez les codes BigQuery.")
         return
 
-    # 5. Enregistrement du GeoJSON filtré
-    save_geojson_to_gcs(filtered_geojson, GCS_BUCKET_NAME, GEOJSON_DEST_OBJECT)
+    # 4. Enregistrement du GeoParquet
+    save_geoparquet_to_gcs(features, GCS_BUCKET_NAME, get_geoparquet_object_name(GEOJSON_DEST_OBJECT))
+
+    # 5. Variantes simplifiées et quantifiées pour l'affichage cartographique
+    save_simplified_variants(features, GCS_BUCKET_NAME)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -5,8 +5,8 @@ import os
 import sys
 # Ajout des imports pour la manipulation Cloud
 from io import BytesIO 
-import gcsfs # Assurez-vous d'avoir 'pip install gcsfs'
 from config import GCS_BUCKET_NAME 
+from src.utils.storage import get_storage
 
 # --- NOUVELLE FONCTION : Chargement dynamique des codes INSEE ---
 
@@ -14,12 +14,11 @@ def load_mel_communes_insee_from_gcs() -> list:
     """
     Charge la liste des codes INSEE de la MEL depuis le fichier CSV stocké sur GCS.
     """
-    GCS_CSV_PATH = f"gs://{GCS_BUCKET_NAME}/Geojson/base_villes_mel.csv"
-    print(f"🔄 Lecture des codes INSEE depuis GCS : {GCS_CSV_PATH}")
+    GCS_CSV_OBJECT = "Geojson/base_villes_mel.csv"
+    print(f"🔄 Lecture des codes INSEE depuis GCS : gs://{GCS_BUCKET_NAME}/{GCS_CSV_OBJECT}")
 
     try:
-        # Pandas peut lire directement le CSV depuis GCS si 'gcsfs' est installé et l'authentification est correcte
-        df_communes = pd.read_csv(GCS_CSV_PATH)
+        df_communes = pd.read_csv(BytesIO(get_storage(GCS_BUCKET_NAME).read_bytes(GCS_CSV_OBJECT)))
         
         # Récupération des codes uniques de la colonne "COMMUNE_INSEE"
         insee_codes = df_communes['COMMUNE_INSEE'].astype(str).str.zfill(5).unique().tolist()
@@ -44,37 +43,27 @@ MEL_COMMUNES_INSEE = [] # La liste sera remplie dans main()
 
 def get_latest_gcs_file(bucket_name: str, prefix: str) -> str:
     """
-    Trouve le chemin GCS complet du fichier Parquet le plus récent dans le dossier 'raw'.
+    Trouve le nom d'objet GCS du fichier Parquet le plus récent dans le dossier 'raw'.
 
     Args:
         bucket_name (str): Le nom du bucket GCS.
         prefix (str): Le préfixe du nom de fichier (ex: "udi_mel").
 
     Returns:
-        str: Le chemin complet 'gs://bucket_name/raw/filename.parquet'.
+        str: Le nom de l'objet 'raw/filename.parquet'.
     """
-    # Utiliser gcsfs pour lister les fichiers du bucket
-    fs = gcsfs.GCSFileSystem()
-    gcs_dir = f"{bucket_name}/raw/"
-    
     # Liste tous les fichiers qui correspondent au préfixe dans le dossier 'raw/'
-    gcs_files = fs.ls(gcs_dir)
+    gcs_files = [o['name'] for o in get_storage(bucket_name).list_objects(f"raw/{prefix}")]
     
-    # Filtrer les fichiers Parquet qui commencent par le préfixe
-    target_files = [
-        f for f in gcs_files 
-        if f.startswith(f"{gcs_dir}{prefix}") and f.endswith('.parquet')
-    ]
+    # Filtrer les fichiers Parquet
+    target_files = [f for f in gcs_files if f.endswith('.parquet')]
     
     if not target_files:
-        raise FileNotFoundError(f"Aucun fichier avec le préfixe '{prefix}' n'a été trouvé dans le dossier 'gs://{gcs_dir}'.")
+        raise FileNotFoundError(f"Aucun fichier avec le préfixe '{prefix}' n'a été trouvé dans le dossier 'gs://{bucket_name}/raw/'.")
         
     # Triez par nom (basé sur l'horodatage dans le nom de fichier) et prenez le plus récent
     target_files.sort(reverse=True)
-    
-    # Reconstruire le chemin GCS complet
-    latest_gcs_path = f"gs://{target_files[0]}"
-    return latest_gcs_path
+    return target_files[0]
 
 
 def main():
@@ -95,11 +84,10 @@ def main():
 
     # 1. Chargement du dernier fichier de données brutes depuis GCS
     try:
-        latest_raw_gcs_path = get_latest_gcs_file(GCS_BUCKET_NAME, "udi_mel")
-        print(f"🔄 Lecture du fichier brut le plus récent sur GCS : {latest_raw_gcs_path}")
+        latest_raw_object = get_latest_gcs_file(GCS_BUCKET_NAME, "udi_mel")
+        print(f"🔄 Lecture du fichier brut le plus récent sur GCS : gs://{GCS_BUCKET_NAME}/{latest_raw_object}")
         
-        # Pandas lit directement le fichier Parquet depuis GCS
-        raw_df = pd.read_parquet(latest_raw_gcs_path)
+        raw_df = pd.read_parquet(BytesIO(get_storage(GCS_BUCKET_NAME).read_bytes(latest_raw_object)))
         print(f"   -> Nombre total d'enregistrements bruts chargés : {len(raw_df)}")
 
     except FileNotFoundError as e:
@@ -124,13 +112,15 @@ def main():
     # 3. Sauvegarde de la liste filtrée dans GCS/processed
     
     # Le chemin de destination sur GCS
-    gcs_processed_path = f"gs://{GCS_BUCKET_NAME}/processed/communes_mel_udi.parquet"
+    gcs_processed_object = "processed/communes_mel_udi.parquet"
     
     try:
-        print(f"🔄 Sauvegarde du fichier UDI filtré vers GCS : {gcs_processed_path}")
+        print(f"🔄 Sauvegarde du fichier UDI filtré vers GCS : gs://{GCS_BUCKET_NAME}/{gcs_processed_object}")
         
         # Sauvegarde en Parquet sur GCS
-        filtered_df.to_parquet(gcs_processed_path, index=False, engine='pyarrow', compression='snappy')
+        buffer = BytesIO()
+        filtered_df.to_parquet(buffer, index=False, engine='pyarrow', compression='snappy')
+        get_storage(GCS_BUCKET_NAME).write_bytes(gcs_processed_object, buffer.getvalue())
         
         print(f"✅ Liste UDI MEL sauvegardée dans GCS/processed.")
     
@@ -1,19 +1,35 @@
 # src/etl/process_resultats_qualite.py
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import sys
-import gcsfs 
 import os
 import io
-from google.cloud import storage 
-from config import GCS_BUCKET_NAME, GCP_PROJECT_ID
+from config import GCS_BUCKET_NAME, GCP_PROJECT_ID, PROCESSED_PARQUET_PROFILE
 from typing import Dict, Any, List, Set
 from datetime import datetime
 
-CRITERE_MOA_MEL = "MEL - MÉTROPOLE EUROP. DE LILLE"
-
-# Initialisation du client GCS
-storage_client = storage.Client()
+from src.etl.conformite import is_prelevement_non_conforme, is_mesure_en_depassement
+from src.etl.validate_tables import validate_tables
+from src.pipeline.metrics import record_metric, step
+from src.utils.storage import get_storage
+from src.pipeline.territories import (
+    DEFAULT_TERRITORY,
+    get_territory,
+    get_processed_prefix,
+    get_raw_folder
+)
+
+# Ordre de tri des tables de GCS/processed : les lignes d'une même commune / d'un même
+# prélèvement sont contiguës, ce qui rend les statistiques des row groups sélectives
+PROCESSED_SORT_KEYS: Dict[str, List[str]] = {
+    'parametres': ['code_parametre'],
+    'prelevements': ['code_commune', 'date_prelevement'],
+    'resultats_mesures': ['code_prelevement', 'code_parametre'],
+    'communes_reseau': ['code_commune'],
+    'cube_parametres': ['code_parametre', 'code_commune', 'mois']
+}
 
 # ----------------------------------------------------------------------
 # Fonctions utilitaires GCS
@@ -23,77 +39,92 @@ def get_latest_gcs_path(bucket_name: str, prefix: str, folder: str = "raw") -> s
     """
     Trouve le nom d'objet GCS du fichier Parquet le plus récent.
     """
-    bucket = storage_client.bucket(bucket_name)
     prefix_path = f"{folder}/{prefix}"
     
-    blobs = list(bucket.list_blobs(prefix=prefix_path))
-    target_blobs = [blob for blob in blobs if blob.name.endswith('.parquet')]
+    objects = get_storage(bucket_name).list_objects(prefix_path)
+    target_names = [o['name'] for o in objects if o['name'].endswith('.parquet')]
     
-    if not target_blobs:
+    if not target_names:
         raise FileNotFoundError(f"Aucun fichier avec le préfixe '{prefix_path}' n'a été trouvé dans le bucket.")
         
-    target_blobs.sort(key=lambda blob: blob.name, reverse=True)
-    return target_blobs[0].name
+    return max(target_names)
 
 def read_parquet_from_gcs(bucket_name: str, object_name: str) -> pd.DataFrame:
     """
-    Lit un fichier Parquet depuis GCS en mémoire.
+    Lit un fichier Parquet depuis GCS en mémoire (servi par le cache disque local
+    si cette génération de l'objet a déjà été lue).
     """
-    bucket = storage_client.bucket(bucket_name)
-    blob = bucket.blob(object_name)
-    
-    print(f"   -> Téléchargement de gs://{bucket_name}/{object_name}")
-    blob_bytes = blob.download_as_bytes()
+    print(f"   -> Lecture de gs://{bucket_name}/{object_name}")
+    blob_bytes = get_storage(bucket_name).read_bytes(object_name)
+    record_metric('bytes_read', len(blob_bytes), object=object_name)
     
-    return pd.read_parquet(io.BytesIO(blob_bytes))
+    df = pd.read_parquet(io.BytesIO(blob_bytes))
+    record_metric('rows_in', len(df), object=object_name)
+    return df
 
-def save_df_to_gcs(df: pd.DataFrame, bucket_name: str, table_name: str):
+def save_df_to_gcs(df: pd.DataFrame, bucket_name: str, table_name: str, processed_prefix: str = "processed"):
     """
-    Sauvegarde un DataFrame en Parquet dans le dossier GCS/processed.
+    Sauvegarde un DataFrame en Parquet dans le dossier GCS/processed (ou celui du territoire), selon le profil
+    d'écriture PROCESSED_PARQUET_PROFILE : lignes triées, encodage dictionnaire (toutes les colonnes :
+    codes, libellés et conclusions sont très répétitifs), taille des row groups maîtrisée et
+    statistiques de colonnes.
     """
-    gcs_object_name = f"processed/{table_name}.parquet" 
-    print(f"   -> Sauvegarde de {len(df)} lignes dans gs://{bucket_name}/{gcs_object_name}")
-    
+    gcs_object_name = f"{processed_prefix}/{table_name}.parquet" 
+    print(f"   -> Sauvegarde de {len(df)} lignes dans gs://{bucket_name}/{gcs_object_name}")
+
+    sort_keys = [col for col in PROCESSED_SORT_KEYS.get(table_name, []) if col in df.columns]
+    if sort_keys:
+        df = df.sort_values(sort_keys, kind='stable')
+
+    arrow_table = pa.Table.from_pandas(df, preserve_index=False)
+
     buffer = io.BytesIO()
-    df.to_parquet(buffer, index=False, engine='pyarrow', compression='snappy')
-    buffer.seek(0)
+    pq.write_table(
+        arrow_table,
+        buffer,
+        compression=PROCESSED_PARQUET_PROFILE['compression'],
+        compression_level=PROCESSED_PARQUET_PROFILE['compression_level'],
+        row_group_size=PROCESSED_PARQUET_PROFILE['row_group_size'],
+        write_statistics=PROCESSED_PARQUET_PROFILE['write_statistics'],
+        use_dictionary=True
+    )
+    record_metric('bytes_written', buffer.tell(), table=table_name)
+    record_metric('rows_out', len(df), table=table_name)
     
-    bucket = storage_client.bucket(bucket_name)
-    blob = bucket.blob(gcs_object_name)
-    blob.upload_from_file(buffer, content_type='application/octet-stream')
+    get_storage(bucket_name).write_bytes(gcs_object_name, buffer.getvalue())
     
-    print(f"   ✅ Table {table_name} sauvegardée.")
+    print(f"   ✅ Table {table_name} sauvegardée.")
 
-def cleanup_old_gcs_files(bucket_name: str, latest_object_names: List[str]):
+def cleanup_old_gcs_files(bucket_name: str, latest_object_names: List[str], prefix: str = "raw/"):
     """
-    Supprime toutes les versions antérieures des fichiers bruts dans GCS/raw.
+    Supprime toutes les versions antérieures des fichiers bruts sous `prefix` (GCS/raw ou le dossier d'un département).
     Garde uniquement les fichiers dont les noms sont dans latest_object_names.
     """
-    bucket = storage_client.bucket(bucket_name)
-    print("\n🧹 Début du nettoyage des anciennes données brutes (GCS/raw)...")
+    storage = get_storage(bucket_name)
+    print(f"\n🧹 Début du nettoyage des anciennes données brutes (GCS/{prefix})...")
     
-    # 1. Lister tous les blobs bruts
-    all_raw_blobs = list(bucket.list_blobs(prefix="raw/"))
+    # 1. Lister tous les objets bruts
+    all_raw_names = [o['name'] for o in storage.list_objects(prefix)]
 
     # Convertir la liste en ensemble pour une recherche rapide
-    latest_blobs_to_keep = set(latest_object_names)
+    names_to_keep = set(latest_object_names)
 
     # 2. Identifier les fichiers à supprimer
-    blobs_to_delete = [
-        blob for blob in all_raw_blobs 
-        if blob.name.endswith('.parquet') and blob.name not in latest_blobs_to_keep
+    names_to_delete = [
+        name for name in all_raw_names
+        if name.endswith('.parquet') and name not in names_to_keep
     ]
     
-    if not blobs_to_delete:
+    if not names_to_delete:
         print("   -> Aucun ancien fichier brut trouvé à supprimer.")
         return
 
     # 3. Suppression
-    for blob in blobs_to_delete:
-        print(f"   -> Suppression de : gs://{bucket_name}/{blob.name}")
-        blob.delete()
+    for name in names_to_delete:
+        print(f"   -> Suppression de : gs://{bucket_name}/{name}")
+        storage.delete(name)
         
-    print(f"   ✅ Nettoyage GCS terminé. {len(blobs_to_delete)} anciens fichiers supprimés.")
+    print(f"   ✅ Nettoyage GCS terminé. {len(names_to_delete)} anciens fichiers supprimés.")
 
 # ----------------------------------------------------------------------
 # Filtrage des Codes Communes par Critère MOA
@@ -125,6 +156,20 @@ def get_commune_codes_from_moa(df: pd.DataFrame, moa_critere: str) -> Set[str]:
     
     return codes_insee_set
 
+def get_territory_commune_codes(df_qualite: pd.DataFrame, territory_slug: str) -> Set[str]:
+    """
+    Codes INSEE des communes d'un territoire : liste explicite, critère de MoA,
+    ou à défaut toutes les communes des départements extraits.
+    """
+    territory = get_territory(territory_slug)
+    codes_in_data = set(df_qualite['code_commune'].astype(str).str.zfill(5))
+
+    if territory.get('communes'):
+        return codes_in_data & {str(code).zfill(5) for code in territory['communes']}
+    if territory.get('moa'):
+        return get_commune_codes_from_moa(df_qualite, territory['moa'])
+    return codes_in_data
+
 # ----------------------------------------------------------------------
 # Logique de Transformation et Normalisation 
 # ----------------------------------------------------------------------
@@ -148,12 +193,14 @@ def transform_and_normalize_data(df_qualite: pd.DataFrame, df_udi: pd.DataFrame,
         
     mel_qualite_df['code_prelevement'] = mel_qualite_df['code_prelevement'].astype(str)
     mel_qualite_df['code_parametre'] = mel_qualite_df['code_parametre'].astype(str)
+    # Date de prélèvement typée (TIMESTAMP dans BigQuery) plutôt que chaîne ISO brute
+    mel_qualite_df['date_prelevement'] = pd.to_datetime(mel_qualite_df['date_prelevement'], utc=True, errors='coerce')
 
     # 2. FILTRAGE du DF UDI (pour les infos de réseau/commune)
     df_udi['code_commune'] = df_udi['code_commune'].astype(str).str.zfill(5)
     mel_udi_df = df_udi[df_udi['code_commune'].isin(target_insee_codes)].copy()
 
-    # --- Construction des 4 tables ---
+    # --- Construction des 4 tables normalisées (et du cube d'analyse) ---
     params_cols = ['code_parametre', 'libelle_parametre', 'code_type_parametre', 'code_parametre_se', 'libelle_parametre_maj', 'libelle_unite', 'limite_qualite_parametre'] 
     df_parametres = mel_qualite_df[params_cols].drop_duplicates(subset=['code_parametre']).reset_index(drop=True)
     
@@ -183,39 +230,80 @@ def transform_and_normalize_data(df_qualite: pd.DataFrame, df_udi: pd.DataFrame,
         'parametres': df_parametres,
         'prelevements': df_prelevements,
         'resultats_mesures': df_mesures,
-        'communes_reseau': df_communes_reseau
+        'communes_reseau': df_communes_reseau,
+        'cube_parametres': build_parametres_cube(df_prelevements, df_mesures, df_parametres)
     }
 
+def build_parametres_cube(df_prelevements: pd.DataFrame, df_mesures: pd.DataFrame, df_parametres: pd.DataFrame) -> pd.DataFrame:
+    """
+    Agrégat précalculé des mesures par paramètre x commune x mois : nombre de mesures,
+    dépassements de la limite de qualité, mesures de prélèvements non conformes et
+    min / moyenne / max de `resultat_numerique`. Les vues d'analyse de l'application ne lisent
+    que cette table (quelques milliers de lignes) au lieu de la table de faits.
+    """
+    df_prelevements_cube = df_prelevements[['code_prelevement', 'code_commune']].assign(
+        # Mois du prélèvement (premier jour du mois, UTC)
+        mois=df_prelevements['date_prelevement'].dt.tz_convert(None).dt.to_period('M').dt.start_time.dt.tz_localize('UTC'),
+        prelevement_non_conforme=is_prelevement_non_conforme(df_prelevements)
+    )
+    df = df_mesures[['code_prelevement', 'code_parametre', 'resultat_numerique']].assign(
+        depassement=is_mesure_en_depassement(df_mesures, df_parametres)
+    ).merge(df_prelevements_cube, on='code_prelevement', how='inner')
+
+    df_cube = df.groupby(['code_parametre', 'code_commune', 'mois'], sort=False).agg(
+        nb_mesures=('code_prelevement', 'size'),
+        nb_valeurs=('resultat_numerique', 'count'),
+        nb_depassements=('depassement', 'sum'),
+        nb_prelevements_non_conformes=('prelevement_non_conforme', 'sum'),
+        valeur_min=('resultat_numerique', 'min'),
+        valeur_moyenne=('resultat_numerique', 'mean'),
+        valeur_max=('resultat_numerique', 'max'),
+    ).reset_index()
+
+    print(f"   -> Cube paramètres x communes x mois : {len(df_cube)} lignes (pour {len(df)} mesures).")
+    return df_cube
+
 
 # ----------------------------------------------------------------------
 # Orchestrateur Principal
 # ----------------------------------------------------------------------
 
-def main_cloud_ready():
+def main_cloud_ready(territory_slug: str = DEFAULT_TERRITORY):
     """
-    Orchestre le T de l'ETL : Lecture GCS (2 fichiers), Détermination des Codes MEL, 
-    Transformation, Écriture GCS (4 tables), Nettoyage GCS.
+    Orchestre le T de l'ETL pour un territoire : Lecture GCS (2 fichiers par département),
+    Détermination des Codes communes, Transformation, Écriture GCS (4 tables + cube d'analyse), Nettoyage GCS.
     """
     if not GCS_BUCKET_NAME or not GCP_PROJECT_ID:
         print("❌ Échec de l'étape de transformation: Les variables d'environnement sont manquantes.")
         sys.exit(1)
 
+    territory = get_territory(territory_slug)
+    processed_prefix = get_processed_prefix(territory_slug)
     latest_raw_files = []
     df_udi, df_qualite = None, None
 
     # ------------------------------------------------------
-    # 1. Lecture des Données D'ENTRÉE (GCS)
+    # 1. Lecture des Données D'ENTRÉE (GCS, extractions partagées par département)
     # ------------------------------------------------------
     try:
-        udi_object_name = get_latest_gcs_path(GCS_BUCKET_NAME, "udi_mel")
-        latest_raw_files.append(udi_object_name)
-        df_udi = read_parquet_from_gcs(GCS_BUCKET_NAME, udi_object_name)
-        print(f"   ✅ {len(df_udi)} enregistrements UDI bruts chargés.")
-
-        qualite_object_name = get_latest_gcs_path(GCS_BUCKET_NAME, "qualite_eau")
-        latest_raw_files.append(qualite_object_name)
-        df_qualite = read_parquet_from_gcs(GCS_BUCKET_NAME, qualite_object_name)
-        print(f"   ✅ {len(df_qualite)} enregistrements de qualité bruts chargés.")
+        udi_frames, qualite_frames = [], []
+        for code_departement in territory['departements']:
+            raw_folder = get_raw_folder(code_departement)
+
+            udi_object_name = get_latest_gcs_path(GCS_BUCKET_NAME, "udi_", folder=raw_folder)
+            latest_raw_files.append(udi_object_name)
+            with step('gcs_read'):
+                udi_frames.append(read_parquet_from_gcs(GCS_BUCKET_NAME, udi_object_name))
+
+            qualite_object_name = get_latest_gcs_path(GCS_BUCKET_NAME, "qualite_eau_", folder=raw_folder)
+            latest_raw_files.append(qualite_object_name)
+            with step('gcs_read'):
+                qualite_frames.append(read_parquet_from_gcs(GCS_BUCKET_NAME, qualite_object_name))
+
+        df_udi = pd.concat(udi_frames, ignore_index=True)
+        print(f"   ✅ {len(df_udi)} enregistrements UDI bruts chargés.")
+        df_qualite = pd.concat(qualite_frames, ignore_index=True)
+        print(f"   ✅ {len(df_qualite)} enregistrements de qualité bruts chargés.")
         
     except Exception as e:
         print(f"❌ Échec de la lecture des fichiers bruts depuis GCS : {e}.")
@@ -225,37 +313,51 @@ def main_cloud_ready():
     # 2. DÉTERMINATION DYNAMIQUE DES CODES COMMUNES
     # ------------------------------------------------------
     try:
-        mel_codes_insee = get_commune_codes_from_moa(df_qualite, CRITERE_MOA_MEL)
+        territory_codes_insee = get_territory_commune_codes(df_qualite, territory_slug)
         
-        if not mel_codes_insee:
-            raise ValueError("Le filtrage par MoA n'a retourné aucun code commune.")
+        if not territory_codes_insee:
+            raise ValueError("La sélection des communes du territoire n'a retourné aucun code commune.")
             
-        print(f"✅ Codes INSEE de la MEL déterminés dynamiquement : {len(mel_codes_insee)} communes.")
+        print(f"✅ Codes INSEE du territoire '{territory_slug}' déterminés dynamiquement : {len(territory_codes_insee)} communes.")
         
     except Exception as e:
-        print(f"❌ Échec de la détermination des codes MEL : {e}")
+        print(f"❌ Échec de la détermination des codes communes ({territory_slug}) : {e}")
         sys.exit(1)
 
     # ------------------------------------------------------
     # 3. Transformation et Normalisation
     # ------------------------------------------------------
     try:
-        # ⚠️ CORRECTION : Passer mel_codes_insee en argument
-        tables_dict = transform_and_normalize_data(df_qualite, df_udi, mel_codes_insee) 
-        print("✅ Normalisation terminée. 4 tables prêtes pour le chargement.")
+        # ⚠️ CORRECTION : Passer territory_codes_insee en argument
+        with step('transform'):
+            tables_dict = transform_and_normalize_data(df_qualite, df_udi, territory_codes_insee) 
+        print(f"✅ Normalisation terminée. {len(tables_dict)} tables prêtes pour le chargement.")
     except Exception as e:
         print(f"❌ Échec de la transformation/normalisation : {e}")
         sys.exit(1)
             
     
     # ------------------------------------------------------
-    # 4. Écriture des 4 tables de Sortie (GCS/processed)
+    # 3b. Validation des tables (avant tout transfert réseau)
+    # ------------------------------------------------------
+    try:
+        with step('validation'):
+            validate_tables(tables_dict)
+        print("✅ Validation terminée. Les tables sont prêtes pour l'écriture.")
+    except Exception as e:
+        print(f"❌ Échec de la validation des tables : {e}")
+        sys.exit(1)
+
+
+    # ------------------------------------------------------
+    # 4. Écriture des tables de Sortie (GCS/processed)
     # ------------------------------------------------------
-    print("\n--- Écriture des 4 tables normalisées vers GCS/processed ---")
+    print(f"\n--- Écriture des {len(tables_dict)} tables vers GCS/{processed_prefix} ---")
     
     for table_name, df in tables_dict.items():
         try:
-            save_df_to_gcs(df, GCS_BUCKET_NAME, table_name)
+            with step('gcs_write'):
+                save_df_to_gcs(df, GCS_BUCKET_NAME, table_name, processed_prefix)
         except Exception as e:
             print(f"❌ Échec critique de l'écriture de la table {table_name}: {e}")
             sys.exit(1)
@@ -263,7 +365,9 @@ def main_cloud_ready():
     # ------------------------------------------------------
     # 5. Nettoyage des anciennes données brutes
     # ------------------------------------------------------
-    cleanup_old_gcs_files(GCS_BUCKET_NAME, latest_raw_files)
+    # Uniquement dans les dossiers des départements lus : les extractions des autres départements sont conservées
+    for code_departement in territory['departements']:
+        cleanup_old_gcs_files(GCS_BUCKET_NAME, latest_raw_files, prefix=f"{get_raw_folder(code_departement)}/")
 
     print("--- Fin de l'Étape 2: Transformation terminée. ---")
 
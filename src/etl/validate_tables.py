@@ -0,0 +1,255 @@
+# src/etl/validate_tables.py
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from datetime import datetime, timezone
+from typing import Dict, Any, List
+
+# Taille des lots Arrow parcourus par les contrôles colonne par colonne
+BATCH_SIZE = 250_000
+
+# Schéma attendu de chaque table normalisée (famille de type Arrow par colonne)
+TABLE_SCHEMAS: Dict[str, Dict[str, str]] = {
+    'parametres': {
+        'code_parametre': 'string',
+        'libelle_parametre': 'string',
+        'code_type_parametre': 'string',
+        'code_parametre_se': 'string',
+        'libelle_parametre_maj': 'string',
+        'libelle_unite': 'string',
+        'limite_qualite_parametre': 'string'
+    },
+    'prelevements': {
+        'code_prelevement': 'string',
+        'code_commune': 'string',
+        'date_prelevement': 'timestamp',
+        'conclusion_conformite_prelevement': 'string',
+        'conformite_limites_bact_prelevement': 'string'
+    },
+    'resultats_mesures': {
+        'code_prelevement': 'string',
+        'code_parametre': 'string',
+        'resultat_numerique': 'numeric',
+        'resultat_alphanumerique': 'string'
+    },
+    'communes_reseau': {
+        'code_commune': 'string',
+        'nom_commune': 'string',
+        'code_reseau': 'string',
+        'nom_reseau': 'string',
+        'nom_distributeur': 'string',
+        'nom_uge': 'string',
+        'nom_moa': 'string',
+        'debut_alim': 'string'
+    },
+    'cube_parametres': {
+        'code_parametre': 'string',
+        'code_commune': 'string',
+        'mois': 'timestamp',
+        'nb_mesures': 'numeric',
+        'nb_valeurs': 'numeric',
+        'nb_depassements': 'numeric',
+        'nb_prelevements_non_conformes': 'numeric',
+        'valeur_min': 'numeric',
+        'valeur_moyenne': 'numeric',
+        'valeur_max': 'numeric'
+    }
+}
+
+# Colonnes qui ne doivent jamais être nulles (clés et date de prélèvement)
+NOT_NULL_COLUMNS: Dict[str, List[str]] = {
+    'parametres': ['code_parametre'],
+    'prelevements': ['code_prelevement', 'code_commune', 'date_prelevement'],
+    'resultats_mesures': ['code_prelevement', 'code_parametre'],
+    'communes_reseau': ['code_commune'],
+    'cube_parametres': ['code_parametre', 'code_commune', 'mois']
+}
+
+# Clés devant être uniques dans chaque table
+UNIQUE_KEYS: Dict[str, List[str]] = {
+    'parametres': ['code_parametre'],
+    'prelevements': ['code_prelevement'],
+    'resultats_mesures': ['code_prelevement', 'code_parametre'],
+    'cube_parametres': ['code_parametre', 'code_commune', 'mois']
+}
+
+# Intégrité référentielle : (table, colonne) -> (table parente, colonne parente)
+FOREIGN_KEYS: List[tuple] = [
+    ('resultats_mesures', 'code_prelevement', 'prelevements', 'code_prelevement'),
+    ('resultats_mesures', 'code_parametre', 'parametres', 'code_parametre'),
+    ('cube_parametres', 'code_parametre', 'parametres', 'code_parametre'),
+]
+
+# Valeurs textuelles produites par astype(str) sur des valeurs manquantes
+NULL_LIKE_STRINGS = ['', 'nan', 'None', 'NaT', '<NA>']
+
+# Bornes acceptées pour les dates de prélèvement
+MIN_DATE_PRELEVEMENT = datetime(1990, 1, 1, tzinfo=timezone.utc)
+
+# ----------------------------------------------------------------------
+# Contrôles élémentaires (vectorisés sur des lots Arrow)
+# ----------------------------------------------------------------------
+
+def _matches_type_family(arrow_type: pa.DataType, family: str) -> bool:
+    """Vérifie qu'un type Arrow appartient à la famille attendue."""
+    if pa.types.is_dictionary(arrow_type):
+        arrow_type = arrow_type.value_type
+    if family == 'string':
+        return pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type) or pa.types.is_null(arrow_type)
+    if family == 'numeric':
+        return pa.types.is_floating(arrow_type) or pa.types.is_integer(arrow_type) or pa.types.is_null(arrow_type)
+    if family == 'timestamp':
+        return pa.types.is_timestamp(arrow_type)
+    return False
+
+def _count_null_like(column: pa.Array) -> int:
+    """Compte les valeurs nulles, y compris les chaînes 'nan'/'None' issues d'un astype(str)."""
+    null_count = column.null_count
+    if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+        null_count += pc.sum(pc.is_in(column, value_set=pa.array(NULL_LIKE_STRINGS))).as_py() or 0
+    return null_count
+
+def check_schema(table_name: str, arrow_table: pa.Table) -> List[str]:
+    """Vérifie la présence et le type de chaque colonne attendue."""
+    errors = []
+    for column_name, family in TABLE_SCHEMAS.get(table_name, {}).items():
+        if column_name not in arrow_table.column_names:
+            errors.append(f"Colonne manquante : '{column_name}'.")
+            continue
+        arrow_type = arrow_table.schema.field(column_name).type
+        if not _matches_type_family(arrow_type, family):
+            errors.append(f"Type inattendu pour '{column_name}' : {arrow_type} (attendu : {family}).")
+    return errors
+
+def check_batches(table_name: str, arrow_table: pa.Table) -> Dict[str, List[str]]:
+    """
+    Parcourt la table par lots Arrow et agrège les compteurs des contrôles colonne par colonne :
+    clés nulles, format des codes communes, bornes des dates et des résultats numériques.
+    """
+    counters = {
+        'null': {col: 0 for col in NOT_NULL_COLUMNS.get(table_name, []) if col in arrow_table.column_names},
+        'code_commune_invalide': 0,
+        'date_hors_bornes': 0,
+        'resultat_non_fini': 0,
+        'resultat_negatif': 0
+    }
+    max_date = pd.Timestamp.now(tz='UTC') + pd.Timedelta(days=1)
+
+    for batch in arrow_table.to_batches(max_chunksize=BATCH_SIZE):
+        for col in counters['null']:
+            counters['null'][col] += _count_null_like(batch.column(col))
+
+        if 'code_commune' in batch.schema.names and pa.types.is_string(batch.schema.field('code_commune').type):
+            lengths = pc.utf8_length(batch.column('code_commune'))
+            counters['code_commune_invalide'] += pc.sum(pc.not_equal(lengths, 5)).as_py() or 0
+
+        if 'date_prelevement' in batch.schema.names and pa.types.is_timestamp(batch.schema.field('date_prelevement').type):
+            dates = batch.column('date_prelevement')
+            lower = pa.scalar(MIN_DATE_PRELEVEMENT, type=dates.type)
+            upper = pa.scalar(max_date.to_pydatetime(), type=dates.type)
+            out_of_bounds = pc.or_(pc.less(dates, lower), pc.greater(dates, upper))
+            counters['date_hors_bornes'] += pc.sum(out_of_bounds).as_py() or 0
+
+        if 'resultat_numerique' in batch.schema.names and pa.types.is_floating(batch.schema.field('resultat_numerique').type):
+            values = batch.column('resultat_numerique')
+            counters['resultat_non_fini'] += pc.sum(pc.is_inf(values)).as_py() or 0
+            counters['resultat_negatif'] += pc.sum(pc.less(values, 0)).as_py() or 0
+
+    errors, warnings = [], []
+    for col, count in counters['null'].items():
+        if count:
+            errors.append(f"{count} valeurs nulles dans la colonne obligatoire '{col}'.")
+    if counters['code_commune_invalide']:
+        errors.append(f"{counters['code_commune_invalide']} codes communes ne font pas 5 caractères.")
+    if counters['date_hors_bornes']:
+        errors.append(f"{counters['date_hors_bornes']} dates de prélèvement hors bornes.")
+    if counters['resultat_non_fini']:
+        errors.append(f"{counters['resultat_non_fini']} résultats numériques infinis.")
+    if counters['resultat_negatif']:
+        warnings.append(f"{counters['resultat_negatif']} résultats numériques négatifs.")
+
+    return {'errors': errors, 'warnings': warnings}
+
+def check_unique_keys(table_name: str, arrow_table: pa.Table) -> List[str]:
+    """Vérifie l'unicité de la clé de la table (agrégation Arrow, sans boucle Python)."""
+    keys = UNIQUE_KEYS.get(table_name)
+    if not keys or not all(key in arrow_table.column_names for key in keys):
+        return []
+
+    distinct_count = arrow_table.group_by(keys).aggregate([]).num_rows
+    duplicates_count = arrow_table.num_rows - distinct_count
+    if duplicates_count:
+        return [f"{duplicates_count} clés {keys} en doublon."]
+    return []
+
+def check_foreign_keys(arrow_tables: Dict[str, pa.Table]) -> Dict[str, List[str]]:
+    """Vérifie que chaque clé étrangère référence une ligne existante de la table parente."""
+    errors: Dict[str, List[str]] = {}
+    for table_name, column, parent_name, parent_column in FOREIGN_KEYS:
+        if table_name not in arrow_tables or parent_name not in arrow_tables:
+            continue
+        child, parent = arrow_tables[table_name], arrow_tables[parent_name]
+        if column not in child.column_names or parent_column not in parent.column_names:
+            continue
+
+        value_set = pc.unique(parent.column(parent_column))
+        orphans_count = 0
+        for batch in child.select([column]).to_batches(max_chunksize=BATCH_SIZE):
+            orphans_count += pc.sum(pc.invert(pc.is_in(batch.column(0), value_set=value_set))).as_py() or 0
+
+        if orphans_count:
+            errors.setdefault(table_name, []).append(
+                f"{orphans_count} valeurs de '{column}' absentes de {parent_name}.{parent_column}."
+            )
+    return errors
+
+# ----------------------------------------------------------------------
+# Orchestration de la validation
+# ----------------------------------------------------------------------
+
+def validate_tables(tables_dict: Dict[str, pd.DataFrame]) -> Dict[str, Dict[str, Any]]:
+    """
+    Valide les tables normalisées avant toute écriture sur GCS ou chargement BigQuery.
+    Retourne le rapport de validation et lève une ValueError si une erreur bloquante est détectée.
+    """
+    print("   -> Début de la validation des tables normalisées...")
+    report: Dict[str, Dict[str, Any]] = {}
+    arrow_tables: Dict[str, pa.Table] = {}
+
+    for table_name, df in tables_dict.items():
+        report[table_name] = {'rows': len(df), 'errors': [], 'warnings': []}
+        try:
+            arrow_tables[table_name] = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            report[table_name]['errors'].append(f"Conversion Arrow impossible (types de colonnes incohérents) : {e}")
+            continue
+
+        arrow_table = arrow_tables[table_name]
+        report[table_name]['errors'] += check_schema(table_name, arrow_table)
+        batch_results = check_batches(table_name, arrow_table)
+        report[table_name]['errors'] += batch_results['errors']
+        report[table_name]['warnings'] += batch_results['warnings']
+        report[table_name]['errors'] += check_unique_keys(table_name, arrow_table)
+
+    for table_name, fk_errors in check_foreign_keys(arrow_tables).items():
+        report[table_name]['errors'] += fk_errors
+
+    print_validation_report(report)
+
+    errors_count = sum(len(table_report['errors']) for table_report in report.values())
+    if errors_count:
+        raise ValueError(f"{errors_count} erreurs de validation détectées. Chargement annulé.")
+
+    return report
+
+def print_validation_report(report: Dict[str, Dict[str, Any]]):
+    """Affiche le rapport de validation table par table."""
+    print("\n📋 Rapport de validation :")
+    for table_name, table_report in report.items():
+        status = "❌" if table_report['errors'] else ("⚠️" if table_report['warnings'] else "✅")
+        print(f"   {status} {table_name} ({table_report['rows']} lignes)")
+        for error in table_report['errors']:
+            print(f"      ❌ {error}")
+        for warning in table_report['warnings']:
+            print(f"      ⚠️ {warning}")
@@ -0,0 +1,112 @@
+# src/load/change_detection.py
+
+import hashlib
+import io
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from typing import Dict, List, Optional, Tuple
+
+from src.load.key_index import INDEX_FOLDER, build_composite_keys
+from src.utils.storage import get_storage
+
+# Clés des tables de dimensions (mode TRUNCATE). Une liste vide signifie "pas de clé fiable" :
+# toute modification entraîne alors un rechargement complet (table de petite taille).
+DIMENSION_KEYS: Dict[str, List[str]] = {
+    'parametres': ['code_parametre'],
+    'prelevements': ['code_prelevement'],
+    'communes_reseau': [],
+    # Cube d'analyse : seuls les mois qui reçoivent de nouvelles mesures changent d'une exécution à l'autre
+    'cube_parametres': ['code_parametre', 'code_commune', 'mois']
+}
+
+# Label BigQuery portant la somme de contrôle du contenu de la table
+CHECKSUM_LABEL = "content_checksum"
+
+# Au-delà de cette proportion de lignes modifiées, un rechargement complet est plus simple qu'un MERGE
+MAX_CHANGED_RATIO = 0.5
+
+# ----------------------------------------------------------------------
+# Empreintes du contenu
+# ----------------------------------------------------------------------
+
+def compute_dataframe_fingerprint(df: pd.DataFrame, key_columns: List[str]) -> Tuple[str, pd.DataFrame]:
+    """
+    Calcule l'empreinte d'un DataFrame de dimension :
+    - une somme de contrôle globale stable (indépendante de l'ordre des lignes),
+    - le hash de chaque ligne associé à sa clé.
+    """
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy(dtype=np.uint64)
+
+    digest = hashlib.blake2b(digest_size=16)
+    # Le nom et le type des colonnes font partie du contenu : un changement de schéma change la somme
+    digest.update(",".join(f"{col}:{dtype}" for col, dtype in df.dtypes.items()).encode())
+    digest.update(np.sort(row_hashes).tobytes())
+
+    keys = build_composite_keys(df, key_columns) if key_columns else row_hashes.astype(str).astype(object)
+    df_row_hashes = pd.DataFrame({'key': keys, 'row_hash': row_hashes})
+
+    return digest.hexdigest(), df_row_hashes
+
+# ----------------------------------------------------------------------
+# Lecture / Écriture des hashes de lignes sur GCS
+# ----------------------------------------------------------------------
+
+def get_row_hashes_path(table_name: str) -> str:
+    """Retourne le nom de l'objet GCS des hashes de lignes d'une table."""
+    return f"{INDEX_FOLDER}/{table_name}_row_hashes.parquet"
+
+def load_row_hashes(bucket_name: str, table_name: str) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+    """
+    Charge les hashes de lignes du dernier chargement et la somme de contrôle associée.
+    Retourne (None, None) si le fichier n'existe pas.
+    """
+    path = get_row_hashes_path(table_name)
+    try:
+        hashes_table = pq.read_table(io.BytesIO(get_storage(bucket_name).read_bytes(path)))
+    except FileNotFoundError:
+        return None, None
+
+    checksum = (hashes_table.schema.metadata or {}).get(b'checksum')
+    return hashes_table.to_pandas(), checksum.decode() if checksum else None
+
+def save_row_hashes(df_row_hashes: pd.DataFrame, checksum: str, bucket_name: str, table_name: str):
+    """Sauvegarde les hashes de lignes et la somme de contrôle du contenu chargé."""
+    path = get_row_hashes_path(table_name)
+    hashes_table = pa.Table.from_pandas(df_row_hashes, preserve_index=False)
+    hashes_table = hashes_table.replace_schema_metadata({'checksum': checksum})
+
+    buffer = io.BytesIO()
+    pq.write_table(hashes_table, buffer, compression='zstd')
+    get_storage(bucket_name).write_bytes(path, buffer.getvalue())
+
+# ----------------------------------------------------------------------
+# Différentiel entre deux versions d'une dimension
+# ----------------------------------------------------------------------
+
+def diff_dimension_rows(df: pd.DataFrame, df_row_hashes: pd.DataFrame, previous_row_hashes: pd.DataFrame, key_columns: List[str]) -> Optional[pd.DataFrame]:
+    """
+    Retourne les lignes nouvelles ou modifiées depuis le dernier chargement.
+    Retourne None si le différentiel ne peut pas être appliqué par MERGE et qu'un
+    rechargement complet est nécessaire (table sans clé, lignes supprimées, trop de changements).
+    """
+    if not key_columns:
+        return None
+
+    new_hashes = df_row_hashes['row_hash'].to_numpy()
+    previous_hashes = previous_row_hashes['row_hash'].to_numpy()
+
+    # Lignes dont le contenu n'existait pas lors du dernier chargement (nouvelles ou modifiées)
+    changed_mask = ~np.isin(new_hashes, previous_hashes)
+
+    # Lignes disparues : si leur clé n'est plus présente du tout, il s'agit d'une suppression
+    removed_mask = ~np.isin(previous_hashes, new_hashes)
+    removed_keys = previous_row_hashes['key'].to_numpy()[removed_mask]
+    if np.isin(removed_keys, df_row_hashes['key'].to_numpy(), invert=True).any():
+        return None
+
+    if changed_mask.sum() > MAX_CHANGED_RATIO * len(df):
+        return None
+
+    return df[changed_mask].copy()
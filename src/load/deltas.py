@@ -0,0 +1,58 @@
+# src/load/deltas.py
+
+import io
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from src.utils.storage import get_storage
+
+# Dossier GCS (à côté de processed/ et index/) des lignes effectivement chargées à chaque exécution.
+# Les consommateurs en aval (moteur d'alertes) ne lisent que ces différentiels, jamais l'historique.
+DELTA_FOLDER = "deltas"
+
+# Tables dont les lignes chargées sont conservées pour les consommateurs en aval
+DELTA_TABLES = ['prelevements', 'resultats_mesures']
+
+# ----------------------------------------------------------------------
+# Écriture / Lecture des différentiels sur GCS
+# ----------------------------------------------------------------------
+
+def get_delta_folder(table_name: str) -> str:
+    """Retourne le dossier GCS des différentiels d'une table (un fichier par chargement)."""
+    return f"{DELTA_FOLDER}/{table_name}"
+
+def save_load_delta(df: pd.DataFrame, bucket_name: str, table_name: str):
+    """Enregistre les lignes qui viennent d'être chargées dans BigQuery (nouvelles ou modifiées)."""
+    if df.empty:
+        return
+    path = f"{get_delta_folder(table_name)}/{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S_%f')}.parquet"
+    delta_table = pa.Table.from_pandas(df, preserve_index=False)
+
+    buffer = io.BytesIO()
+    pq.write_table(delta_table, buffer, compression='zstd')
+    get_storage(bucket_name).write_bytes(path, buffer.getvalue())
+
+    print(f"   -> Différentiel enregistré : {path} ({len(df)} lignes).")
+
+def list_load_deltas(bucket_name: str, table_name: str) -> List[str]:
+    """Liste les différentiels non encore consommés d'une table, du plus ancien au plus récent."""
+    objects = get_storage(bucket_name).list_objects(f"{get_delta_folder(table_name)}/")
+    return [o['name'] for o in objects if o['name'].endswith(".parquet")]
+
+def read_load_deltas(bucket_name: str, paths: List[str]) -> Optional[pd.DataFrame]:
+    """Concatène des différentiels. Retourne None s'il n'y en a aucun."""
+    if not paths:
+        return None
+
+    storage = get_storage(bucket_name)
+    frames = [pq.read_table(io.BytesIO(storage.read_bytes(path))).to_pandas() for path in paths]
+    return pd.concat(frames, ignore_index=True)
+
+def delete_load_deltas(bucket_name: str, paths: List[str]):
+    """Supprime des différentiels entièrement consommés."""
+    storage = get_storage(bucket_name)
+    for path in paths:
+        storage.delete(path)
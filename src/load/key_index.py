@@ -0,0 +1,98 @@
+# src/load/key_index.py
+
+import io
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from typing import List, Optional, Tuple
+
+from src.utils.storage import get_storage
+
+# Dossier GCS (à côté de processed/) contenant les index de clés déjà chargées
+INDEX_FOLDER = "index"
+KEY_SEPARATOR = "_"
+
+# ----------------------------------------------------------------------
+# Construction des clés composites
+# ----------------------------------------------------------------------
+
+def build_composite_keys(df: pd.DataFrame, primary_keys: List[str]) -> np.ndarray:
+    """
+    Construit le tableau des clés composites (ex: 'code_prelevement_code_parametre')
+    de façon vectorisée, sans passer par un apply ligne à ligne.
+    """
+    if df.empty:
+        return np.array([], dtype=object)
+
+    keys = df[primary_keys[0]].astype(str)
+    for col in primary_keys[1:]:
+        keys = keys + KEY_SEPARATOR + df[col].astype(str)
+    return keys.to_numpy(dtype=object)
+
+# ----------------------------------------------------------------------
+# Lecture / Écriture de l'index trié sur GCS
+# ----------------------------------------------------------------------
+
+def get_key_index_path(table_name: str) -> str:
+    """Retourne le nom de l'objet GCS de l'index des clés d'une table."""
+    return f"{INDEX_FOLDER}/{table_name}_keys.parquet"
+
+def load_key_index(bucket_name: str, table_name: str) -> Tuple[Optional[np.ndarray], Optional[int]]:
+    """
+    Charge l'index trié des clés déjà présentes dans BigQuery, ainsi que le nombre
+    de lignes de la table BQ au moment de sa dernière mise à jour.
+    Retourne (None, None) si l'index n'existe pas encore (première exécution).
+    """
+    index_path = get_key_index_path(table_name)
+    try:
+        index_table = pq.read_table(io.BytesIO(get_storage(bucket_name).read_bytes(index_path)))
+    except FileNotFoundError:
+        return None, None
+
+    metadata = index_table.schema.metadata or {}
+    bq_num_rows = metadata.get(b'bq_num_rows')
+
+    print(f"   -> Index de clés chargé depuis {index_path} ({index_table.num_rows} clés).")
+    # Le fichier est écrit trié : aucun tri supplémentaire n'est nécessaire
+    keys = index_table.column('key').to_numpy(zero_copy_only=False).astype(object)
+    return keys, int(bq_num_rows) if bq_num_rows is not None else None
+
+def save_key_index(keys: np.ndarray, bucket_name: str, table_name: str, bq_num_rows: int):
+    """
+    Sauvegarde l'index trié des clés sur GCS.
+    Le tri rend le fichier très compressible (préfixes communs) et permet
+    une recherche dichotomique à la relecture. Le nombre de lignes de la table BQ
+    est stocké dans les métadonnées pour détecter un index désynchronisé.
+    """
+    index_path = get_key_index_path(table_name)
+    index_table = pa.table({'key': pa.array(keys, type=pa.string())})
+    index_table = index_table.replace_schema_metadata({'bq_num_rows': str(bq_num_rows)})
+
+    buffer = io.BytesIO()
+    pq.write_table(index_table, buffer, compression='zstd')
+    get_storage(bucket_name).write_bytes(index_path, buffer.getvalue())
+
+    print(f"   -> Index de clés mis à jour : {index_path} ({len(keys)} clés).")
+
+# ----------------------------------------------------------------------
+# Opérations vectorisées sur l'index
+# ----------------------------------------------------------------------
+
+def is_key_in_index(keys: np.ndarray, sorted_index: np.ndarray) -> np.ndarray:
+    """
+    Retourne un masque booléen indiquant, pour chaque clé, si elle est déjà dans l'index.
+    Recherche dichotomique vectorisée (np.searchsorted) sur l'index trié.
+    """
+    if len(sorted_index) == 0 or len(keys) == 0:
+        return np.zeros(len(keys), dtype=bool)
+
+    positions = np.searchsorted(sorted_index, keys)
+    positions = np.minimum(positions, len(sorted_index) - 1)
+    return sorted_index[positions] == keys
+
+def merge_key_index(sorted_index: Optional[np.ndarray], new_keys: np.ndarray) -> np.ndarray:
+    """Fusionne de nouvelles clés dans l'index et retourne l'index trié sans doublons."""
+    if sorted_index is None or len(sorted_index) == 0:
+        return np.unique(new_keys)
+    return np.unique(np.concatenate([sorted_index, new_keys]))
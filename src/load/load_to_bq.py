@@ -6,8 +6,30 @@ import os
 import io
 from google.cloud import bigquery
 from google.api_core import exceptions
-import gcsfs 
-from typing import List, Dict
+import numpy as np
+from functools import lru_cache
+from typing import List, Dict, Optional
+
+from src.load.key_index import (
+    build_composite_keys,
+    load_key_index,
+    save_key_index,
+    is_key_in_index,
+    merge_key_index
+)
+from src.load.change_detection import (
+    DIMENSION_KEYS,
+    CHECKSUM_LABEL,
+    compute_dataframe_fingerprint,
+    load_row_hashes,
+    save_row_hashes,
+    diff_dimension_rows
+)
+from src.load.deltas import DELTA_TABLES, save_load_delta
+from src.load.serving_tables import refresh_serving_tables, SERVING_TABLES
+from src.pipeline.metrics import record_metric, step
+from src.pipeline.territories import get_state_name
+from src.utils.storage import get_storage, split_gcs_path
 
 
 # Importation des variables d'environnement de la configuration
@@ -17,8 +39,10 @@ except ImportError:
     print("Erreur critique: Impossible d'importer les variables de configuration.")
     sys.exit(1)
 
-# Initialisation du client BQ
-client = bigquery.Client(project=GCP_PROJECT_ID)
+# Client BQ créé à la première utilisation (et non à l'import du module)
+@lru_cache(maxsize=None)
+def get_bq_client() -> bigquery.Client:
+    return bigquery.Client(project=GCP_PROJECT_ID)
 
 # Clés primaires des tables pour la déduplication (uniquement pour les tables APPEND)
 # Pour une déduplication parfaite sur toutes les tables, la clé doit être définie ici.
@@ -28,95 +52,250 @@ TABLE_PRIMARY_KEYS: Dict[str, List[str]] = {
     # Les dimensions (prelevements, parametres, communes_reseau) seront TRUNCATE (WRITE_TRUNCATE)
 }
 
+# Les tables à charger (4 tables normalisées et le cube d'analyse, produites par l'étape de transformation)
+PROCESSED_TABLE_NAMES = ['prelevements', 'parametres', 'communes_reseau', 'resultats_mesures', 'cube_parametres']
+
+# Index des clés déjà chargées, conservé en mémoire entre la déduplication et la mise à jour post-chargement
+_key_index_cache: Dict[str, np.ndarray] = {}
+
+# --- INDEX PERSISTANT DES CLÉS CHARGÉES ---
+
+def get_bq_table_num_rows(bq_table_id: str) -> Optional[int]:
+    """
+    Retourne le nombre de lignes d'une table BQ via ses métadonnées (aucune requête facturée).
+    Retourne None si la table n'existe pas.
+    """
+    try:
+        return get_bq_client().get_table(bq_table_id).num_rows
+    except exceptions.NotFound:
+        return None
+
+def rebuild_key_index_from_bigquery(table_name: str, primary_keys: List[str], bq_table_id: str, bq_num_rows: int) -> np.ndarray:
+    """
+    Reconstruit l'index des clés à partir de BigQuery (solution de repli exacte).
+    N'est appelé qu'à la première exécution ou si l'index est désynchronisé de la table.
+    """
+    print(f"   🔄 Reconstruction de l'index des clés depuis BigQuery pour '{table_name}'...")
+    query = f"SELECT DISTINCT {', '.join(primary_keys)} FROM `{bq_table_id}`"
+    query_job = get_bq_client().query(query)
+    existing_keys_df = query_job.to_dataframe()
+    record_metric('bq_bytes_processed', query_job.total_bytes_processed, table=table_name, query='key_index')
+
+    key_index = np.unique(build_composite_keys(existing_keys_df, primary_keys))
+    save_key_index(key_index, GCS_BUCKET_NAME, get_state_name(table_name, bq_table_id), bq_num_rows)
+    return key_index
+
+def get_existing_key_index(table_name: str, primary_keys: List[str], bq_table_id: str) -> Optional[np.ndarray]:
+    """
+    Retourne l'index trié des clés déjà présentes dans BigQuery.
+    L'index persistant sur GCS est utilisé tant que le nombre de lignes qu'il a enregistré
+    correspond à celui de la table BQ ; sinon il est reconstruit depuis BigQuery.
+    Retourne None si la table BQ n'existe pas encore.
+    """
+    bq_num_rows = get_bq_table_num_rows(bq_table_id)
+    if bq_num_rows is None:
+        return None
+
+    key_index, indexed_num_rows = load_key_index(GCS_BUCKET_NAME, get_state_name(table_name, bq_table_id))
+
+    if key_index is None or indexed_num_rows != bq_num_rows:
+        if key_index is not None:
+            print(f"   ⚠️ Index désynchronisé ({indexed_num_rows} lignes indexées, {bq_num_rows} dans BQ).")
+        key_index = rebuild_key_index_from_bigquery(table_name, primary_keys, bq_table_id, bq_num_rows)
+
+    return key_index
+
+def update_key_index_after_load(table_name: str, primary_keys: List[str], df_loaded: pd.DataFrame, bq_table_id: str):
+    """
+    Ajoute les clés fraîchement chargées à l'index persistant, après un chargement réussi.
+    """
+    new_keys = build_composite_keys(df_loaded, primary_keys)
+    state_name = get_state_name(table_name, bq_table_id)
+    key_index = merge_key_index(_key_index_cache.get(state_name), new_keys)
+    _key_index_cache[state_name] = key_index
+
+    save_key_index(key_index, GCS_BUCKET_NAME, state_name, get_bq_table_num_rows(bq_table_id) or 0)
+
+# --- DÉTECTION DES CHANGEMENTS DES TABLES DE DIMENSIONS ---
+
+def get_table_checksum(bq_table_id: str) -> Optional[str]:
+    """Lit la somme de contrôle stockée dans les labels de la table BQ (métadonnées, sans requête)."""
+    try:
+        return get_bq_client().get_table(bq_table_id).labels.get(CHECKSUM_LABEL)
+    except exceptions.NotFound:
+        return None
+
+def set_table_checksum(bq_table_id: str, checksum: str):
+    """Enregistre la somme de contrôle du contenu chargé dans les labels de la table BQ."""
+    table = get_bq_client().get_table(bq_table_id)
+    table.labels = {**table.labels, CHECKSUM_LABEL: checksum}
+    get_bq_client().update_table(table, ["labels"])
+
+def run_load_job(df: pd.DataFrame, bq_table_id: str, write_disposition) -> bigquery.LoadJob:
+    """Lance un job de chargement BigQuery depuis un DataFrame et attend sa fin."""
+    job_config = bigquery.LoadJobConfig(
+        write_disposition=write_disposition, 
+    )
+    
+    load_job = get_bq_client().load_table_from_dataframe(
+        df, 
+        bq_table_id, 
+        job_config=job_config
+    )
+    
+    print(f"   -> Chargement BQ démarré. Job ID: {load_job.job_id}")
+    with step('bq_load_job'):
+        load_job.result()
+    record_metric('rows_out', load_job.output_rows, table=bq_table_id)
+    return load_job
+
+def merge_dimension_changes(df_changed: pd.DataFrame, key_columns: List[str], bq_table_id: str):
+    """
+    Applique uniquement les lignes nouvelles ou modifiées d'une dimension :
+    chargement dans une table de staging puis MERGE sur la clé.
+    """
+    staging_table_id = f"{bq_table_id}__staging"
+    run_load_job(df_changed, staging_table_id, bigquery.WriteDisposition.WRITE_TRUNCATE)
+
+    on_clause = " AND ".join(f"T.{col} = S.{col}" for col in key_columns)
+    update_clause = ", ".join(f"{col} = S.{col}" for col in df_changed.columns if col not in key_columns)
+    merge_query = f"""
+    MERGE `{bq_table_id}` AS T
+    USING `{staging_table_id}` AS S
+    ON {on_clause}
+    WHEN MATCHED THEN UPDATE SET {update_clause}
+    WHEN NOT MATCHED THEN INSERT ROW
+    """
+    try:
+        merge_job = get_bq_client().query(merge_query)
+        merge_job.result()
+        record_metric('bq_bytes_processed', merge_job.total_bytes_processed, table=bq_table_id, query='merge')
+    finally:
+        get_bq_client().delete_table(staging_table_id, not_found_ok=True)
+
+def load_dimension_table(df: pd.DataFrame, table_name: str, bq_table_id: str, save_deltas: bool = False) -> bool:
+    """
+    Charge une table de dimension en ne faisant que le travail nécessaire :
+    - contenu identique au dernier chargement (somme de contrôle égale) : aucun job,
+    - quelques lignes nouvelles ou modifiées : MERGE de ces seules lignes,
+    - sinon : rechargement complet (WRITE_TRUNCATE).
+    Avec `save_deltas`, les lignes chargées sont conservées pour le moteur d'alertes.
+    Retourne True si la table BigQuery a été modifiée.
+    """
+    key_columns = DIMENSION_KEYS.get(table_name, [])
+    checksum, df_row_hashes = compute_dataframe_fingerprint(df, key_columns)
+
+    current_checksum = get_table_checksum(bq_table_id)
+    if current_checksum == checksum:
+        print(f"   ℹ️ Contenu inchangé depuis le dernier chargement (checksum {checksum[:8]}). Skip.")
+        return False
+
+    previous_row_hashes, previous_checksum = load_row_hashes(GCS_BUCKET_NAME, get_state_name(table_name, bq_table_id))
+    df_changed = None
+    # Les hashes de lignes ne sont utilisables que s'ils décrivent bien le contenu actuel de la table
+    if previous_row_hashes is not None and previous_checksum == current_checksum:
+        df_changed = diff_dimension_rows(df, df_row_hashes, previous_row_hashes, key_columns)
+
+    if df_changed is not None:
+        print(f"   🔀 {len(df_changed)} lignes nouvelles ou modifiées sur {len(df)}. Application par MERGE.")
+        merge_dimension_changes(df_changed, key_columns, bq_table_id)
+    else:
+        load_job = run_load_job(df, bq_table_id, bigquery.WriteDisposition.WRITE_TRUNCATE)
+        print(f"   ✅ Table {table_name} rechargée. {load_job.output_rows} lignes écrites.")
+
+    state_name = get_state_name(table_name, bq_table_id)
+    set_table_checksum(bq_table_id, checksum)
+    save_row_hashes(df_row_hashes, checksum, GCS_BUCKET_NAME, state_name)
+    if save_deltas and table_name in DELTA_TABLES:
+        # Rechargement complet : toutes les lignes sont considérées comme nouvelles (dédoublonnées en aval)
+        save_load_delta(df_changed if df_changed is not None else df, GCS_BUCKET_NAME, state_name)
+    return True
+
 # --- NOUVELLE FONCTION : LECTURE GCS & DÉDUPLICATION ---
 
 def load_parquet_and_deduplicate(gcs_file_path: str, table_name: str, primary_keys: List[str], bq_table_id: str) -> pd.DataFrame:
     """
     Lit un fichier Parquet depuis GCS en mémoire et le déduplique
-    en comparant les clés primaires avec celles déjà présentes dans BigQuery.
+    en comparant les clés primaires avec l'index persistant des clés déjà chargées dans BigQuery.
     """
     # 1. Lecture du Parquet dans Pandas (Nécessaire pour la déduplication)
     try:
-        fs = gcsfs.GCSFileSystem()
-        with fs.open(gcs_file_path, 'rb') as f:
-            df = pd.read_parquet(io.BytesIO(f.read()))
+        bucket_name, object_name = split_gcs_path(gcs_file_path)
+        parquet_bytes = get_storage(bucket_name).read_bytes(object_name)
+        record_metric('bytes_read', len(parquet_bytes), object=gcs_file_path)
+        df = pd.read_parquet(io.BytesIO(parquet_bytes))
     except FileNotFoundError as e:
         print(f"   ❌ Fichier GCS non trouvé à l'emplacement : {gcs_file_path}")
         raise e
     
     initial_count = len(df)
+    record_metric('rows_in', initial_count, table=table_name)
     print(f"   -> {initial_count} lignes lues depuis GCS. Début de la vérification des doublons...")
 
     # 2. Déduplication pour les tables en mode APPEND (Faits)
     if table_name in TABLE_PRIMARY_KEYS:
-        # Créer une colonne clé temporaire pour le merge/filtrage
-        df['temp_key'] = df[primary_keys].astype(str).agg('_'.join, axis=1)
-
-        # Lire les clés existantes depuis BigQuery
-        query = f"SELECT DISTINCT {', '.join(primary_keys)} FROM `{bq_table_id}`"
-        try:
-            existing_keys_df = client.query(query).to_dataframe()
-            existing_keys_df['temp_key'] = existing_keys_df[primary_keys].astype(str).agg('_'.join, axis=1)
-            
-            # Filtrer : Garder les lignes dont la clé n'existe PAS dans BQ
-            df_dedup = df[~df['temp_key'].isin(existing_keys_df['temp_key'])].drop(columns=['temp_key']).copy()
-            
-            duplicates_count = initial_count - len(df_dedup)
-            
-            if duplicates_count > 0:
-                print(f"   🗑️ {duplicates_count} lignes en doublon identifiées (clés : {primary_keys}) et supprimées.")
-            
-            return df_dedup
-            
-        except exceptions.NotFound:
-            print(f"   ⚠️ Table BQ '{bq_table_id}' non trouvée (première exécution ?). Toutes les lignes seront chargées.")
-            return df.drop(columns=['temp_key']).copy()
+        # Comparaison locale et vectorisée avec l'index persistant des clés (pas de requête BQ)
+        key_index = get_existing_key_index(table_name, primary_keys, bq_table_id)
+
+        if key_index is None:
+            print(f"   ⚠️ Table BQ '{bq_table_id}' non trouvée (première exécution ?). Toutes les lignes seront chargées.")
+            _key_index_cache.pop(get_state_name(table_name, bq_table_id), None)
+            return df
+
+        _key_index_cache[get_state_name(table_name, bq_table_id)] = key_index
+
+        # Filtrer : Garder les lignes dont la clé n'existe PAS dans BQ
+        keys = build_composite_keys(df, primary_keys)
+        df_dedup = df[~is_key_in_index(keys, key_index)].copy()
+
+        duplicates_count = initial_count - len(df_dedup)
+
+        if duplicates_count > 0:
+            print(f"   🗑️ {duplicates_count} lignes en doublon identifiées (clés : {primary_keys}) et supprimées.")
+
+        return df_dedup
 
     # 3. Pour les tables de Dimensions (mode TRUNCATE), la déduplication est implicite.
     return df
 
 
-# --- FONCTION PRINCIPALE DE CHARGEMENT BIGQUERY (MODIFIÉE) ---
-
-def load_processed_data_to_bigquery(project_id: str, dataset_id: str, gcs_bucket: str):
-    """
-    Lit les 4 tables Parquet depuis GCS/processed, les déduplique et les charge dans BigQuery.
-    """
-    if not all([project_id, gcs_bucket, dataset_id]):
-        print("Erreur: Les variables Project ID, Bucket Name ou Dataset ID sont manquantes.")
-        sys.exit(1)
+# --- CHARGEMENT D'UNE TABLE ---
 
-    # 1. Connexion et Vérification du Dataset (Inchangé)
-    dataset_ref = client.dataset(dataset_id)
+def ensure_dataset(project_id: str, dataset_id: str):
+    """Vérifie l'existence du dataset BigQuery et le crée si besoin."""
+    dataset_ref = get_bq_client().dataset(dataset_id)
     print(f"🔄 Connexion à BigQuery réussie. Projet : {project_id}")
 
     try:
-        client.get_dataset(dataset_ref)
+        get_bq_client().get_dataset(dataset_ref)
         print(f"   Dataset '{dataset_id}' existe déjà.")
     except exceptions.NotFound:
         dataset = bigquery.Dataset(dataset_ref)
         dataset.location = "europe-west1"
-        client.create_dataset(dataset)
+        get_bq_client().create_dataset(dataset, exists_ok=True)
         print(f"   ✅ Dataset '{dataset_id}' créé.")
 
-    # Les 4 noms de tables à charger
-    table_names = ['prelevements', 'parametres', 'communes_reseau', 'resultats_mesures']
+def load_table(project_id: str, dataset_id: str, gcs_bucket: str, table_name: str, processed_prefix: str = "processed",
+               save_deltas: bool = False) -> bool:
+    """
+    Lit une table Parquet depuis GCS/processed (ou le dossier du territoire), la déduplique
+    et la charge dans BigQuery. Retourne True si la table BigQuery a été modifiée.
+    Les différentiels (deltas/) ne sont écrits qu'avec `save_deltas`, c.-à-d. quand le moteur
+    d'alertes tourne pour les consommer : sinon le dossier grossirait sans limite.
+    """
+    gcs_file_path = f"gs://{gcs_bucket}/{processed_prefix}/{table_name}.parquet"
+    table_id = f"{project_id}.{dataset_id}.{table_name}"
     
-    # 2. Chargement des tables
-    for table_name in table_names:
-        
-        gcs_file_path = f"gs://{gcs_bucket}/processed/{table_name}.parquet"
-        table_id = f"{project_id}.{dataset_id}.{table_name}"
-        
-        # Déterminer la disposition d'écriture
-        write_mode_object = bigquery.WriteDisposition.WRITE_APPEND if table_name in TABLE_PRIMARY_KEYS else bigquery.WriteDisposition.WRITE_TRUNCATE
-        
-        write_mode_str = str(write_mode_object) 
-        
-        print(f"\n🔄 Traitement de la table '{table_name}' (Mode: {write_mode_str.split('_')[1]})")
-        
-        try:
-            # A. LECTURE & DÉDUPLICATION
+    # Déterminer la disposition d'écriture
+    write_mode_object = bigquery.WriteDisposition.WRITE_APPEND if table_name in TABLE_PRIMARY_KEYS else bigquery.WriteDisposition.WRITE_TRUNCATE
+    
+    write_mode_str = str(write_mode_object) 
+    
+    print(f"\n🔄 Traitement de la table '{table_name}' (Mode: {write_mode_str.split('_')[1]})")
+    
+    try:
+        # A. LECTURE & DÉDUPLICATION
+        with step('read_dedup'):
             df_to_load = load_parquet_and_deduplicate(
                 gcs_file_path, 
                 table_name, 
@@ -124,33 +303,69 @@ def load_processed_data_to_bigquery(project_id: str, dataset_id: str, gcs_bucket
                 table_id
             )
 
-            if df_to_load.empty:
-                print(f"   ℹ️ Aucune nouvelle ligne à charger pour la table {table_name}. Skip.")
-                continue
+        if df_to_load.empty:
+            print(f"   ℹ️ Aucune nouvelle ligne à charger pour la table {table_name}. Skip.")
+            return False
 
-            # B. CHARGEMENT DANS BIGQUERY
-            job_config = bigquery.LoadJobConfig(
-                write_disposition=write_mode_object, 
-            )
-            
-            # load_table_from_dataframe
-            load_job = client.load_table_from_dataframe(
-                df_to_load, 
-                table_id, 
-                job_config=job_config
-            )
-            
-            print(f"   -> Chargement BQ démarré. Job ID: {load_job.job_id}")
-            load_job.result()
-            
-            print(f"   ✅ Table {table_name} chargée. {load_job.output_rows} lignes écrites.")
-
-        except exceptions.NotFound:
-            print(f"   ❌ Erreur: Le fichier {gcs_file_path} est introuvable. Vérifiez l'étape de transformation.")
-            raise
-        except Exception as e:
-            print(f"   ❌ Échec critique du chargement BQ pour {table_name}: {e}")
-            raise
+        # B. CHARGEMENT DANS BIGQUERY
+        if table_name in DIMENSION_KEYS:
+            # Dimensions : chargement seulement si le contenu a changé
+            return load_dimension_table(df_to_load, table_name, table_id, save_deltas)
+
+        load_job = run_load_job(df_to_load, table_id, write_mode_object)
+        
+        print(f"   ✅ Table {table_name} chargée. {load_job.output_rows} lignes écrites.")
+
+        # C. MISE À JOUR DE L'INDEX DES CLÉS (tables APPEND uniquement)
+        if table_name in TABLE_PRIMARY_KEYS:
+            update_key_index_after_load(table_name, TABLE_PRIMARY_KEYS[table_name], df_to_load, table_id)
+
+        # D. DIFFÉRENTIEL POUR LES CONSOMMATEURS EN AVAL (alertes)
+        if save_deltas and table_name in DELTA_TABLES:
+            save_load_delta(df_to_load, gcs_bucket, get_state_name(table_name, table_id))
+
+        return True
+
+    except exceptions.NotFound:
+        print(f"   ❌ Erreur: Le fichier {gcs_file_path} est introuvable. Vérifiez l'étape de transformation.")
+        raise
+    except Exception as e:
+        print(f"   ❌ Échec critique du chargement BQ pour {table_name}: {e}")
+        raise
+
+def refresh_serving_tables_if_needed(project_id: str, dataset_id: str, tables_changed: bool):
+    """Reconstruit les tables de service si les données ont changé ou si elles n'existent pas encore."""
+    serving_tables_missing = any(
+        get_bq_table_num_rows(f"{project_id}.{dataset_id}.{serving_table}") is None
+        for serving_table in SERVING_TABLES
+    )
+    if tables_changed or serving_tables_missing:
+        refresh_serving_tables(get_bq_client(), project_id, dataset_id)
+    else:
+        print("\nℹ️ Aucune table modifiée : les tables de service sont déjà à jour.")
+
+# --- FONCTION PRINCIPALE DE CHARGEMENT BIGQUERY (MODIFIÉE) ---
+
+def load_processed_data_to_bigquery(project_id: str, dataset_id: str, gcs_bucket: str):
+    """
+    Lit les tables Parquet depuis GCS/processed, les déduplique et les charge dans BigQuery.
+    """
+    if not all([project_id, gcs_bucket, dataset_id]):
+        print("Erreur: Les variables Project ID, Bucket Name ou Dataset ID sont manquantes.")
+        sys.exit(1)
+
+    # 1. Connexion et Vérification du Dataset
+    ensure_dataset(project_id, dataset_id)
+
+    # Indique si au moins une table a été modifiée (pour rafraîchir les tables de service)
+    tables_changed = False
+
+    # 2. Chargement des tables
+    for table_name in PROCESSED_TABLE_NAMES:
+        tables_changed |= load_table(project_id, dataset_id, gcs_bucket, table_name)
+
+    # 3. Tables de service pour l'application
+    refresh_serving_tables_if_needed(project_id, dataset_id, tables_changed)
 
 
 def main():
@@ -0,0 +1,173 @@
+# src/load/serving_tables.py
+
+from typing import TYPE_CHECKING
+from config import CONFORMITE_WINDOW_MONTHS
+# Règle de non-conformité d'un prélèvement (partagée avec le moteur d'alertes)
+from src.etl.conformite import NON_CONFORMITE_SQL
+from src.pipeline.metrics import record_metric
+
+# Les requêtes sont aussi réutilisées par le backend DuckDB de l'application :
+# le client BigQuery n'est qu'une annotation ici, pas un import à l'exécution.
+if TYPE_CHECKING:
+    from google.cloud import bigquery
+
+# Table dénormalisée servie à l'application : dernière analyse de chaque commune
+COMMUNE_LATEST_RESULTS_TABLE = "commune_latest_results"
+# Agrégat de conformité par commune (carte choroplèthe)
+COMMUNE_CONFORMITE_TABLE = "commune_conformite"
+
+# Toutes les tables de service reconstruites par l'étape de chargement
+SERVING_TABLES = [COMMUNE_LATEST_RESULTS_TABLE, COMMUNE_CONFORMITE_TABLE]
+
+# ----------------------------------------------------------------------
+# Requêtes de construction des tables de service
+# ----------------------------------------------------------------------
+
+def get_commune_latest_results_select(project_id: str, dataset_id: str) -> str:
+    """
+    Requête SELECT des lignes prêtes à afficher de la dernière analyse de chaque commune :
+    une ligne par paramètre mesuré lors du prélèvement le plus récent de la commune.
+    """
+    return f"""
+    WITH LatestPrelevement AS (
+        -- 1. Prélèvement le plus récent de chaque commune
+        SELECT
+            code_commune,
+            code_prelevement,
+            date_prelevement,
+            conclusion_conformite_prelevement,
+            conformite_limites_bact_prelevement
+        FROM (
+            SELECT
+                *,
+                ROW_NUMBER() OVER (
+                    PARTITION BY code_commune
+                    ORDER BY date_prelevement DESC, code_prelevement DESC
+                ) AS rang
+            FROM
+                `{project_id}.{dataset_id}.prelevements`
+        )
+        WHERE
+            rang = 1
+    )
+    SELECT
+        lp.code_commune,
+        lp.code_prelevement,
+        lp.date_prelevement,
+        t1.code_parametre,
+        t2.libelle_parametre,
+        COALESCE(t1.resultat_alphanumerique, CAST(t1.resultat_numerique AS STRING)) AS resultat_analyse,
+        t1.resultat_numerique,
+        t2.libelle_unite,
+        t2.limite_qualite_parametre AS limite_qualite_reference,
+        -- Conformité bactériologique du prélèvement (identique sur toutes ses lignes, pas propre au paramètre)
+        lp.conformite_limites_bact_prelevement AS conformite_bact_prelevement,
+        lp.conclusion_conformite_prelevement
+    FROM
+        LatestPrelevement AS lp
+    INNER JOIN
+        `{project_id}.{dataset_id}.resultats_mesures` AS t1
+        ON t1.code_prelevement = lp.code_prelevement
+    LEFT JOIN
+        `{project_id}.{dataset_id}.parametres` AS t2
+        ON t1.code_parametre = t2.code_parametre
+    """
+
+def get_commune_conformite_select(project_id: str, dataset_id: str, window_months: int = CONFORMITE_WINDOW_MONTHS) -> str:
+    """
+    Requête SELECT de l'agrégat de conformité par commune : conclusion du dernier prélèvement,
+    nombre d'analyses et taux de non-conformité sur les `window_months` derniers mois.
+    """
+    window_days = int(window_months * 365 / 12)
+    return f"""
+    WITH Prelevements AS (
+        SELECT
+            code_commune,
+            code_prelevement,
+            date_prelevement,
+            conclusion_conformite_prelevement,
+            {NON_CONFORMITE_SQL} AS est_non_conforme
+        FROM
+            `{project_id}.{dataset_id}.prelevements`
+    ),
+    DernierPrelevement AS (
+        -- 1. Conclusion du prélèvement le plus récent de chaque commune
+        SELECT
+            code_commune,
+            date_prelevement AS date_dernier_prelevement,
+            conclusion_conformite_prelevement AS derniere_conclusion,
+            est_non_conforme AS dernier_non_conforme
+        FROM (
+            SELECT
+                *,
+                ROW_NUMBER() OVER (
+                    PARTITION BY code_commune
+                    ORDER BY date_prelevement DESC, code_prelevement DESC
+                ) AS rang
+            FROM
+                Prelevements
+        )
+        WHERE
+            rang = 1
+    ),
+    Fenetre AS (
+        -- 2. Volume d'analyses et non-conformités sur la fenêtre glissante
+        SELECT
+            code_commune,
+            COUNT(*) AS nb_analyses,
+            SUM(CASE WHEN est_non_conforme THEN 1 ELSE 0 END) AS nb_non_conformes
+        FROM
+            Prelevements
+        WHERE
+            date_prelevement >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL {window_days} DAY)
+        GROUP BY
+            code_commune
+    )
+    SELECT
+        dp.code_commune,
+        dp.date_dernier_prelevement,
+        dp.derniere_conclusion,
+        dp.dernier_non_conforme,
+        COALESCE(f.nb_analyses, 0) AS nb_analyses,
+        COALESCE(f.nb_non_conformes, 0) AS nb_non_conformes,
+        CASE WHEN f.nb_analyses > 0 THEN f.nb_non_conformes / f.nb_analyses END AS taux_non_conformite,
+        {window_months} AS fenetre_mois
+    FROM
+        DernierPrelevement AS dp
+    LEFT JOIN
+        Fenetre AS f
+        ON dp.code_commune = f.code_commune
+    """
+
+# ----------------------------------------------------------------------
+# Rafraîchissement des tables de service
+# ----------------------------------------------------------------------
+
+def refresh_serving_table(client: "bigquery.Client", project_id: str, dataset_id: str, table_name: str, select_query: str):
+    """
+    (Re)construit une table de service à partir de sa requête SELECT, regroupée (CLUSTER BY)
+    par code commune : une lecture pour une commune ne parcourt que quelques blocs de la table.
+    """
+    table_id = f"{project_id}.{dataset_id}.{table_name}"
+    query = f"""
+    CREATE OR REPLACE TABLE `{table_id}`
+    CLUSTER BY code_commune
+    AS
+    {select_query}
+    """
+    print(f"\n🔄 Rafraîchissement de la table de service '{table_name}'...")
+    query_job = client.query(query)
+    query_job.result()
+    record_metric('bq_bytes_processed', query_job.total_bytes_processed, table=table_name, query='serving')
+    print(f"   ✅ Table {table_name} reconstruite.")
+
+def refresh_serving_tables(client: "bigquery.Client", project_id: str, dataset_id: str):
+    """Reconstruit toutes les tables de service lues par l'application Streamlit."""
+    refresh_serving_table(
+        client, project_id, dataset_id, COMMUNE_LATEST_RESULTS_TABLE,
+        get_commune_latest_results_select(project_id, dataset_id)
+    )
+    refresh_serving_table(
+        client, project_id, dataset_id, COMMUNE_CONFORMITE_TABLE,
+        get_commune_conformite_select(project_id, dataset_id)
+    )
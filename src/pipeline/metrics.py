@@ -0,0 +1,172 @@
+# src/pipeline/metrics.py
+
+import json
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+
+# =================================================================
+# MÉTRIQUES STRUCTURÉES DU PIPELINE
+# =================================================================
+# Chaque étape de l'ordonnanceur s'exécute dans un contexte (contextvars) : les modules
+# d'extraction, de transformation et de chargement y ajoutent leurs compteurs sans
+# connaître l'étape qui les appelle. Les événements sont rassemblés dans un rapport JSON
+# enregistré à côté de processed/ (GCS/reports/) pour suivre les tendances d'une exécution à l'autre.
+
+# Compteurs agrégés par étape
+METRIC_NAMES = ['rows_in', 'rows_out', 'bytes_read', 'bytes_written', 'api_pages', 'bq_bytes_processed']
+
+REPORTS_FOLDER = "reports"
+
+# Étape courante (None hors de l'ordonnanceur, ex. module lancé seul)
+_current_stage: ContextVar[Optional[str]] = ContextVar("pipeline_stage", default=None)
+
+_events: List[Dict[str, Any]] = []
+_stage_metrics: Dict[str, Dict[str, Any]] = {}
+_lock = threading.Lock()
+
+# ----------------------------------------------------------------------
+# Mémoire
+# ----------------------------------------------------------------------
+
+def get_peak_rss_mb() -> Optional[float]:
+    """
+    Pic de mémoire résidente du processus (Mo). Les étapes parallèles partageant le processus,
+    la valeur relevée en fin d'étape est le pic atteint jusque-là, toutes étapes confondues.
+    """
+    try:
+        import resource
+    except ImportError:
+        # Windows : module resource indisponible
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux : kilo-octets ; macOS : octets
+    return round(max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+# ----------------------------------------------------------------------
+# Événements et compteurs
+# ----------------------------------------------------------------------
+
+def _get_stage_entry(stage: Optional[str]) -> Dict[str, Any]:
+    name = stage or "hors_etape"
+    if name not in _stage_metrics:
+        _stage_metrics[name] = {**{metric: 0 for metric in METRIC_NAMES}, 'steps': {}}
+    return _stage_metrics[name]
+
+def emit_event(event_type: str, **fields):
+    """Enregistre un événement horodaté, rattaché à l'étape courante."""
+    event = {
+        'ts': datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        'stage': _current_stage.get(),
+        'event': event_type,
+        **fields,
+    }
+    with _lock:
+        _events.append(event)
+
+def record_metric(name: str, value, **fields):
+    """
+    Ajoute `value` au compteur `name` de l'étape courante (rows_in, bytes_written...)
+    et émet l'événement correspondant (les champs supplémentaires précisent la source).
+    """
+    if value is None:
+        return
+    with _lock:
+        entry = _get_stage_entry(_current_stage.get())
+        entry[name] = entry.get(name, 0) + value
+    emit_event("metric", name=name, value=value, **fields)
+
+@contextmanager
+def stage_context(stage: str):
+    """Exécute un bloc comme étape `stage` : durée, pic mémoire et événements de début/fin."""
+    token = _current_stage.set(stage)
+    started_at = time.perf_counter()
+    emit_event("stage_start")
+    status = "error"
+    try:
+        yield
+        status = "ok"
+    finally:
+        duration_s = round(time.perf_counter() - started_at, 3)
+        peak_rss_mb = get_peak_rss_mb()
+        with _lock:
+            entry = _get_stage_entry(stage)
+            entry['wall_time_s'] = duration_s
+            entry['peak_rss_mb'] = peak_rss_mb
+        emit_event("stage_end", status=status, wall_time_s=duration_s, peak_rss_mb=peak_rss_mb)
+        _current_stage.reset(token)
+
+@contextmanager
+def step(name: str):
+    """Chronomètre une sous-étape d'un module (lecture, transformation, écriture...)."""
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration_s = round(time.perf_counter() - started_at, 3)
+        with _lock:
+            steps = _get_stage_entry(_current_stage.get())['steps']
+            steps[name] = round(steps.get(name, 0) + duration_s, 3)
+        emit_event("step", name=name, wall_time_s=duration_s)
+
+def get_stage_metrics(stage: str) -> Dict[str, Any]:
+    """Copie des métriques agrégées d'une étape (renvoyées par un processus de travail)."""
+    with _lock:
+        entry = _get_stage_entry(stage)
+        return {**entry, 'steps': dict(entry['steps'])}
+
+def merge_stage_metrics(stage: str, worker_metrics: Dict[str, Any]):
+    """
+    Ajoute aux métriques d'une étape celles mesurées dans un processus de travail
+    (les contextvars ne traversent pas les processus). Le pic mémoire du processus de
+    travail est conservé séparément de celui du processus principal.
+    """
+    with _lock:
+        entry = _get_stage_entry(stage)
+        for metric in METRIC_NAMES:
+            entry[metric] += worker_metrics.get(metric, 0)
+        for name, duration_s in worker_metrics.get('steps', {}).items():
+            entry['steps'][name] = round(entry['steps'].get(name, 0) + duration_s, 3)
+        entry['worker_peak_rss_mb'] = worker_metrics.get('peak_rss_mb')
+
+# ----------------------------------------------------------------------
+# Rapport d'exécution
+# ----------------------------------------------------------------------
+
+def build_run_report(started_at: datetime, ended_at: datetime, results: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Assemble le rapport JSON de l'exécution : statut et métriques par étape, événements bruts."""
+    with _lock:
+        stages = {
+            name: {**result, **_stage_metrics.get(name, {})}
+            for name, result in results.items()
+        }
+        events = list(_events)
+
+    return {
+        'run_id': uuid.uuid4().hex[:12],
+        'started_at': started_at.isoformat(timespec="seconds"),
+        'ended_at': ended_at.isoformat(timespec="seconds"),
+        'duration_s': round((ended_at - started_at).total_seconds(), 1),
+        'peak_rss_mb': get_peak_rss_mb(),
+        'stages': stages,
+        'events': events,
+    }
+
+def get_report_object_name(started_at: datetime) -> str:
+    return f"{REPORTS_FOLDER}/pipeline_run_{started_at.strftime('%Y%m%d_%H%M%S')}.json"
+
+def save_run_report(report: Dict[str, Any], bucket_name: str, object_name: str):
+    """Enregistre le rapport dans GCS/reports (un fichier par exécution)."""
+    from src.utils.storage import get_storage
+
+    get_storage(bucket_name).write_bytes(
+        object_name,
+        json.dumps(report, ensure_ascii=False, indent=2, default=str).encode('utf-8'),
+        content_type='application/json'
+    )
+    print(f"📊 Rapport d'exécution enregistré : gs://{bucket_name}/{object_name}")
@@ -0,0 +1,92 @@
+# src/pipeline/profiling.py
+
+import cProfile
+import io
+import os
+import pstats
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+from src.pipeline.metrics import emit_event
+
+# =================================================================
+# PROFILAGE OPTIONNEL DES ÉTAPES (CPU + ALLOCATIONS)
+# =================================================================
+# Activé par PIPELINE_PROFILE=1 ou `python main.py --profile`. Pour chaque étape :
+#   <étape>.prof        : profil cProfile (snakeviz, pstats...)
+#   <étape>_cpu.txt     : fonctions les plus coûteuses (temps cumulé)
+#   <étape>_memory.txt  : lignes ayant le plus alloué (tracemalloc) et pic de mémoire tracée
+# cProfile ne suit que le thread qui l'active : le mode profilage exécute les étapes une à une.
+
+PROFILE_ENABLED = os.getenv("PIPELINE_PROFILE", "0") == "1"
+PROFILE_DIR = os.getenv("PIPELINE_PROFILE_DIR", "profiles")
+PROFILE_TOP_N = int(os.getenv("PIPELINE_PROFILE_TOP_N", "25"))
+# Profondeur des piles conservées par tracemalloc (plus profond = plus précis, mais plus lent)
+TRACEMALLOC_FRAMES = 5
+
+def get_profile_run_dir(started_at: datetime) -> str:
+    """Dossier des artefacts de profilage d'une exécution."""
+    return os.path.join(PROFILE_DIR, started_at.strftime('%Y%m%d_%H%M%S'))
+
+def _write_cpu_report(profiler: cProfile.Profile, path: str, top_n: int) -> list:
+    """Écrit les `top_n` fonctions au temps cumulé le plus élevé et retourne un résumé court."""
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream).strip_dirs().sort_stats(pstats.SortKey.CUMULATIVE)
+    stats.print_stats(top_n)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(stream.getvalue())
+
+    # Points chauds en temps propre (hors sous-appels) : là où le temps est réellement passé
+    hotspots = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:5]
+    return [
+        {'function': f"{filename}:{line}({name})", 'self_s': round(tottime, 3), 'cumulative_s': round(cumtime, 3)}
+        for (filename, line, name), (_, _, tottime, cumtime, _) in hotspots
+    ]
+
+def _write_memory_report(snapshot: tracemalloc.Snapshot, peak_bytes: int, path: str, top_n: int) -> list:
+    """Écrit les `top_n` lignes ayant le plus alloué et retourne un résumé court."""
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    ])
+    statistics = snapshot.statistics('lineno')
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"Pic de mémoire tracée : {peak_bytes / 1024 / 1024:.1f} Mo\n\n")
+        for stat in statistics[:top_n]:
+            f.write(f"{stat}\n")
+
+    return [
+        {'line': str(stat.traceback[0]), 'size_mb': round(stat.size / 1024 / 1024, 2)}
+        for stat in statistics[:5]
+    ]
+
+@contextmanager
+def profile_stage(stage: str, output_dir: str, top_n: int = PROFILE_TOP_N):
+    """Profile un bloc (CPU et allocations) et écrit ses artefacts dans `output_dir`."""
+    os.makedirs(output_dir, exist_ok=True)
+    profiler = cProfile.Profile()
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+    tracemalloc.reset_peak()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        profiler.dump_stats(os.path.join(output_dir, f"{stage}.prof"))
+        cpu_hotspots = _write_cpu_report(profiler, os.path.join(output_dir, f"{stage}_cpu.txt"), top_n)
+        memory_hotspots = _write_memory_report(snapshot, peak_bytes, os.path.join(output_dir, f"{stage}_memory.txt"), top_n)
+
+        emit_event(
+            "profile",
+            peak_traced_mb=round(peak_bytes / 1024 / 1024, 1),
+            cpu_hotspots=cpu_hotspots,
+            memory_hotspots=memory_hotspots,
+        )
+        print(f"🔬 [{stage}] Profil écrit dans {output_dir} (pic mémoire tracée : {peak_bytes / 1024 / 1024:.1f} Mo)")
+        for hotspot in cpu_hotspots:
+            print(f"      {hotspot['self_s']:>8.3f} s  {hotspot['function']}")
@@ -0,0 +1,258 @@
+# src/pipeline/scheduler.py
+
+import multiprocessing
+import os
+import time
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
+
+from config import GCS_BUCKET_NAME, GCP_PROJECT_ID, BQ_DATASET_ID
+from src.pipeline.metrics import stage_context, get_stage_metrics, merge_stage_metrics
+from src.pipeline.profiling import profile_stage
+
+# =================================================================
+# ORDONNANCEUR DES ÉTAPES DU PIPELINE (graphe de dépendances)
+# =================================================================
+# Une étape est décrite par un dictionnaire :
+#   'run'           : fonction sans argument exécutant l'étape
+#   'depends_on'    : étapes devant être terminées avant celle-ci
+#   'inputs'        : ressources lues     ("gs:<préfixe d'objet>" ou "bq:<table>")
+#   'outputs'       : ressources produites (même format)
+#   'max_age_hours' : (optionnel) âge maximal des sorties avant réexécution
+#   'retries'       : (optionnel) nombre de nouvelles tentatives en cas d'échec
+#   'process'       : (optionnel) True pour une étape limitée par le CPU, exécutée dans un
+#                     processus de travail ('run' doit alors être importable : fonction de module ou partial)
+# Une étape est ignorée si ses sorties existent, sont plus récentes que ses entrées
+# et plus jeunes que max_age_hours ; les étapes indépendantes s'exécutent en parallèle.
+
+STATUS_SUCCESS = "succès"
+STATUS_UP_TO_DATE = "à jour"
+STATUS_FAILED = "échec"
+STATUS_BLOCKED = "bloqué"
+
+DEFAULT_MAX_WORKERS = 4
+# Processus de travail pour les étapes 'process' (transformations) : le total croît avec les cœurs
+DEFAULT_PROCESS_WORKERS = int(os.getenv("PIPELINE_PROCESS_WORKERS", str(os.cpu_count() or 1)))
+
+# ----------------------------------------------------------------------
+# Date de dernière modification des ressources
+# ----------------------------------------------------------------------
+
+@lru_cache(maxsize=None)
+def _get_bq_client():
+    from google.cloud import bigquery
+    return bigquery.Client(project=GCP_PROJECT_ID)
+
+def get_resource_mtime(resource: str) -> Optional[float]:
+    """
+    Retourne la date de dernière modification (timestamp) d'une ressource, ou None si elle n'existe pas.
+    - "gs:<préfixe>" : objet le plus récent du bucket dont le nom commence par le préfixe
+    - "bq:<table>"   : date de modification de la table du dataset du pipeline
+    - "bq:<dataset>.<table>" : idem pour un autre dataset (territoires)
+    """
+    kind, _, name = resource.partition(":")
+
+    if kind == "gs":
+        from src.utils.storage import get_storage
+        updates = [o['updated'] for o in get_storage(GCS_BUCKET_NAME).list_objects(name)]
+        return max(updates) if updates else None
+
+    if kind == "bq":
+        from google.api_core import exceptions
+        try:
+            table_ref = name if "." in name else f"{BQ_DATASET_ID}.{name}"
+            return _get_bq_client().get_table(f"{GCP_PROJECT_ID}.{table_ref}").modified.timestamp()
+        except exceptions.NotFound:
+            return None
+
+    raise ValueError(f"Type de ressource inconnu : '{resource}' (attendu 'gs:' ou 'bq:').")
+
+def is_stage_up_to_date(stage: Dict[str, Any]) -> Tuple[bool, str]:
+    """Indique si les sorties d'une étape sont à jour, avec la raison de la décision."""
+    outputs = stage.get('outputs', [])
+    if not outputs:
+        return False, "aucune sortie déclarée"
+
+    output_mtimes = {resource: get_resource_mtime(resource) for resource in outputs}
+    missing = [resource for resource, mtime in output_mtimes.items() if mtime is None]
+    if missing:
+        return False, f"sortie absente : {', '.join(missing)}"
+    oldest_output = min(output_mtimes.values())
+
+    max_age_hours = stage.get('max_age_hours')
+    if max_age_hours is not None and time.time() - oldest_output > max_age_hours * 3600:
+        return False, f"sorties plus anciennes que {max_age_hours} h"
+
+    for resource in stage.get('inputs', []):
+        input_mtime = get_resource_mtime(resource)
+        if input_mtime is not None and input_mtime > oldest_output:
+            return False, f"entrée plus récente que les sorties : {resource}"
+
+    return True, "sorties à jour"
+
+# ----------------------------------------------------------------------
+# Exécution d'une étape
+# ----------------------------------------------------------------------
+
+def run_module_function(module_name: str, function_name: str, *args):
+    """
+    Importe `module_name` et appelle `function_name(*args)`. Sert de 'run' aux étapes 'process' :
+    partial(run_module_function, ...) se transmet à un processus "spawn" sans importer le module
+    (ni ses dépendances lourdes) dans le processus principal.
+    """
+    import importlib
+    return getattr(importlib.import_module(module_name), function_name)(*args)
+
+def _run_in_worker_process(name: str, run) -> Dict[str, Any]:
+    """Point d'entrée d'un processus de travail : exécute l'étape et renvoie ses métriques."""
+    with stage_context(name):
+        run()
+    return get_stage_metrics(name)
+
+def run_stage(name: str, stage: Dict[str, Any], force: bool, profile_dir: Optional[str] = None,
+              process_pool: Optional[ProcessPoolExecutor] = None) -> str:
+    """
+    Exécute une étape dans son contexte de métriques (durée, mémoire, compteurs des modules),
+    et sous profilage CPU / allocations si `profile_dir` est fourni.
+    """
+    profiler = profile_stage(name, profile_dir) if profile_dir else nullcontext()
+    with stage_context(name), profiler:
+        return _run_stage(name, stage, force, process_pool)
+
+def _call_stage(name: str, stage: Dict[str, Any], process_pool: Optional[ProcessPoolExecutor]):
+    """Appelle la fonction de l'étape, dans le pool de processus pour les étapes 'process'."""
+    if stage.get('process') and process_pool is not None:
+        merge_stage_metrics(name, process_pool.submit(_run_in_worker_process, name, stage['run']).result())
+    else:
+        stage['run']()
+
+def _run_stage(name: str, stage: Dict[str, Any], force: bool, process_pool: Optional[ProcessPoolExecutor] = None) -> str:
+    """
+    Exécute une étape (sauf si ses sorties sont à jour) avec ses nouvelles tentatives.
+    Les sys.exit des modules ETL sont convertis en échec de l'étape, sans arrêter le pipeline.
+    """
+    if not force:
+        try:
+            up_to_date, reason = is_stage_up_to_date(stage)
+        except Exception as e:
+            up_to_date, reason = False, f"état des sorties inconnu ({e})"
+        if up_to_date:
+            print(f"⏭️  [{name}] Ignorée : {reason}.")
+            return STATUS_UP_TO_DATE
+        print(f"▶️  [{name}] Exécution : {reason}.")
+    else:
+        print(f"▶️  [{name}] Exécution forcée.")
+
+    attempts = stage.get('retries', 0) + 1
+    for attempt in range(1, attempts + 1):
+        try:
+            _call_stage(name, stage, process_pool)
+            return STATUS_SUCCESS
+        except SystemExit as e:
+            error = RuntimeError(f"arrêt de l'étape (code {e.code})")
+        except Exception as e:
+            error = e
+
+        if attempt < attempts:
+            print(f"⚠️  [{name}] Tentative {attempt}/{attempts} échouée : {error}. Nouvelle tentative...")
+
+    raise error
+
+# ----------------------------------------------------------------------
+# Ordonnancement
+# ----------------------------------------------------------------------
+
+def select_stages(stages: Dict[str, Dict[str, Any]], names: Optional[List[str]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Restreint le graphe aux étapes demandées : les dépendances hors sélection sont
+    considérées comme satisfaites (reprise d'une étape en échec sans refaire le reste).
+    """
+    if not names:
+        return stages
+
+    unknown = [name for name in names if name not in stages]
+    if unknown:
+        raise ValueError(f"Étapes inconnues : {', '.join(unknown)}. Étapes disponibles : {', '.join(stages)}.")
+
+    return {
+        name: {**stage, 'depends_on': [dep for dep in stage.get('depends_on', []) if dep in names]}
+        for name, stage in stages.items() if name in names
+    }
+
+def run_stages(stages: Dict[str, Dict[str, Any]], names: Optional[List[str]] = None,
+               force: bool = False, max_workers: int = DEFAULT_MAX_WORKERS,
+               profile_dir: Optional[str] = None,
+               process_workers: int = DEFAULT_PROCESS_WORKERS) -> Dict[str, Dict[str, Any]]:
+    """
+    Exécute le graphe d'étapes : chaque étape démarre dès que ses dépendances sont terminées,
+    les étapes indépendantes tournent en parallèle. Un échec bloque uniquement les étapes en aval.
+    Les étapes 'process' s'exécutent dans un pool de `process_workers` processus.
+    Avec `profile_dir`, les étapes sont profilées et exécutées une à une dans le processus
+    principal (profils non mélangés).
+    Retourne {étape: {'status', 'duration_s', 'error'}}.
+    """
+    stages = select_stages(stages, names)
+    use_process_pool = not profile_dir and any(stage.get('process') for stage in stages.values())
+    if profile_dir:
+        max_workers = 1
+    elif use_process_pool:
+        # Un thread attend chaque étape 'process' en cours : les étapes d'E/S gardent leurs max_workers threads
+        max_workers += process_workers
+    results: Dict[str, Dict[str, Any]] = {}
+    pending = dict(stages)
+    running = {}
+
+    # "spawn" : pas de fork d'un processus multi-thread (verrous des clients Google Cloud)
+    process_pool = ProcessPoolExecutor(
+        max_workers=process_workers, mp_context=multiprocessing.get_context("spawn")
+    ) if use_process_pool else None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor, (process_pool or nullcontext()):
+        while pending or running:
+            # 1. Étapes bloquées par l'échec d'une dépendance
+            for name, stage in list(pending.items()):
+                failed_deps = [
+                    dep for dep in stage.get('depends_on', [])
+                    if results.get(dep, {}).get('status') in (STATUS_FAILED, STATUS_BLOCKED)
+                ]
+                if failed_deps:
+                    print(f"⛔ [{name}] Bloquée par : {', '.join(failed_deps)}.")
+                    results[name] = {'status': STATUS_BLOCKED, 'duration_s': 0.0, 'error': None}
+                    del pending[name]
+
+            # 2. Lancement des étapes dont toutes les dépendances sont terminées
+            for name, stage in list(pending.items()):
+                if all(dep in results for dep in stage.get('depends_on', [])):
+                    future = executor.submit(run_stage, name, stage, force, profile_dir, process_pool)
+                    running[future] = (name, time.perf_counter())
+                    del pending[name]
+
+            if not running:
+                if pending:
+                    raise ValueError(f"Dépendances circulaires entre : {', '.join(pending)}.")
+                break
+
+            # 3. Attente de la fin d'au moins une étape
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, started_at = running.pop(future)
+                duration = round(time.perf_counter() - started_at, 1)
+                try:
+                    results[name] = {'status': future.result(), 'duration_s': duration, 'error': None}
+                    print(f"✅ [{name}] Terminée ({results[name]['status']}, {duration} s).")
+                except Exception as e:
+                    results[name] = {'status': STATUS_FAILED, 'duration_s': duration, 'error': str(e)}
+                    print(f"❌ [{name}] Échec après {duration} s : {e}")
+
+    return results
+
+def print_run_summary(results: Dict[str, Dict[str, Any]]):
+    """Affiche le bilan de l'exécution, étape par étape."""
+    print("\n---------------------------------------------------------")
+    print("📋 Bilan des étapes")
+    for name, result in results.items():
+        error = f" — {result['error']}" if result['error'] else ""
+        print(f"   {name:<28} {result['status']:<8} {result['duration_s']:>7} s{error}")
+    print("---------------------------------------------------------")
@@ -0,0 +1,68 @@
+# src/pipeline/territories.py
+
+import os
+from typing import Dict, Any, List
+
+from config import BQ_DATASET_ID
+
+# =================================================================
+# TERRITOIRES COUVERTS PAR LE PIPELINE
+# =================================================================
+# Un territoire est décrit par :
+#   'departements' : départements à extraire de l'API Hubeau (extraction partagée entre territoires)
+#   'moa'          : (optionnel) critère de maîtrise d'ouvrage sélectionnant les communes
+#   'communes'     : (optionnel) liste explicite de codes INSEE
+# Sans 'moa' ni 'communes', toutes les communes des départements sont retenues.
+# La MEL (territoire historique) conserve processed/ et le dataset BQ_DATASET_ID ;
+# les autres territoires écrivent dans processed/<slug>/ et le dataset eau_potable_<slug>.
+
+DEFAULT_TERRITORY = "mel"
+
+TERRITORIES: Dict[str, Dict[str, Any]] = {
+    'mel': {
+        'departements': ['59'],
+        'moa': "MEL - MÉTROPOLE EUROP. DE LILLE",
+    },
+    'hauts_de_france': {
+        'departements': ['02', '59', '60', '62', '80'],
+    },
+}
+
+# Territoires traités par défaut (liste séparée par des virgules)
+PIPELINE_TERRITORIES = [
+    slug.strip() for slug in os.getenv("PIPELINE_TERRITORIES", DEFAULT_TERRITORY).split(",") if slug.strip()
+]
+
+# ----------------------------------------------------------------------
+# Emplacements des sorties
+# ----------------------------------------------------------------------
+
+def get_territory(slug: str) -> Dict[str, Any]:
+    if slug not in TERRITORIES:
+        raise ValueError(f"Territoire inconnu : '{slug}'. Territoires disponibles : {', '.join(TERRITORIES)}.")
+    return TERRITORIES[slug]
+
+def get_processed_prefix(slug: str) -> str:
+    """Dossier GCS des tables normalisées d'un territoire."""
+    return "processed" if slug == DEFAULT_TERRITORY else f"processed/{slug}"
+
+def get_bq_dataset(slug: str) -> str:
+    """Dataset BigQuery d'un territoire."""
+    return BQ_DATASET_ID if slug == DEFAULT_TERRITORY else f"eau_potable_{slug}"
+
+def get_state_name(table_name: str, bq_table_id: str) -> str:
+    """
+    Nom sous lequel l'état de chargement d'une table (index des clés, hashes de lignes,
+    différentiels) est conservé sur GCS : le nom de la table pour le dataset historique,
+    préfixé par le dataset pour les autres territoires (une même table existe dans plusieurs datasets).
+    """
+    dataset_id = bq_table_id.split(".")[-2]
+    return table_name if dataset_id == BQ_DATASET_ID else f"{dataset_id}/{table_name}"
+
+def get_raw_folder(code_departement: str) -> str:
+    """Dossier GCS des extractions brutes d'un département (partagées par tous les territoires)."""
+    return f"raw/{code_departement}"
+
+def get_departements(slugs: List[str]) -> List[str]:
+    """Départements à extraire pour un ensemble de territoires (chacun une seule fois)."""
+    return sorted({dep for slug in slugs for dep in get_territory(slug)['departements']})
@@ -0,0 +1,310 @@
+# src/twitter/post_tweet.py
+
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import io
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.etl.conformite import is_prelevement_non_conforme, find_depassements
+from src.load.deltas import list_load_deltas, read_load_deltas, delete_load_deltas
+from src.load.key_index import is_key_in_index, merge_key_index
+from src.pipeline.metrics import record_metric, step
+from src.pipeline.territories import DEFAULT_TERRITORY, get_processed_prefix, get_bq_dataset, get_state_name
+from src.utils.storage import get_storage
+
+# Importation des variables d'environnement de la configuration
+try:
+    from config import GCS_BUCKET_NAME, GCP_PROJECT_ID
+except ImportError:
+    print("Erreur critique: Impossible d'importer les variables de configuration.")
+    sys.exit(1)
+
+# =================================================================
+# ALERTES DE NON-CONFORMITÉ (diffusion via X)
+# =================================================================
+# Après chaque chargement, seules les lignes nouvellement chargées (GCS/deltas/) sont analysées :
+# prélèvements non conformes et mesures au-delà de la limite de qualité du paramètre.
+# Les prélèvements déjà signalés sont mémorisés (GCS/alerts/, index trié comme les index de clés)
+# et les messages partent par lots espacés, via un diffuseur interchangeable.
+
+ALERTS_FOLDER = "alerts"
+
+# Diffuseur : "file" (fichier JSON Lines local, pour les essais) ou "x" (API X)
+ALERT_PUBLISHER = os.getenv("ALERT_PUBLISHER", "file")
+ALERTS_OUTBOX_PATH = os.getenv("ALERTS_OUTBOX_PATH", os.path.join("data", "alerts_outbox.jsonl"))
+
+# Limitation du débit : lots de ALERT_BATCH_SIZE messages espacés de ALERT_BATCH_INTERVAL_S,
+# au plus ALERT_MAX_PER_RUN messages par exécution (le reste part à l'exécution suivante)
+ALERT_BATCH_SIZE = int(os.getenv("ALERT_BATCH_SIZE", "5"))
+ALERT_BATCH_INTERVAL_S = float(os.getenv("ALERT_BATCH_INTERVAL_S", "60"))
+ALERT_MAX_PER_RUN = int(os.getenv("ALERT_MAX_PER_RUN", "15"))
+
+MAX_MESSAGE_LENGTH = 280
+X_API_URL = "https://api.x.com/2/tweets"
+
+# ----------------------------------------------------------------------
+# Prélèvements déjà signalés (GCS/alerts)
+# ----------------------------------------------------------------------
+
+def get_alerted_path(state_name: str) -> str:
+    return f"{ALERTS_FOLDER}/{state_name}_keys.parquet"
+
+def load_alerted_keys(bucket_name: str, state_name: str) -> Optional[np.ndarray]:
+    """Charge l'index trié des prélèvements déjà signalés. Retourne None à la première exécution."""
+    try:
+        data = get_storage(bucket_name).read_bytes(get_alerted_path(state_name))
+    except FileNotFoundError:
+        return None
+    return pq.read_table(io.BytesIO(data)).column('key').to_numpy(zero_copy_only=False).astype(object)
+
+def save_alerted_keys(keys: np.ndarray, bucket_name: str, state_name: str):
+    buffer = io.BytesIO()
+    pq.write_table(pa.table({'key': pa.array(keys, type=pa.string())}), buffer, compression='zstd')
+    get_storage(bucket_name).write_bytes(get_alerted_path(state_name), buffer.getvalue())
+
+# ----------------------------------------------------------------------
+# Détection sur le différentiel
+# ----------------------------------------------------------------------
+
+def read_processed_table(bucket_name: str, processed_prefix: str, table_name: str, filters=None) -> pd.DataFrame:
+    """Lit une table normalisée de GCS/processed (dimensions de petite taille ou lignes filtrées)."""
+    data = get_storage(bucket_name).read_bytes(f"{processed_prefix}/{table_name}.parquet")
+    return pq.read_table(io.BytesIO(data), filters=filters).to_pandas()
+
+def detect_alerts(df_prelevements: pd.DataFrame, df_depassements: pd.DataFrame) -> pd.DataFrame:
+    """
+    Regroupe par prélèvement les non-conformités détectées sur le différentiel.
+    `df_prelevements` contient les informations (commune, date, conclusion) de tous les
+    prélèvements concernés. Retourne une ligne par prélèvement à signaler.
+    """
+    non_conformes = df_prelevements[is_prelevement_non_conforme(df_prelevements)]
+    codes = pd.Index(non_conformes['code_prelevement']).union(df_depassements['code_prelevement'].unique())
+    if codes.empty:
+        return pd.DataFrame(columns=['code_prelevement', 'code_commune', 'date_prelevement',
+                                     'conclusion_conformite_prelevement', 'depassements'])
+
+    descriptions = pd.Series(dtype=object)
+    if not df_depassements.empty:
+        descriptions = df_depassements.assign(
+            description=(
+                df_depassements['libelle_parametre'].astype(str) + " : "
+                + df_depassements['resultat_numerique'].map("{:g}".format) + " "
+                + df_depassements['libelle_unite'].fillna("").astype(str)
+                + " (limite " + df_depassements['limite_qualite_parametre'].astype(str) + ")"
+            )
+        ).groupby('code_prelevement')['description'].agg(list)
+
+    info_cols = ['code_prelevement', 'code_commune', 'date_prelevement', 'conclusion_conformite_prelevement']
+    df_alerts = (
+        df_prelevements[info_cols]
+        .drop_duplicates(subset=['code_prelevement'], keep='last')
+        .set_index('code_prelevement')
+        .reindex(codes)
+    )
+    df_alerts['depassements'] = descriptions.reindex(codes)
+    df_alerts['depassements'] = df_alerts['depassements'].apply(lambda value: value if isinstance(value, list) else [])
+    return df_alerts.rename_axis('code_prelevement').reset_index().sort_values('date_prelevement', na_position='first')
+
+def format_alert_message(alert: Dict, nom_commune: Optional[str]) -> str:
+    """Message d'alerte (au plus MAX_MESSAGE_LENGTH caractères)."""
+    code_commune = alert.get('code_commune')
+    commune = nom_commune or (code_commune if pd.notna(code_commune) else "commune inconnue")
+    date = pd.to_datetime(alert.get('date_prelevement'), utc=True, errors='coerce')
+    date_label = f" du {date.strftime('%d/%m/%Y')}" if not pd.isna(date) else ""
+    lines = [f"⚠️ Eau potable – {commune} : prélèvement{date_label} non conforme."]
+    if alert['depassements']:
+        lines.extend(f"• {description}" for description in alert['depassements'])
+    elif pd.notna(alert.get('conclusion_conformite_prelevement')):
+        lines.append(str(alert['conclusion_conformite_prelevement']))
+
+    message = "\n".join(lines)
+    if len(message) > MAX_MESSAGE_LENGTH:
+        message = message[:MAX_MESSAGE_LENGTH - 1].rstrip() + "…"
+    return message
+
+# ----------------------------------------------------------------------
+# Diffuseurs
+# ----------------------------------------------------------------------
+
+def publish_to_file(message: str):
+    """Ajoute le message au fichier JSON Lines ALERTS_OUTBOX_PATH (essais, sans diffusion)."""
+    os.makedirs(os.path.dirname(ALERTS_OUTBOX_PATH) or ".", exist_ok=True)
+    with open(ALERTS_OUTBOX_PATH, "a", encoding="utf-8") as f:
+        record = {'published_at': datetime.now(timezone.utc).isoformat(timespec="seconds"), 'message': message}
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+def publish_to_x(message: str):
+    """Publie le message sur X (API v2, jeton utilisateur OAuth 2.0 avec la portée tweet.write)."""
+    import requests
+
+    token = os.getenv("X_USER_ACCESS_TOKEN")
+    if not token:
+        raise RuntimeError("La variable d'environnement X_USER_ACCESS_TOKEN n'est pas définie.")
+
+    response = requests.post(
+        X_API_URL,
+        headers={'Authorization': f"Bearer {token}"},
+        json={'text': message},
+        timeout=30,
+    )
+    response.raise_for_status()
+
+PUBLISHERS: Dict[str, Callable[[str], None]] = {
+    'file': publish_to_file,
+    'x': publish_to_x,
+}
+
+# Diffuseurs d'essai : les messages sont écrits mais l'état (prélèvements signalés, différentiels)
+# n'est pas modifié, pour qu'un essai n'empêche jamais la publication réelle d'une alerte
+DRY_RUN_PUBLISHERS = {'file'}
+
+def publish_in_batches(messages: List[str], keys: List[str], publish: Callable[[str], None],
+                       on_batch_published: Callable[[List[str]], None]) -> int:
+    """
+    Publie au plus ALERT_MAX_PER_RUN messages, par lots de ALERT_BATCH_SIZE espacés de
+    ALERT_BATCH_INTERVAL_S. Après chaque lot, `on_batch_published` reçoit les clés publiées
+    (une erreur de diffusion n'entraîne donc jamais de doublon à la reprise).
+    Retourne le nombre de messages publiés.
+    """
+    limit = min(len(messages), ALERT_MAX_PER_RUN)
+    published = 0
+    for start in range(0, limit, ALERT_BATCH_SIZE):
+        if start > 0:
+            time.sleep(ALERT_BATCH_INTERVAL_S)
+        end = min(start + ALERT_BATCH_SIZE, limit)
+        batch_keys = []
+        try:
+            for message, key in zip(messages[start:end], keys[start:end]):
+                publish(message)
+                batch_keys.append(key)
+        finally:
+            if batch_keys:
+                on_batch_published(batch_keys)
+                published += len(batch_keys)
+    return published
+
+# ----------------------------------------------------------------------
+# Orchestrateur
+# ----------------------------------------------------------------------
+
+def run_alerts(territory_slug: str = DEFAULT_TERRITORY, publisher_name: str = ALERT_PUBLISHER):
+    """
+    Détecte les non-conformités des lignes chargées depuis la dernière exécution, écarte les
+    prélèvements déjà signalés et publie les nouvelles alertes par lots.
+    À la première exécution (aucun historique de signalement), les prélèvements détectés sont
+    enregistrés sans être publiés, pour ne pas diffuser tout l'historique.
+    Avec un diffuseur d'essai (DRY_RUN_PUBLISHERS), les alertes sont écrites sans enregistrer
+    les prélèvements signalés ni supprimer les différentiels.
+    """
+    if publisher_name not in PUBLISHERS:
+        raise ValueError(f"Diffuseur inconnu : '{publisher_name}'. Diffuseurs disponibles : {', '.join(PUBLISHERS)}.")
+    dry_run = publisher_name in DRY_RUN_PUBLISHERS
+
+    dataset_id = get_bq_dataset(territory_slug)
+    processed_prefix = get_processed_prefix(territory_slug)
+
+    def state_name(table_name: str) -> str:
+        return get_state_name(table_name, f"{GCP_PROJECT_ID}.{dataset_id}.{table_name}")
+
+    print(f"\n--- Alertes de non-conformité ({territory_slug}) ---")
+    if dry_run:
+        print(f"   ℹ️ Diffuseur d'essai '{publisher_name}' : état des signalements inchangé.")
+
+    # 1. Différentiels en attente (lignes chargées depuis la dernière exécution)
+    prelevements_paths = list_load_deltas(GCS_BUCKET_NAME, state_name('prelevements'))
+    mesures_paths = list_load_deltas(GCS_BUCKET_NAME, state_name('resultats_mesures'))
+    if not prelevements_paths and not mesures_paths:
+        print("   ℹ️ Aucun nouveau chargement depuis la dernière analyse. Skip.")
+        return
+
+    with step('read_deltas'):
+        df_prelevements = read_load_deltas(GCS_BUCKET_NAME, prelevements_paths)
+        df_mesures = read_load_deltas(GCS_BUCKET_NAME, mesures_paths)
+    record_metric('rows_in', sum(len(df) for df in (df_prelevements, df_mesures) if df is not None), table='deltas')
+    print(f"   -> Différentiel : {0 if df_prelevements is None else len(df_prelevements)} prélèvements, "
+          f"{0 if df_mesures is None else len(df_mesures)} mesures.")
+
+    # 2. Détection (coût proportionnel au différentiel : seules les dimensions sont lues en entier)
+    with step('detect'):
+        df_depassements = pd.DataFrame(columns=['code_prelevement'])
+        if df_mesures is not None:
+            df_parametres = read_processed_table(GCS_BUCKET_NAME, processed_prefix, 'parametres')
+            df_depassements = find_depassements(df_mesures, df_parametres)
+
+        # Informations des prélèvements en dépassement absents du différentiel des prélèvements
+        known_codes = set() if df_prelevements is None else set(df_prelevements['code_prelevement'])
+        missing_codes = sorted(set(df_depassements['code_prelevement']) - known_codes)
+        frames = [df for df in (df_prelevements,) if df is not None]
+        if missing_codes:
+            frames.append(read_processed_table(
+                GCS_BUCKET_NAME, processed_prefix, 'prelevements', filters=[('code_prelevement', 'in', missing_codes)]
+            ))
+        df_info = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(
+            columns=['code_prelevement', 'code_commune', 'date_prelevement',
+                     'conclusion_conformite_prelevement', 'conformite_limites_bact_prelevement']
+        )
+        df_alerts = detect_alerts(df_info, df_depassements)
+
+    # 3. Déduplication avec les prélèvements déjà signalés
+    alerted_state = state_name('prelevements')
+    alerted_keys = load_alerted_keys(GCS_BUCKET_NAME, alerted_state)
+    alert_keys = df_alerts['code_prelevement'].astype(str).to_numpy(dtype=object)
+
+    if alerted_keys is None and dry_run:
+        alerted_keys = np.array([], dtype=object)
+    elif alerted_keys is None:
+        save_alerted_keys(merge_key_index(None, alert_keys), GCS_BUCKET_NAME, alerted_state)
+        delete_load_deltas(GCS_BUCKET_NAME, prelevements_paths + mesures_paths)
+        print(f"   ℹ️ Première exécution : {len(alert_keys)} prélèvements non conformes de l'historique "
+              "enregistrés comme déjà signalés (aucune publication).")
+        return
+
+    df_alerts = df_alerts[~is_key_in_index(alert_keys, alerted_keys)]
+    print(f"   -> {len(df_alerts)} nouvelle(s) alerte(s) à publier.")
+
+    # 4. Publication par lots
+    if not df_alerts.empty:
+        df_communes = read_processed_table(GCS_BUCKET_NAME, processed_prefix, 'communes_reseau')
+        noms_communes = df_communes.drop_duplicates(subset=['code_commune']).set_index('code_commune')['nom_commune']
+        alerts = df_alerts.to_dict('records')
+        messages = [format_alert_message(alert, noms_communes.get(alert['code_commune'])) for alert in alerts]
+        keys = [str(alert['code_prelevement']) for alert in alerts]
+
+        def mark_alerted(published_keys: List[str]):
+            nonlocal alerted_keys
+            if dry_run:
+                return
+            alerted_keys = merge_key_index(alerted_keys, np.array(published_keys, dtype=object))
+            save_alerted_keys(alerted_keys, GCS_BUCKET_NAME, alerted_state)
+
+        with step('publish'):
+            published = publish_in_batches(messages, keys, PUBLISHERS[publisher_name], mark_alerted)
+        record_metric('rows_out', published, publisher=publisher_name)
+        print(f"   ✅ {published} alerte(s) publiée(s) via '{publisher_name}'.")
+
+        if published < len(messages):
+            # Limite par exécution atteinte : les différentiels sont conservés pour l'exécution suivante
+            print(f"   ⏳ {len(messages) - published} alerte(s) reportée(s) à la prochaine exécution.")
+            return
+
+    if dry_run:
+        return
+    delete_load_deltas(GCS_BUCKET_NAME, prelevements_paths + mesures_paths)
+
+
+def main():
+    """
+    Point d'entrée principal du module d'alertes.
+    """
+    run_alerts()
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,26 @@
 # src/utils/data_loader.py (VERSION ADAPTÉE AU DÉPLOIEMENT STREAMLIT CLOUD)
 
 import streamlit as st
+import io
 import json
-import geopandas as gpd
 import pandas as pd
+import numpy as np
+import pyarrow.parquet as pq
+import unicodedata
 import os
-from google.cloud import storage, bigquery
-from typing import Dict, Any, List
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import Dict, Any, List, Callable, Tuple, TYPE_CHECKING
+
+# geopandas, shapely et les clients Google Cloud sont importés à la première utilisation :
+# une page qui n'en a pas besoin (ou un rendu servi par le cache) ne paie pas leur chargement.
+if TYPE_CHECKING:
+    import geopandas as gpd
+    import pyarrow as pa
+
+from src.utils.query_cache import make_cache_key, get_cached_table, put_cached_table, get_cache_stats
+from src.utils.duckdb_backend import create_duckdb_connection, run_duckdb_query, sync_processed_tables
+from src.utils.storage import STORAGE_BACKEND, create_storage, get_storage_cache_stats
 
 # =================================================================
 # 1. CONFIGURATION (Utilisation des secrets Streamlit)
@@ -17,9 +31,45 @@ from typing import Dict, Any, List
 GCP_PROJECT_ID = "qualite-eau-473812"
 GCS_BUCKET_NAME = "qualite_eau"
 GEOJSON_OBJECT_NAME = "Geojson/communes_filtrees.geojson"
+# Variantes simplifiées et quantifiées produites par src/etl/prepare_geojson.py
+# ("complet" correspond au GeoJSON pleine résolution)
+GEOJSON_LEVELS = ["moyen", "fin", "grossier", "complet"]
+DEFAULT_GEOJSON_LEVEL = "moyen"
+# Séries temporelles : nombre maximal de points renvoyés au navigateur, et granularités
+# d'agrégation possibles (unité TIMESTAMP_TRUNC -> durée approximative en jours)
+TIMESERIES_MAX_POINTS = 400
+TIMESERIES_BUCKETS = {"DAY": 1, "WEEK": 7, "MONTH": 30, "QUARTER": 91, "YEAR": 365}
+# Les semaines BigQuery commencent le dimanche : semaines ISO (lundi), comme date_trunc('week') de DuckDB
+TIMESERIES_TRUNC_UNITS = {"WEEK": "WEEK(MONDAY)"}
+# Fichier local de géocodage (colonnes : adresse, longitude, latitude), ex. extrait de la Base Adresse Nationale
+ADDRESS_LOOKUP_PATH = os.getenv("ADDRESS_LOOKUP_PATH", "data/adresses_mel.csv")
+# Nombre minimal de lettres/chiffres de l'adresse saisie : en deçà (saisie vide, espaces ou ponctuation seule),
+# la recherche par inclusion correspondrait à presque toutes les adresses
+GEOCODE_MIN_QUERY_LENGTH = 3
 BIGQUERY_DATASET_ID = "eau_potable_mel"
+# Table de service dénormalisée (dernière analyse par commune), construite par l'étape de chargement
+COMMUNE_LATEST_RESULTS_TABLE = "commune_latest_results"
+# Agrégat de conformité par commune (carte choroplèthe), construit par l'étape de chargement
+COMMUNE_CONFORMITE_TABLE = "commune_conformite"
+# Cube paramètres x communes x mois (page d'analyse), produit par l'étape de transformation
+CUBE_PARAMETRES_TABLE = "cube_parametres"
 # Le chemin GCP_KEY_FILE_PATH est retiré
 
+# Moteur de requêtes : "bigquery" (par défaut) ou "duckdb" (moteur embarqué sur les Parquet de GCS/processed)
+DATA_BACKEND = os.getenv("DATA_BACKEND", "bigquery").lower()
+# Copie locale du bucket (même arborescence : processed/, Geojson/) utilisée par le backend DuckDB
+LOCAL_DATA_DIR = os.getenv("LOCAL_DATA_DIR", "data")
+LOCAL_PROCESSED_DIR = os.path.join(LOCAL_DATA_DIR, "processed")
+# Synchronise les tables locales depuis GCS au démarrage ("0" pour un fonctionnement 100 % hors ligne)
+LOCAL_SYNC_FROM_GCS = os.getenv("LOCAL_SYNC_FROM_GCS", "1") == "1"
+
+# À partir de ce nombre de lignes, le résultat d'une requête BigQuery est lu en lots Arrow via
+# l'API BigQuery Storage (flux parallèles) plutôt que par pages REST ; en dessous, l'ouverture
+# d'une session de lecture coûte plus qu'elle ne rapporte
+BQ_STORAGE_MIN_ROWS = int(os.getenv("BQ_STORAGE_MIN_ROWS", "20000"))
+# Nombre maximal de requêtes indépendantes d'une même vue exécutées en parallèle
+QUERY_MAX_WORKERS = int(os.getenv("QUERY_MAX_WORKERS", "4"))
+
 # =================================================================
 # 2. CLIENTS (Authentification par secrets Streamlit)
 # =================================================================
@@ -41,6 +91,7 @@ def get_gcs_storage_client():
     sa_info = get_service_account_info()
     if sa_info is None:
         return None
+    from google.cloud import storage
     try:
         # Utilise from_service_account_info pour l'authentification
         return storage.Client.from_service_account_info(sa_info, project=GCP_PROJECT_ID)
@@ -48,12 +99,27 @@ def get_gcs_storage_client():
         st.error(f"❌ Échec de l'initialisation du client GCS par secrets : {e}")
         return None
 
+@st.cache_resource
+def get_app_storage():
+    """
+    Couche de stockage de l'application : client GCS authentifié par les secrets, lectures
+    servies par le cache disque partagé tant que la génération des objets ne change pas.
+    Retourne None si le client GCS ne peut pas être créé.
+    """
+    if STORAGE_BACKEND == "local":
+        return create_storage(GCS_BUCKET_NAME)
+    storage_client = get_gcs_storage_client()
+    if storage_client is None:
+        return None
+    return create_storage(GCS_BUCKET_NAME, client=storage_client)
+
 @st.cache_resource
 def get_bigquery_client():
     """Crée et met en cache le client Google Cloud BigQuery à partir des secrets."""
     sa_info = get_service_account_info()
     if sa_info is None:
         return None
+    from google.cloud import bigquery
     try:
         # Utilise from_service_account_info pour l'authentification
         return bigquery.Client.from_service_account_info(sa_info, project=GCP_PROJECT_ID)
@@ -61,23 +127,180 @@ def get_bigquery_client():
         st.error(f"❌ Échec de l'initialisation du client BigQuery par secrets : {e}")
         return None
 
+@st.cache_resource
+def get_bigquery_storage_client():
+    """
+    Crée et met en cache le client de l'API BigQuery Storage (lecture Arrow à haut débit).
+    Retourne None si le paquet google-cloud-bigquery-storage n'est pas installé : les
+    résultats sont alors lus par l'API REST.
+    """
+    sa_info = get_service_account_info()
+    if sa_info is None:
+        return None
+    try:
+        from google.cloud import bigquery_storage
+        from google.oauth2 import service_account
+    except ImportError:
+        return None
+    try:
+        credentials = service_account.Credentials.from_service_account_info(sa_info)
+        return bigquery_storage.BigQueryReadClient(credentials=credentials)
+    except Exception as e:
+        st.warning(f"⚠️ Client BigQuery Storage indisponible, lecture REST : {e}")
+        return None
+
+# =================================================================
+# 2b. COUCHE DE REQUÊTAGE (Requêtes paramétrées + cache disque partagé)
+# =================================================================
+
+def _get_bq_parameter_type(value: Any) -> str:
+    """Déduit le type BigQuery d'une valeur Python de paramètre."""
+    # bool avant int (bool est une sous-classe de int), datetime avant date
+    if isinstance(value, bool):
+        return "BOOL"
+    if isinstance(value, int):
+        return "INT64"
+    if isinstance(value, float):
+        return "FLOAT64"
+    if isinstance(value, datetime):
+        return "TIMESTAMP"
+    if isinstance(value, date):
+        return "DATE"
+    return "STRING"
+
+def _build_query_parameters(params: Dict[str, Any]) -> List[Any]:
+    """Convertit un dictionnaire {nom: valeur} en paramètres de requête BigQuery (@nom)."""
+    from google.cloud import bigquery
+    query_parameters = []
+    for name, value in params.items():
+        if isinstance(value, (list, tuple, set)):
+            values = list(value)
+            param_type = _get_bq_parameter_type(values[0]) if values else "STRING"
+            query_parameters.append(bigquery.ArrayQueryParameter(name, param_type, values))
+        else:
+            query_parameters.append(bigquery.ScalarQueryParameter(name, _get_bq_parameter_type(value), value))
+    return query_parameters
+
+@st.cache_resource(show_spinner=False)
+def get_duckdb_connection():
+    """
+    Ouvre (une fois par processus) la base DuckDB locale sur les Parquet de GCS/processed,
+    après synchronisation éventuelle des fichiers depuis GCS.
+    """
+    if LOCAL_SYNC_FROM_GCS:
+        storage = get_app_storage()
+        if storage is not None:
+            try:
+                downloaded = sync_processed_tables(storage, LOCAL_PROCESSED_DIR)
+                if downloaded:
+                    st.toast(f"🔄 {downloaded} tables synchronisées depuis GCS.")
+            except Exception as e:
+                st.warning(f"⚠️ Synchronisation GCS impossible, utilisation des fichiers locaux : {e}")
+    return create_duckdb_connection(LOCAL_PROCESSED_DIR)
+
+def _run_bigquery_query(client, bqstorage_client, query: str, params: Dict[str, Any]) -> "pa.Table":
+    """
+    Exécute la requête sur BigQuery et retourne une table Arrow : lecture en lots Arrow par
+    l'API BigQuery Storage pour les gros résultats, par l'API REST pour les petits.
+    """
+    from google.cloud import bigquery
+    job_config = bigquery.QueryJobConfig(query_parameters=_build_query_parameters(params))
+    rows = client.query(query, job_config=job_config).result()
+    if bqstorage_client is not None and (rows.total_rows or 0) >= BQ_STORAGE_MIN_ROWS:
+        return rows.to_arrow(bqstorage_client=bqstorage_client)
+    return rows.to_arrow(create_bqstorage_client=False)
+
+def _get_query_runner() -> Callable[[str, Dict[str, Any]], "pa.Table"]:
+    """
+    Résout, dans le thread du script, les ressources du moteur configuré par DATA_BACKEND
+    (les threads de travail de run_queries n'ont pas accès au contexte Streamlit).
+    """
+    if DATA_BACKEND == "duckdb":
+        connection = get_duckdb_connection()
+        return lambda query, params: run_duckdb_query(connection, query, params)
+
+    client = get_bigquery_client()
+    if client is None:
+        raise RuntimeError("Client BigQuery indisponible.")
+    bqstorage_client = get_bigquery_storage_client()
+    return lambda query, params: _run_bigquery_query(client, bqstorage_client, query, params)
+
+def _fetch_table(runner: Callable[[str, Dict[str, Any]], "pa.Table"], query: str, params: Dict[str, Any], ttl: int,
+                 refresh: bool = False) -> "pa.Table":
+    """
+    Retourne le résultat depuis le cache disque, ou exécute la requête et l'y enregistre.
+    `refresh=True` ignore l'entrée existante et la réécrit avec le nouveau résultat.
+    """
+    cache_key = make_cache_key(f"{DATA_BACKEND}:{query}", params)
+
+    table = None if refresh else get_cached_table(cache_key, ttl)
+    if table is None:
+        table = runner(query, params)
+        put_cached_table(cache_key, table)
+    return table
+
+def run_query(query: str, params: Dict[str, Any] | None = None, ttl: int = 300, refresh: bool = False) -> pd.DataFrame:
+    """
+    Exécute une requête paramétrée (@nom dans le SQL, dialecte BigQuery) sur le moteur
+    configuré par DATA_BACKEND et retourne un DataFrame.
+    Le résultat est mis en cache sur disque (Arrow IPC), partagé entre sessions et processus,
+    et réutilisé pendant `ttl` secondes pour la même requête et les mêmes paramètres
+    (`refresh=True` force la réexécution et remplace l'entrée du cache).
+    """
+    return _fetch_table(_get_query_runner(), query, params or {}, ttl, refresh).to_pandas()
+
+def run_queries(queries: Dict[str, Tuple[str, Dict[str, Any] | None]], ttl: int = 300,
+                refresh: bool = False) -> Dict[str, pd.DataFrame]:
+    """
+    Exécute en parallèle des requêtes indépendantes d'une même vue ({nom: (requête, paramètres)})
+    et retourne {nom: DataFrame} une fois toutes terminées : la vue attend la plus lente des
+    requêtes et non leur somme. Même cache disque que run_query.
+    """
+    runner = _get_query_runner()
+    with ThreadPoolExecutor(max_workers=max(1, min(len(queries), QUERY_MAX_WORKERS))) as executor:
+        futures = {
+            name: executor.submit(_fetch_table, runner, query, params or {}, ttl, refresh)
+            for name, (query, params) in queries.items()
+        }
+        return {name: future.result().to_pandas() for name, future in futures.items()}
+
+def get_query_cache_stats() -> Dict[str, int]:
+    """Compteurs de succès/échecs du cache de requêtes et occupation disque."""
+    return get_cache_stats()
+
+def get_object_cache_stats() -> Dict[str, int]:
+    """Compteurs de succès/échecs du cache disque des objets GCS et occupation disque."""
+    return get_storage_cache_stats()
+
 # =================================================================
 # 3. FONCTIONS DE CHARGEMENT DE DONNÉES (Utilisation de st.cache_data)
 # =================================================================
 
+def get_geojson_object_name(level: str) -> str:
+    """Nom de l'objet GCS du GeoJSON correspondant au niveau de détail demandé."""
+    if level == "complet":
+        return GEOJSON_OBJECT_NAME
+    return GEOJSON_OBJECT_NAME.replace(".geojson", f"_{level}.geojson")
+
 @st.cache_data(ttl=3600)
-def load_mel_geojson_data() -> Dict[str, Any] | None:
-    """Charge le fichier GeoJSON filtré (communes de la MEL) depuis GCS."""
+def load_mel_geojson_data(level: str = DEFAULT_GEOJSON_LEVEL) -> Dict[str, Any] | None:
+    """
+    Charge le fichier GeoJSON filtré (communes de la MEL) depuis GCS, dans la variante
+    simplifiée demandée. Repli sur le GeoJSON pleine résolution si la variante n'existe pas.
+    """
     
-    storage_client = get_gcs_storage_client()
-    if storage_client is None:
+    storage = get_app_storage()
+    if storage is None:
         return None
         
     try:
-        with st.spinner(f"Chargement des contours GeoJSON de la MEL depuis GCS..."):
-            blob = storage_client.bucket(GCS_BUCKET_NAME).blob(GEOJSON_OBJECT_NAME)
-            geojson_data_string = blob.download_as_text()
-            geojson_data = json.loads(geojson_data_string)
+        with st.spinner("Chargement des contours GeoJSON de la MEL depuis GCS..."):
+            object_name = get_geojson_object_name(level)
+            if level != "complet" and storage.stat(object_name) is None:
+                st.warning(f"⚠️ Variante '{level}' des contours introuvable, chargement des contours complets.")
+                object_name = GEOJSON_OBJECT_NAME
+
+            geojson_data = json.loads(storage.read_bytes(object_name))
             
             if not geojson_data or not geojson_data.get('features'):
                  st.error("❌ Le GeoJSON est vide ou mal formaté.")
@@ -89,70 +312,448 @@ def load_mel_geojson_data() -> Dict[str, Any] | None:
         st.error(f"❌ Échec de la lecture GCS/GeoJSON : {e}")
         return None
 
+def get_geoparquet_object_name(level: str) -> str:
+    """Nom de l'objet GCS GeoParquet publié à côté du GeoJSON du niveau demandé."""
+    return get_geojson_object_name(level).replace(".geojson", ".parquet")
+
+@st.cache_data(ttl=3600)
+def load_mel_communes_gdf(level: str = DEFAULT_GEOJSON_LEVEL) -> "gpd.GeoDataFrame | None":
+    """
+    Charge les communes de la MEL depuis le GeoParquet publié par prepare_geojson
+    (géométrie WKB, attributs en colonnes) : pas d'analyse JSON ni de reconstruction
+    feature par feature. Repli sur le GeoJSON si le GeoParquet est introuvable.
+    """
+    import geopandas as gpd
+
+    local_path = os.path.join(LOCAL_DATA_DIR, get_geoparquet_object_name(level))
+    if DATA_BACKEND == "duckdb" and os.path.exists(local_path):
+        # Copie locale des contours : aucun accès réseau (développement hors ligne)
+        gdf_communes = gpd.read_parquet(local_path)
+        gdf_communes["code"] = gdf_communes["code"].astype(str)
+        return gdf_communes
+
+    storage = get_app_storage()
+    if storage is None:
+        return None
+        
+    try:
+        try:
+            parquet_bytes = storage.read_bytes(get_geoparquet_object_name(level))
+        except FileNotFoundError:
+            parquet_bytes = None
+
+        if parquet_bytes is not None:
+            with st.spinner("Chargement des contours GeoParquet de la MEL depuis GCS..."):
+                df = pq.read_table(io.BytesIO(parquet_bytes)).to_pandas()
+                gdf_communes = gpd.GeoDataFrame(
+                    df.drop(columns="geometry"),
+                    geometry=gpd.GeoSeries.from_wkb(df["geometry"]),
+                    crs="EPSG:4326"
+                )
+        else:
+            geojson_data = load_mel_geojson_data(level)
+            if geojson_data is None:
+                return None
+            gdf_communes = gpd.GeoDataFrame.from_features(geojson_data["features"], crs="EPSG:4326")
+
+        if gdf_communes.empty:
+            st.error("❌ Les contours des communes sont vides.")
+            return None
+
+        gdf_communes["code"] = gdf_communes["code"].astype(str)
+        return gdf_communes
+            
+    except Exception as e:
+        st.error(f"❌ Échec de la lecture GCS/GeoParquet : {e}")
+        return None
+
 @st.cache_data(ttl=300)
 def get_latest_results_for_commune(code_insee: str) -> pd.DataFrame:
     """
     Récupère l'ensemble des résultats de mesure pour la dernière date de prélèvement
-    disponible pour la commune spécifiée, en interrogeant BigQuery.
+    disponible pour la commune spécifiée, depuis la table de service BigQuery
+    `commune_latest_results` (construite à chaque chargement, regroupée par commune).
     """
     
-    client = get_bigquery_client()
-    
     # --------------------------------------------------------------------------
-    # REQUÊTE BIGQUERY : Trouve le prélèvement le plus récent et toutes ses mesures.
+    # REQUÊTE BIGQUERY : Lecture des lignes prêtes à afficher de la commune.
     # --------------------------------------------------------------------------
     query = f"""
-    WITH LatestPrelevement AS (
-        -- 1. Trouver le code de prélèvement le plus récent (MAX(date_prelevement)
-        SELECT
-            code_prelevement,
-            date_prelevement
-        FROM
-            `{GCP_PROJECT_ID}.{BIGQUERY_DATASET_ID}.prelevements`
-        WHERE
-            code_commune = '{code_insee}'
-        ORDER BY
-            date_prelevement DESC
-        LIMIT 1
-    )
     SELECT
-        t2.libelle_parametre,
-        t1.resultat_analyse,
-        t1.code_unite,
-        t3.libelle_unite,
-        t1.limite_qualite_reference,
-        t1.conclusion_conformite,
-        lp.date_prelevement -- Date pour l'affichage
+        code_parametre,
+        libelle_parametre,
+        resultat_analyse,
+        resultat_numerique,
+        libelle_unite,
+        limite_qualite_reference,
+        conformite_bact_prelevement,
+        conclusion_conformite_prelevement,
+        date_prelevement -- Date pour l'affichage
     FROM
-        `{GCP_PROJECT_ID}.{BIGQUERY_DATASET_ID}.resultats_mesures` AS t1
-    INNER JOIN
-        LatestPrelevement AS lp
-        ON t1.code_prelevement = lp.code_prelevement
-    LEFT JOIN
-        `{GCP_PROJECT_ID}.{BIGQUERY_DATASET_ID}.parametres` AS t2
-        ON t1.code_parametre = t2.code_parametre
-    LEFT JOIN
-        `{GCP_PROJECT_ID}.{BIGQUERY_DATASET_ID}.unites` AS t3
-        ON t1.code_unite = t3.code_unite
+        `{GCP_PROJECT_ID}.{BIGQUERY_DATASET_ID}.{COMMUNE_LATEST_RESULTS_TABLE}`
+    WHERE
+        code_commune = @code_insee
+    ORDER BY
+        libelle_parametre
     """
     
     try:
         with st.spinner(f"Interrogation BigQuery pour le code {code_insee}..."):
-            df = client.query(query).to_dataframe()
+            df = run_query(query, {"code_insee": code_insee}, ttl=300)
             return df
     except Exception as e:
         st.error(f"❌ Erreur lors de l'interrogation BQ pour les résultats : {e}")
         return pd.DataFrame()
         
-# ----------------- FONCTIONS AUXILIAIRES POUR LA CARTE -----------------
+LATEST_RESULTS_ALL_QUERY = f"""
+    SELECT
+        code_commune,
+        code_parametre,
+        libelle_parametre,
+        resultat_analyse,
+        resultat_numerique,
+        libelle_unite,
+        limite_qualite_reference,
+        conformite_bact_prelevement,
+        conclusion_conformite_prelevement,
+        date_prelevement
+    FROM
+        `{GCP_PROJECT_ID}.{BIGQUERY_DATASET_ID}.{COMMUNE_LATEST_RESULTS_TABLE}`
+    ORDER BY
+        code_commune,
+        libelle_parametre
+    """
+
+def _index_latest_results(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """Indexe les dernières analyses par code INSEE."""
+    return {
+        str(code_commune): df_commune.drop(columns='code_commune').reset_index(drop=True)
+        for code_commune, df_commune in df.groupby('code_commune')
+    }
+
+@st.cache_data(ttl=300)
+def load_latest_results_for_all_communes() -> Dict[str, pd.DataFrame] | None:
+    """
+    Charge en une seule requête la dernière analyse de toutes les communes depuis la table
+    de service, indexée par code INSEE. Les clics sur la carte deviennent de simples
+    lectures en mémoire. Retourne None en cas d'échec (repli sur la requête par commune).
+    """
+    
+    try:
+        with st.spinner("Préchargement des dernières analyses de toutes les communes..."):
+            return _index_latest_results(run_query(LATEST_RESULTS_ALL_QUERY, ttl=300))
+    except Exception as e:
+        st.warning(f"⚠️ Préchargement des résultats impossible, interrogation commune par commune : {e}")
+        return None
+
+def get_latest_results(code_insee: str, latest_results_index: Dict[str, pd.DataFrame] | None) -> pd.DataFrame:
+    """
+    Retourne la dernière analyse d'une commune depuis l'index préchargé,
+    ou via la requête BigQuery par commune si le préchargement a échoué.
+    """
+    if latest_results_index is None:
+        return get_latest_results_for_commune(code_insee)
+    if code_insee in latest_results_index:
+        return latest_results_index[code_insee].copy()
+    return pd.DataFrame()
+
+CONFORMITE_QUERY = f"""
+    SELECT
+        code_commune,
+        date_dernier_prelevement,
+        derniere_conclusion,
+        dernier_non_conforme,
+        nb_analyses,
+        nb_non_conformes,
+        taux_non_conformite,
+        fenetre_mois
+    FROM
+        `{GCP_PROJECT_ID}.{BIGQUERY_DATASET_ID}.{COMMUNE_CONFORMITE_TABLE}`
+    """
+
+def _index_conformite(df: pd.DataFrame) -> Dict[str, Dict[str, Any]]:
+    """Indexe l'agrégat de conformité par code INSEE."""
+    return df.set_index('code_commune').to_dict(orient='index')
+
+@st.cache_data(ttl=300)
+def load_conformite_by_commune() -> Dict[str, Dict[str, Any]]:
+    """
+    Charge l'agrégat de conformité de toutes les communes (une ligne par commune),
+    sous forme de dictionnaire indexé par code INSEE : lecture en O(1) par style_function.
+    """
+    
+    try:
+        return _index_conformite(run_query(CONFORMITE_QUERY, ttl=300))
+    except Exception as e:
+        st.warning(f"⚠️ Agrégat de conformité indisponible : {e}")
+        return {}
+
+@st.cache_data(ttl=300)
+def load_map_data(_refresh: bool = False) -> Tuple[Dict[str, pd.DataFrame] | None, Dict[str, Dict[str, Any]]]:
+    """
+    Données de la carte en une seule attente : dernières analyses de toutes les communes et
+    agrégat de conformité, interrogés en parallèle. En cas d'échec, repli sur les chargements
+    séparés (et leurs propres replis).
+    `_refresh=True` (bouton de rafraîchissement, après load_map_data.clear()) contourne aussi
+    le cache disque des requêtes ; le préfixe _ l'exclut de la clé de st.cache_data.
+    """
+    try:
+        with st.spinner("Préchargement des analyses et de la conformité des communes..."):
+            results = run_queries({
+                'latest_results': (LATEST_RESULTS_ALL_QUERY, None),
+                'conformite': (CONFORMITE_QUERY, None),
+            }, ttl=300, refresh=_refresh)
+        return _index_latest_results(results['latest_results']), _index_conformite(results['conformite'])
+    except Exception:
+        return load_latest_results_for_all_communes(), load_conformite_by_commune()
+
+# ----------------- SÉRIES TEMPORELLES (AGRÉGÉES CÔTÉ BIGQUERY) -----------------
 
 @st.cache_data(ttl=3600)
-def load_communes_df_from_geojson(geojson_data: Dict[str, Any]) -> pd.DataFrame:
-    """Crée un DataFrame Pandas (non-géo) pour l'affichage des détails administratifs."""
-    if not geojson_data or 'features' not in geojson_data:
+def get_parametres_for_commune(code_insee: str) -> pd.DataFrame:
+    """
+    Liste les paramètres ayant au moins un résultat numérique pour la commune,
+    avec leur nombre de mesures et l'étendue de leur historique.
+    """
+    
+    query = f"""
+    SELECT
+        m.code_parametre,
+        ANY_VALUE(pa.libelle_parametre) AS libelle_parametre,
+        ANY_VALUE(pa.libelle_unite) AS libelle_unite,
+        COUNT(*) AS nb_mesures,
+        MIN(p.date_prelevement) AS date_min,
+        MAX(p.date_prelevement) AS date_max
+    FROM
+        `{GCP_PROJECT_ID}.{BIGQUERY_DATASET_ID}.resultats_mesures` AS m
+    INNER JOIN
+        `{GCP_PROJECT_ID}.{BIGQUERY_DATASET_ID}.prelevements` AS p
+        ON m.code_prelevement = p.code_prelevement
+    LEFT JOIN
+        `{GCP_PROJECT_ID}.{BIGQUERY_DATASET_ID}.parametres` AS pa
+        ON m.code_parametre = pa.code_parametre
+    WHERE
+        p.code_commune = @code_insee
+        AND m.resultat_numerique IS NOT NULL
+    GROUP BY
+        m.code_parametre
+    ORDER BY
+        nb_mesures DESC
+    """
+    
+    try:
+        return run_query(query, {"code_insee": code_insee}, ttl=3600)
+    except Exception as e:
+        st.error(f"❌ Erreur lors de la lecture des paramètres mesurés : {e}")
         return pd.DataFrame()
-        
-    gdf_communes = gpd.GeoDataFrame.from_features(geojson_data["features"])
-    df_data = gdf_communes.drop(columns="geometry").copy()
-    df_data["code"] = df_data["code"].astype(str)
-    return df_data
\ No newline at end of file
+
+def choose_time_bucket(date_min, date_max, max_points: int = TIMESERIES_MAX_POINTS) -> str:
+    """Choisit la granularité la plus fine qui garde la série sous `max_points` périodes."""
+    span_days = max((pd.Timestamp(date_max) - pd.Timestamp(date_min)).days, 1)
+    for bucket, bucket_days in TIMESERIES_BUCKETS.items():
+        if span_days / bucket_days <= max_points:
+            return bucket
+    return "YEAR"
+
+@st.cache_data(ttl=3600)
+def get_timeseries(code_insee: str, code_parametre: str, bucket: str) -> pd.DataFrame:
+    """
+    Série temporelle de `resultat_numerique` pour une commune et un paramètre, agrégée
+    par période directement dans BigQuery : min, moyenne, max et nombre de mesures par période.
+    Conserver min et max par période préserve les pics malgré le sous-échantillonnage.
+    """
+    if bucket not in TIMESERIES_BUCKETS:
+        raise ValueError(f"Granularité inconnue : {bucket}")
+    
+    query = f"""
+    SELECT
+        TIMESTAMP_TRUNC(p.date_prelevement, {TIMESERIES_TRUNC_UNITS.get(bucket, bucket)}) AS periode,
+        MIN(m.resultat_numerique) AS valeur_min,
+        AVG(m.resultat_numerique) AS valeur_moyenne,
+        MAX(m.resultat_numerique) AS valeur_max,
+        COUNT(*) AS nb_mesures
+    FROM
+        `{GCP_PROJECT_ID}.{BIGQUERY_DATASET_ID}.resultats_mesures` AS m
+    INNER JOIN
+        `{GCP_PROJECT_ID}.{BIGQUERY_DATASET_ID}.prelevements` AS p
+        ON m.code_prelevement = p.code_prelevement
+    WHERE
+        p.code_commune = @code_insee
+        AND m.code_parametre = @code_parametre
+        AND m.resultat_numerique IS NOT NULL
+    GROUP BY
+        periode
+    ORDER BY
+        periode
+    """
+    
+    try:
+        with st.spinner("Agrégation de l'historique dans BigQuery..."):
+            return run_query(query, {"code_insee": code_insee, "code_parametre": code_parametre}, ttl=3600)
+    except Exception as e:
+        st.error(f"❌ Erreur lors de l'interrogation BQ pour l'historique : {e}")
+        return pd.DataFrame()
+
+# ----------------- ANALYSES (CUBE PARAMÈTRES x COMMUNES x MOIS) -----------------
+
+# Filtre commune commun aux requêtes du cube ('' = toutes les communes)
+_CUBE_FILTER = "c.mois >= @mois_debut AND (@code_commune = '' OR c.code_commune = @code_commune)"
+
+@st.cache_data(ttl=3600)
+def load_cube_analyses(mois_debut: datetime, code_commune: str = "") -> Dict[str, pd.DataFrame]:
+    """
+    Vues agrégées de la page d'analyse, lues uniquement dans le cube précalculé
+    `cube_parametres` (aucun parcours de la table de faits), interrogées en parallèle :
+    - 'parametres' : mesures, dépassements et valeurs par paramètre,
+    - 'mois' : évolution mensuelle des mesures et des dépassements,
+    - 'communes' : dépassements et prélèvements non conformes par commune.
+    """
+    cube_table = f"`{GCP_PROJECT_ID}.{BIGQUERY_DATASET_ID}.{CUBE_PARAMETRES_TABLE}`"
+    parametres_query = f"""
+    SELECT
+        c.code_parametre,
+        ANY_VALUE(pa.libelle_parametre) AS libelle_parametre,
+        ANY_VALUE(pa.libelle_unite) AS libelle_unite,
+        SUM(c.nb_mesures) AS nb_mesures,
+        SUM(c.nb_depassements) AS nb_depassements,
+        SUM(c.nb_prelevements_non_conformes) AS nb_prelevements_non_conformes,
+        MIN(c.valeur_min) AS valeur_min,
+        -- Moyenne pondérée par le nombre de valeurs numériques de chaque cellule du cube
+        SUM(c.valeur_moyenne * c.nb_valeurs) / NULLIF(SUM(c.nb_valeurs), 0) AS valeur_moyenne,
+        MAX(c.valeur_max) AS valeur_max
+    FROM
+        {cube_table} AS c
+    LEFT JOIN
+        `{GCP_PROJECT_ID}.{BIGQUERY_DATASET_ID}.parametres` AS pa
+        ON c.code_parametre = pa.code_parametre
+    WHERE
+        {_CUBE_FILTER}
+    GROUP BY
+        c.code_parametre
+    """
+    mois_query = f"""
+    SELECT
+        c.mois,
+        SUM(c.nb_mesures) AS nb_mesures,
+        SUM(c.nb_depassements) AS nb_depassements
+    FROM
+        {cube_table} AS c
+    WHERE
+        {_CUBE_FILTER}
+    GROUP BY
+        c.mois
+    ORDER BY
+        c.mois
+    """
+    communes_query = f"""
+    SELECT
+        c.code_commune,
+        SUM(c.nb_mesures) AS nb_mesures,
+        SUM(c.nb_depassements) AS nb_depassements,
+        SUM(c.nb_prelevements_non_conformes) AS nb_prelevements_non_conformes
+    FROM
+        {cube_table} AS c
+    WHERE
+        {_CUBE_FILTER}
+    GROUP BY
+        c.code_commune
+    """
+    params = {"mois_debut": mois_debut, "code_commune": code_commune}
+
+    try:
+        with st.spinner("Lecture du cube d'analyse..."):
+            return run_queries({
+                'parametres': (parametres_query, params),
+                'mois': (mois_query, params),
+                'communes': (communes_query, params),
+            }, ttl=3600)
+    except Exception as e:
+        st.error(f"❌ Erreur lors de la lecture du cube d'analyse : {e}")
+        return {}
+
+# ----------------- INDEX SPATIAL ET RECHERCHE DE COMMUNE -----------------
+
+class CommunesIndexUnavailableError(RuntimeError):
+    """Contours des communes indisponibles : la recherche spatiale ne peut pas aboutir."""
+
+@st.cache_resource(show_spinner=False, ttl=3600)
+def get_communes_spatial_index() -> tuple:
+    """
+    Construit un index spatial (STRtree) sur les contours pleine résolution des communes,
+    reconstruit avec les contours (même durée de vie). Retourne (index, codes INSEE, noms).
+    Lève CommunesIndexUnavailableError si les contours sont indisponibles : une exception
+    n'est pas mise en cache, la recherche se rétablit dès le retour des contours.
+    """
+    import shapely
+    gdf_communes = load_mel_communes_gdf("complet")
+    if gdf_communes is None:
+        # L'échec des contours n'est pas conservé non plus (nouvelle lecture au prochain appel)
+        load_mel_communes_gdf.clear()
+        raise CommunesIndexUnavailableError("Contours des communes de la MEL indisponibles.")
+    tree = shapely.STRtree(gdf_communes.geometry.values)
+    return tree, gdf_communes["code"].to_numpy(), gdf_communes["nom"].to_numpy()
+
+def find_communes_for_points(longitudes, latitudes) -> pd.DataFrame:
+    """
+    Rattache un lot de points (WGS84) à leur commune en une seule requête sur l'index spatial.
+    Retourne un DataFrame (code_commune, nom_commune) aligné sur les points ; None si hors MEL.
+    Lève CommunesIndexUnavailableError si les contours sont indisponibles.
+    """
+    import shapely
+    spatial_index = get_communes_spatial_index()
+    points = shapely.points(np.asarray(longitudes, dtype=float), np.asarray(latitudes, dtype=float))
+    codes = np.full(len(points), None, dtype=object)
+    noms = np.full(len(points), None, dtype=object)
+
+    if len(points):
+        tree, codes_communes, noms_communes = spatial_index
+        point_idx, commune_idx = tree.query(points, predicate="within")
+        codes[point_idx] = codes_communes[commune_idx]
+        noms[point_idx] = noms_communes[commune_idx]
+
+    return pd.DataFrame({"code_commune": codes, "nom_commune": noms})
+
+def find_commune_for_point(longitude: float, latitude: float) -> Dict[str, Any] | None:
+    """
+    Retourne la commune (code et nom) contenant le point, ou None si le point est hors MEL.
+    Lève CommunesIndexUnavailableError si les contours sont indisponibles.
+    """
+    match = find_communes_for_points([longitude], [latitude]).iloc[0]
+    if match["code_commune"] is None:
+        return None
+    return match.to_dict()
+
+def normalize_address(address: str) -> str:
+    """Normalise une adresse pour la recherche : minuscules, sans accents ni espaces superflus."""
+    text = unicodedata.normalize("NFKD", str(address)).encode("ascii", "ignore").decode()
+    return " ".join(text.lower().replace(",", " ").split())
+
+@st.cache_data(ttl=3600)
+def load_address_lookup() -> pd.DataFrame | None:
+    """Charge le fichier local de géocodage (adresse -> coordonnées), s'il est disponible."""
+    if not os.path.exists(ADDRESS_LOOKUP_PATH):
+        return None
+    df_adresses = pd.read_csv(ADDRESS_LOOKUP_PATH, usecols=["adresse", "longitude", "latitude"])
+    df_adresses["adresse_normalisee"] = df_adresses["adresse"].map(normalize_address)
+    return df_adresses
+
+def geocode_address(address: str) -> Dict[str, Any] | None:
+    """
+    Géocode une adresse via le fichier local : correspondance exacte sur l'adresse normalisée,
+    sinon première adresse la contenant. Retourne {adresse, longitude, latitude} ou None
+    (y compris pour une saisie vide, trop courte ou réduite à de la ponctuation).
+    """
+    query = normalize_address(address)
+    if sum(char.isalnum() for char in query) < GEOCODE_MIN_QUERY_LENGTH:
+        return None
+
+    df_adresses = load_address_lookup()
+    if df_adresses is None:
+        return None
+
+    matches = df_adresses[df_adresses["adresse_normalisee"] == query]
+    if matches.empty:
+        matches = df_adresses[df_adresses["adresse_normalisee"].str.contains(query, regex=False)]
+    if matches.empty:
+        return None
+    return matches.iloc[0][["adresse", "longitude", "latitude"]].to_dict()
@@ -0,0 +1,120 @@
+# src/utils/duckdb_backend.py
+
+import os
+import re
+import shutil
+import pyarrow as pa
+from typing import Dict, Any
+
+from src.load.serving_tables import (
+    COMMUNE_LATEST_RESULTS_TABLE,
+    COMMUNE_CONFORMITE_TABLE,
+    get_commune_latest_results_select,
+    get_commune_conformite_select
+)
+
+# =================================================================
+# BACKEND ANALYTIQUE LOCAL (DuckDB sur les Parquet de GCS/processed)
+# =================================================================
+# Les requêtes de data_loader sont écrites pour BigQuery ; elles sont traduites à la volée
+# vers le dialecte DuckDB pour être exécutées sur une copie locale des tables traitées.
+
+# Tables normalisées (et cube d'analyse) produites par l'étape de transformation
+PROCESSED_TABLES = ['prelevements', 'parametres', 'communes_reseau', 'resultats_mesures', 'cube_parametres']
+
+# Réécritures BigQuery -> DuckDB (appliquées dans l'ordre)
+DUCKDB_SQL_REWRITES = [
+    # `projet.dataset.table` -> vue locale `table`
+    (re.compile(r"`[^`]*\.(\w+)`"), r"\1"),
+    # WEEK(MONDAY) -> WEEK : les semaines DuckDB (ISO) commencent déjà le lundi
+    (re.compile(r"\bWEEK\(MONDAY\)"), "WEEK"),
+    # TIMESTAMP_TRUNC(x, MONTH) -> date_trunc('month', x)
+    (re.compile(r"TIMESTAMP_TRUNC\(([^,]+),\s*(\w+)\)"), lambda m: f"date_trunc('{m.group(2).lower()}', {m.group(1)})"),
+    # TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL n DAY) -> (current_timestamp - INTERVAL n DAY)
+    (re.compile(r"TIMESTAMP_SUB\(CURRENT_TIMESTAMP\(\),\s*INTERVAL (\d+) DAY\)"), r"(current_timestamp - INTERVAL \1 DAY)"),
+    # Paramètres nommés @nom -> $nom
+    (re.compile(r"@(\w+)"), r"$\1"),
+]
+
+# ----------------------------------------------------------------------
+# Traduction des requêtes
+# ----------------------------------------------------------------------
+
+def translate_bigquery_sql(query: str) -> str:
+    """Traduit une requête BigQuery de l'application vers le dialecte DuckDB."""
+    for pattern, replacement in DUCKDB_SQL_REWRITES:
+        query = pattern.sub(replacement, query)
+    return query
+
+# ----------------------------------------------------------------------
+# Synchronisation locale des tables traitées
+# ----------------------------------------------------------------------
+
+def get_local_table_path(local_processed_dir: str, table_name: str) -> str:
+    return os.path.join(local_processed_dir, f"{table_name}.parquet")
+
+def sync_processed_tables(storage, local_processed_dir: str) -> int:
+    """
+    Copie localement les tables de GCS/processed absentes ou plus anciennes que leur version GCS
+    (`storage` : couche de stockage de src/utils/storage.py, le contenu passe par son cache disque).
+    Retourne le nombre de fichiers copiés.
+    """
+    os.makedirs(local_processed_dir, exist_ok=True)
+    downloaded = 0
+
+    for table_name in PROCESSED_TABLES:
+        object_name = f"processed/{table_name}.parquet"
+        info = storage.stat(object_name)
+        if info is None:
+            continue
+
+        local_path = get_local_table_path(local_processed_dir, table_name)
+        remote_mtime = info['updated']
+        if os.path.exists(local_path) and os.path.getsize(local_path) == info['size'] and os.path.getmtime(local_path) >= remote_mtime:
+            continue
+
+        tmp_path = f"{local_path}.tmp"
+        with storage.open(object_name, 'rb') as source, open(tmp_path, 'wb') as target:
+            shutil.copyfileobj(source, target)
+        os.replace(tmp_path, local_path)
+        os.utime(local_path, (remote_mtime, remote_mtime))
+        downloaded += 1
+
+    return downloaded
+
+# ----------------------------------------------------------------------
+# Connexion et exécution
+# ----------------------------------------------------------------------
+
+def create_duckdb_connection(local_processed_dir: str):
+    """
+    Ouvre une base DuckDB en mémoire exposant les tables traitées (vues sur les Parquet locaux)
+    et les tables de service (vues construites avec les mêmes requêtes que dans BigQuery).
+    """
+    import duckdb
+
+    connection = duckdb.connect(database=":memory:")
+
+    for table_name in PROCESSED_TABLES:
+        path = get_local_table_path(local_processed_dir, table_name)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Table locale introuvable : {path}")
+        connection.execute(f"CREATE VIEW {table_name} AS SELECT * FROM read_parquet('{path}')")
+
+    serving_selects = {
+        COMMUNE_LATEST_RESULTS_TABLE: get_commune_latest_results_select("local", "local"),
+        COMMUNE_CONFORMITE_TABLE: get_commune_conformite_select("local", "local"),
+    }
+    for table_name, select_query in serving_selects.items():
+        connection.execute(f"CREATE VIEW {table_name} AS {translate_bigquery_sql(select_query)}")
+
+    return connection
+
+def run_duckdb_query(connection, query: str, params: Dict[str, Any]) -> pa.Table:
+    """Exécute une requête (écrite pour BigQuery) sur DuckDB et retourne une table Arrow."""
+    # Un curseur par requête : la connexion partagée est utilisée par plusieurs sessions Streamlit
+    cursor = connection.cursor()
+    try:
+        return cursor.execute(translate_bigquery_sql(query), params).arrow()
+    finally:
+        cursor.close()
@@ -0,0 +1,129 @@
+# src/utils/query_cache.py
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import pyarrow as pa
+import pyarrow.ipc as ipc
+from typing import Dict, Any, Optional
+
+# =================================================================
+# CONFIGURATION DU CACHE DISQUE DES RÉSULTATS DE REQUÊTES
+# =================================================================
+# Le cache est partagé par toutes les sessions et tous les processus Streamlit de la machine :
+# un processus froid relit les résultats sur disque (format Arrow IPC) au lieu de réinterroger BigQuery.
+
+QUERY_CACHE_DIR = os.getenv("QUERY_CACHE_DIR", os.path.join(tempfile.gettempdir(), "qualite_eau_query_cache"))
+QUERY_CACHE_MAX_BYTES = int(os.getenv("QUERY_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Compteurs du processus courant
+_cache_counters = {'hits': 0, 'misses': 0}
+_counters_lock = threading.Lock()
+
+# ----------------------------------------------------------------------
+# Clés et chemins
+# ----------------------------------------------------------------------
+
+def make_cache_key(query: str, params: Dict[str, Any]) -> str:
+    """Construit la clé de cache d'une requête et de ses paramètres (espaces normalisés)."""
+    payload = json.dumps(
+        {'query': " ".join(query.split()), 'params': params},
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def _get_cache_path(cache_key: str) -> str:
+    return os.path.join(QUERY_CACHE_DIR, f"{cache_key}.arrow")
+
+def _increment_counter(name: str):
+    with _counters_lock:
+        _cache_counters[name] += 1
+
+# ----------------------------------------------------------------------
+# Lecture / Écriture
+# ----------------------------------------------------------------------
+
+def get_cached_table(cache_key: str, ttl: int) -> Optional[pa.Table]:
+    """
+    Retourne le résultat en cache s'il existe et a moins de `ttl` secondes, sinon None.
+    Un accès réussi met à jour la date d'accès du fichier (éviction LRU).
+    """
+    path = _get_cache_path(cache_key)
+    try:
+        stat = os.stat(path)
+        if time.time() - stat.st_mtime > ttl:
+            _increment_counter('misses')
+            return None
+
+        with pa.memory_map(path, 'r') as source:
+            table = ipc.open_file(source).read_all()
+        os.utime(path, (time.time(), stat.st_mtime))
+    except (FileNotFoundError, pa.ArrowInvalid):
+        # Absent, supprimé par un autre processus ou en cours d'écriture : traité comme un échec de cache
+        _increment_counter('misses')
+        return None
+
+    _increment_counter('hits')
+    return table
+
+def put_cached_table(cache_key: str, table: pa.Table):
+    """
+    Enregistre un résultat dans le cache (écriture atomique : fichier temporaire puis renommage),
+    puis applique la limite de taille du cache.
+    """
+    os.makedirs(QUERY_CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=QUERY_CACHE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as sink:
+            with ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, _get_cache_path(cache_key))
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    evict_cache(QUERY_CACHE_MAX_BYTES)
+
+def evict_cache(max_bytes: int, cache_dir: str = QUERY_CACHE_DIR, suffix: str = ".arrow"):
+    """
+    Supprime les entrées (fichiers `suffix` de `cache_dir`) les moins récemment utilisées
+    jusqu'à repasser sous `max_bytes`.
+    """
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(suffix):
+            try:
+                stat = entry.stat()
+                entries.append((stat.st_atime, stat.st_size, entry.path))
+            except FileNotFoundError:
+                continue
+
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_size -= size
+
+def get_cache_stats() -> Dict[str, int]:
+    """Retourne les compteurs du processus et l'occupation actuelle du cache disque."""
+    entries, size_bytes = 0, 0
+    if os.path.isdir(QUERY_CACHE_DIR):
+        for entry in os.scandir(QUERY_CACHE_DIR):
+            if entry.name.endswith(".arrow"):
+                try:
+                    size_bytes += entry.stat().st_size
+                except FileNotFoundError:
+                    # Entrée évincée par un autre processus pendant le parcours
+                    continue
+                entries += 1
+    with _counters_lock:
+        return {**_cache_counters, 'entries': entries, 'size_bytes': size_bytes}
@@ -0,0 +1,406 @@
+# src/utils/storage.py
+
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from src.utils.query_cache import evict_cache
+
+# =================================================================
+# COUCHE DE STOCKAGE OBJET (GCS / SYSTÈME DE FICHIERS LOCAL)
+# =================================================================
+# Point d'accès unique aux objets du bucket pour le pipeline et l'application.
+# - STORAGE_BACKEND=gcs (défaut) : Google Cloud Storage, avec un cache disque en lecture
+#   indexé par la génération des objets (une nouvelle version d'un objet a une nouvelle
+#   génération : une entrée de cache n'est donc jamais périmée, seulement inutilisée).
+# - STORAGE_BACKEND=local : objets sous LOCAL_STORAGE_DIR/<objet> (hors ligne, benchmarks).
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "gcs")
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", "data")
+
+STORAGE_CACHE_DIR = os.path.expanduser(
+    os.getenv("STORAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "qualite_eau_storage_cache"))
+)
+# 0 désactive le cache disque (lectures directes depuis GCS)
+STORAGE_CACHE_MAX_BYTES = int(os.getenv("STORAGE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+CACHE_SUFFIX = ".blob"
+
+# Compteurs du processus courant
+_cache_counters = {'hits': 0, 'misses': 0, 'bytes_downloaded': 0}
+_counters_lock = threading.Lock()
+
+# Instances par bucket (voir get_storage / set_storage)
+_storages: Dict[str, object] = {}
+_storages_lock = threading.Lock()
+
+class StorageCacheError(RuntimeError):
+    """
+    Entrée du cache disque disparue entre sa création et sa lecture (éviction concurrente).
+    Distincte de FileNotFoundError, réservée aux objets absents du bucket.
+    """
+
+# ----------------------------------------------------------------------
+# Utilitaires
+# ----------------------------------------------------------------------
+
+def split_gcs_path(path: str) -> Tuple[str, str]:
+    """Décompose 'gs://<bucket>/<objet>' en (bucket, objet)."""
+    bucket_name, _, object_name = path.replace("gs://", "", 1).partition("/")
+    return bucket_name, object_name
+
+def _increment_counter(name: str, value: int = 1):
+    with _counters_lock:
+        _cache_counters[name] += value
+
+def _write_atomic(path: str, data: bytes):
+    """Écrit un fichier via un fichier temporaire puis un renommage (jamais de lecture partielle)."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as sink:
+            sink.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _open_path(path: str, mode: str):
+    """Ouvre un fichier local ; les modes texte sont en UTF-8 comme les flux GCS."""
+    if 'b' in mode:
+        return open(path, mode)
+    return open(path, mode, encoding='utf-8')
+
+class _AtomicLocalWriter:
+    """
+    Flux d'écriture local publié à la fermeture (fichier temporaire puis renommage),
+    comme un envoi GCS. abort() (ou une exception dans le bloc with) supprime le fichier
+    temporaire et laisse l'objet existant intact.
+    """
+
+    def __init__(self, path: str, mode: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        os.close(fd)
+        self._file = _open_path(self._tmp_path, mode)
+        self._path = path
+
+    def write(self, data):
+        return self._file.write(data)
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+            os.replace(self._tmp_path, self._path)
+
+    def abort(self):
+        if not self._file.closed:
+            self._file.close()
+            os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+class _GCSUploadWriter:
+    """
+    Flux d'envoi GCS publié à la fermeture. Un BlobWriter abandonné finalise l'envoi
+    lorsqu'il est détruit (IOBase.__del__ appelle close()) : abort() (ou une exception dans
+    le bloc with) annule explicitement l'envoi et laisse l'objet existant intact.
+    """
+
+    def __init__(self, blob, mode: str, content_type: str):
+        self._raw = blob.open('wb', content_type=content_type)
+        self._file = self._raw if 'b' in mode else io.TextIOWrapper(self._raw, encoding='utf-8')
+
+    def write(self, data):
+        return self._file.write(data)
+
+    def close(self):
+        if not self._raw.closed:
+            self._file.close()
+
+    def abort(self):
+        if not self._raw.closed:
+            self._raw.terminate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+# ----------------------------------------------------------------------
+# Backend local
+# ----------------------------------------------------------------------
+
+class LocalStorage:
+    """Bucket sur le système de fichiers : l'objet <nom> correspond au fichier <root>/<nom>."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, object_name: str) -> str:
+        return os.path.join(self.root, object_name)
+
+    def stat(self, object_name: str) -> Optional[Dict]:
+        """Métadonnées d'un objet (name, size, updated, generation) ou None s'il n'existe pas."""
+        try:
+            st = os.stat(self._path(object_name))
+        except FileNotFoundError:
+            return None
+        return {'name': object_name, 'size': st.st_size, 'updated': st.st_mtime, 'generation': str(st.st_mtime_ns)}
+
+    def list_objects(self, prefix: str) -> List[Dict]:
+        """Métadonnées des objets dont le nom commence par `prefix`, triées par nom."""
+        objects = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith(".tmp"):
+                    continue
+                object_name = os.path.relpath(os.path.join(dirpath, filename), self.root).replace(os.sep, "/")
+                if object_name.startswith(prefix):
+                    objects.append(self.stat(object_name))
+        return sorted((o for o in objects if o is not None), key=lambda o: o['name'])
+
+    def read_bytes(self, object_name: str) -> bytes:
+        with open(self._path(object_name), 'rb') as f:
+            return f.read()
+
+    def write_bytes(self, object_name: str, data: bytes, content_type: str = 'application/octet-stream'):
+        _write_atomic(self._path(object_name), data)
+
+    def open(self, object_name: str, mode: str = 'rb', content_type: str = 'application/octet-stream'):
+        if 'r' in mode:
+            return _open_path(self._path(object_name), mode)
+        return _AtomicLocalWriter(self._path(object_name), mode)
+
+    def delete(self, object_name: str):
+        try:
+            os.remove(self._path(object_name))
+        except FileNotFoundError:
+            pass
+
+# ----------------------------------------------------------------------
+# Backend GCS avec cache disque en lecture
+# ----------------------------------------------------------------------
+
+class GCSStorage:
+    """
+    Bucket GCS. Les lectures passent par un cache disque partagé par les processus de la
+    machine (étapes du pipeline, relances, application) : seule une requête de métadonnées
+    est envoyée pour vérifier la génération courante, le contenu n'est téléchargé qu'une fois
+    par génération. Les écritures alimentent aussi le cache avec la génération créée.
+    """
+
+    def __init__(self, bucket_name: str, client=None, cache_dir: str = STORAGE_CACHE_DIR,
+                 max_cache_bytes: int = STORAGE_CACHE_MAX_BYTES):
+        self.bucket_name = bucket_name
+        self._client = client
+        self.cache_dir = cache_dir
+        self.max_cache_bytes = max_cache_bytes
+
+    @property
+    def client(self):
+        if self._client is None:
+            from google.cloud import storage
+            self._client = storage.Client()
+        return self._client
+
+    @property
+    def bucket(self):
+        return self.client.bucket(self.bucket_name)
+
+    @staticmethod
+    def _to_info(blob) -> Dict:
+        return {
+            'name': blob.name,
+            'size': blob.size,
+            'updated': blob.updated.timestamp() if blob.updated else None,
+            'generation': str(blob.generation)
+        }
+
+    def _get_blob(self, object_name: str):
+        blob = self.bucket.get_blob(object_name)
+        if blob is None:
+            raise FileNotFoundError(f"gs://{self.bucket_name}/{object_name}")
+        return blob
+
+    # --- Cache ---
+
+    def _cache_prefix(self, object_name: str) -> str:
+        return hashlib.sha256(f"{self.bucket_name}/{object_name}".encode()).hexdigest()[:32]
+
+    def _cache_path(self, object_name: str, generation) -> str:
+        return os.path.join(self.cache_dir, f"{self._cache_prefix(object_name)}_{generation}{CACHE_SUFFIX}")
+
+    def _drop_cached(self, object_name: str, keep_generation=None):
+        """
+        Supprime les générations d'un objet présentes dans le cache, sauf `keep_generation`
+        (qu'un autre processus peut être en train d'écrire ou de lire).
+        """
+        if not os.path.isdir(self.cache_dir):
+            return
+        prefix = self._cache_prefix(object_name) + "_"
+        keep_path = self._cache_path(object_name, keep_generation) if keep_generation is not None else None
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.startswith(prefix) and entry.path != keep_path:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def _put_cached(self, object_name: str, generation, data: bytes) -> str:
+        """
+        Ajoute une génération au cache. La place est libérée avant l'écriture (éviction LRU),
+        pour que l'entrée ajoutée reste lisible par l'appelant.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._drop_cached(object_name, keep_generation=generation)
+        evict_cache(max(self.max_cache_bytes - len(data), 0), self.cache_dir, CACHE_SUFFIX)
+        path = self._cache_path(object_name, generation)
+        _write_atomic(path, data)
+        return path
+
+    @property
+    def cache_enabled(self) -> bool:
+        return self.max_cache_bytes > 0
+
+    # --- Lecture ---
+
+    def stat(self, object_name: str) -> Optional[Dict]:
+        """Métadonnées d'un objet (name, size, updated, generation) ou None s'il n'existe pas."""
+        blob = self.bucket.get_blob(object_name)
+        return self._to_info(blob) if blob is not None else None
+
+    def list_objects(self, prefix: str) -> List[Dict]:
+        """Métadonnées des objets dont le nom commence par `prefix`, triées par nom."""
+        blobs = self.client.list_blobs(self.bucket_name, prefix=prefix)
+        return sorted((self._to_info(blob) for blob in blobs), key=lambda o: o['name'])
+
+    def _read_through(self, object_name: str) -> Tuple[str, Optional[bytes]]:
+        """
+        Retourne (chemin du cache de la génération courante, contenu s'il vient d'être téléchargé).
+        Seule l'absence de l'objet dans le bucket lève FileNotFoundError.
+        """
+        blob = self._get_blob(object_name)
+        path = self._cache_path(object_name, blob.generation)
+        try:
+            os.utime(path)
+            _increment_counter('hits')
+            return path, None
+        except FileNotFoundError:
+            pass
+
+        _increment_counter('misses')
+        # Le blob porte sa génération : le contenu téléchargé correspond exactement à la clé de cache
+        data = blob.download_as_bytes()
+        _increment_counter('bytes_downloaded', len(data))
+        return self._put_cached(object_name, blob.generation, data), data
+
+    def _open_cached(self, object_name: str, mode: str):
+        """
+        Ouvre l'entrée de cache de l'objet. Une entrée évincée entre sa vérification et son
+        ouverture est retéléchargée une fois, puis StorageCacheError est levée.
+        """
+        for _ in range(2):
+            path, _ = self._read_through(object_name)
+            try:
+                return _open_path(path, mode)
+            except FileNotFoundError:
+                continue
+        raise StorageCacheError(f"Entrée de cache de gs://{self.bucket_name}/{object_name} évincée pendant la lecture.")
+
+    def read_bytes(self, object_name: str) -> bytes:
+        if not self.cache_enabled:
+            data = self._get_blob(object_name).download_as_bytes()
+            _increment_counter('bytes_downloaded', len(data))
+            return data
+
+        path, data = self._read_through(object_name)
+        if data is not None:
+            # Échec de cache : le contenu est déjà en mémoire, inutile de relire l'entrée
+            return data
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            with self._open_cached(object_name, 'rb') as f:
+                return f.read()
+
+    # --- Écriture ---
+
+    def write_bytes(self, object_name: str, data: bytes, content_type: str = 'application/octet-stream'):
+        blob = self.bucket.blob(object_name)
+        blob.upload_from_string(data, content_type=content_type)
+        if self.cache_enabled and blob.generation is not None:
+            self._put_cached(object_name, blob.generation, data)
+        else:
+            self._drop_cached(object_name)
+
+    def open(self, object_name: str, mode: str = 'rb', content_type: str = 'application/octet-stream'):
+        """
+        Lecture : fichier du cache (téléchargé une fois par génération).
+        Écriture : flux d'envoi GCS, l'objet n'est créé qu'à la fermeture du flux
+        (à utiliser dans un bloc with : une exception annule l'envoi).
+        """
+        if 'r' in mode:
+            if not self.cache_enabled:
+                return self._get_blob(object_name).open(mode)
+            return self._open_cached(object_name, mode)
+        return _GCSUploadWriter(self.bucket.blob(object_name), mode, content_type)
+
+    def delete(self, object_name: str):
+        from google.api_core import exceptions
+        try:
+            self.bucket.blob(object_name).delete()
+        except exceptions.NotFound:
+            pass
+        self._drop_cached(object_name)
+
+# ----------------------------------------------------------------------
+# Sélection du backend
+# ----------------------------------------------------------------------
+
+def create_storage(bucket_name: str, client=None):
+    """Crée le backend configuré par STORAGE_BACKEND pour un bucket."""
+    if STORAGE_BACKEND == "local":
+        return LocalStorage(LOCAL_STORAGE_DIR)
+    if STORAGE_BACKEND == "gcs":
+        return GCSStorage(bucket_name, client=client)
+    raise ValueError(f"STORAGE_BACKEND inconnu : '{STORAGE_BACKEND}' (attendu : gcs ou local).")
+
+def get_storage(bucket_name: str):
+    """Retourne le backend partagé d'un bucket (créé au premier appel)."""
+    with _storages_lock:
+        if bucket_name not in _storages:
+            _storages[bucket_name] = create_storage(bucket_name)
+        return _storages[bucket_name]
+
+def set_storage(bucket_name: str, storage_backend):
+    """Remplace le backend d'un bucket (identifiants explicites de l'application, benchmarks locaux)."""
+    with _storages_lock:
+        _storages[bucket_name] = storage_backend
+
+def get_storage_cache_stats() -> Dict[str, int]:
+    """Retourne les compteurs du processus et l'occupation actuelle du cache disque."""
+    entries, size_bytes = 0, 0
+    if os.path.isdir(STORAGE_CACHE_DIR):
+        for entry in os.scandir(STORAGE_CACHE_DIR):
+            if entry.name.endswith(CACHE_SUFFIX):
+                entries += 1
+                size_bytes += entry.stat().st_size
+    with _counters_lock:
+        return {**_cache_counters, 'entries': entries, 'size_bytes': size_bytes}
@@ -0,0 +1,11 @@
+# tests/conftest.py
+
+import os
+import sys
+
+# Racine du dépôt dans le chemin d'import (modules src.* et config)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Configuration factice : aucun test n'appelle GCP
+os.environ.setdefault("GCP_PROJECT_ID", "test")
+os.environ.setdefault("GCS_BUCKET_NAME", "test")
@@ -0,0 +1,73 @@
+# tests/test_conformite.py
+
+import math
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from src.etl.conformite import parse_limite_qualite, is_mesure_en_depassement, is_prelevement_non_conforme
+
+# ----------------------------------------------------------------------
+# Limites de qualité
+# ----------------------------------------------------------------------
+
+@pytest.mark.parametrize("libelle, limite_min, limite_max", [
+    ("<=50 mg/L", None, 50.0),
+    (">=6,5 et <=9 unité pH", 6.5, 9.0),
+    ("0 n/(100mL)", None, 0.0),
+    ("<0.1 µg/L", None, 0.1),
+    ("≥ 200 µS/cm", 200.0, None),
+    (None, None, None),
+])
+def test_parse_limite_qualite(libelle, limite_min, limite_max):
+    df_limites = parse_limite_qualite(pd.Series([libelle]))
+    for column, expected in (('limite_min', limite_min), ('limite_max', limite_max)):
+        value = df_limites[column].iloc[0]
+        if expected is None:
+            assert pd.isna(value)
+        else:
+            assert math.isclose(value, expected)
+
+def _parametres():
+    return pd.DataFrame({
+        'code_parametre': ['NO3', 'PH', 'ECOLI', 'SANS_LIMITE'],
+        'limite_qualite_parametre': ["<=50 mg/L", ">=6,5 et <=9 unité pH", "0 n/(100mL)", None],
+    })
+
+def _mesures(rows):
+    return pd.DataFrame(rows, columns=['code_parametre', 'resultat_numerique', 'resultat_alphanumerique'])
+
+def test_is_mesure_en_depassement_bornes():
+    df_mesures = _mesures([
+        ('NO3', 49.0, "49"),
+        ('NO3', 51.0, "51"),
+        ('PH', 6.0, "6"),
+        ('PH', 9.5, "9,5"),
+        ('PH', 7.2, "7,2"),
+        ('ECOLI', 0.0, "0"),
+        ('ECOLI', 3.0, "3"),
+        ('SANS_LIMITE', 1000.0, "1000"),
+    ])
+    result = is_mesure_en_depassement(df_mesures, _parametres()).tolist()
+    assert result == [False, True, True, True, False, False, True, False]
+
+def test_is_mesure_en_depassement_sous_seuil_de_quantification():
+    # "<LQ" : résultat numérique à 0, jamais comparé à une borne minimale
+    df_mesures = _mesures([('PH', 0.0, "<LQ"), ('NO3', 0.0, "<LQ")])
+    assert is_mesure_en_depassement(df_mesures, _parametres()).tolist() == [False, False]
+
+# ----------------------------------------------------------------------
+# Prélèvements
+# ----------------------------------------------------------------------
+
+def test_is_prelevement_non_conforme():
+    df_prelevements = pd.DataFrame({
+        'conclusion_conformite_prelevement': [
+            "Eau d'alimentation conforme aux exigences de qualité.",
+            "Eau d'alimentation NON-CONFORME aux limites de qualité.",
+            None,
+        ],
+        'conformite_limites_bact_prelevement': ['C', 'C', 'N'],
+    })
+    assert is_prelevement_non_conforme(df_prelevements).tolist() == [False, True, True]
@@ -0,0 +1,21 @@
+# tests/test_duckdb_backend.py
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from src.utils.duckdb_backend import translate_bigquery_sql
+
+def test_table_names_become_local_views():
+    assert translate_bigquery_sql("SELECT * FROM `projet.dataset.prelevements`") == "SELECT * FROM prelevements"
+
+@pytest.mark.parametrize("unit, expected", [
+    ("MONTH", "date_trunc('month', p.date_prelevement)"),
+    # Semaines commençant le lundi des deux côtés
+    ("WEEK(MONDAY)", "date_trunc('week', p.date_prelevement)"),
+])
+def test_timestamp_trunc(unit, expected):
+    assert translate_bigquery_sql(f"TIMESTAMP_TRUNC(p.date_prelevement, {unit})") == expected
+
+def test_named_parameters():
+    assert translate_bigquery_sql("WHERE code_commune = @code_insee") == "WHERE code_commune = $code_insee"
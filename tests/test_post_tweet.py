@@ -0,0 +1,63 @@
+# tests/test_post_tweet.py
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+post_tweet = pytest.importorskip("src.twitter.post_tweet")
+
+from src.etl.conformite import find_depassements
+
+def _prelevements():
+    return pd.DataFrame({
+        'code_prelevement': ['P1', 'P2', 'P3'],
+        'code_commune': ['59350', '59512', '59599'],
+        'date_prelevement': pd.to_datetime(['2024-01-03', '2024-01-02', '2024-01-01'], utc=True),
+        'conclusion_conformite_prelevement': [
+            "Eau d'alimentation conforme aux exigences de qualité.",
+            "Eau d'alimentation non conforme aux limites de qualité.",
+            "Eau d'alimentation conforme aux exigences de qualité.",
+        ],
+        'conformite_limites_bact_prelevement': ['C', 'C', 'C'],
+    })
+
+def _depassements():
+    df_mesures = pd.DataFrame({
+        'code_prelevement': ['P1', 'P1', 'P3'],
+        'code_parametre': ['NO3', 'PH', 'NO3'],
+        'resultat_numerique': [62.0, 7.0, 12.0],
+        'resultat_alphanumerique': ["62", "7", "12"],
+    })
+    df_parametres = pd.DataFrame({
+        'code_parametre': ['NO3', 'PH'],
+        'libelle_parametre': ['Nitrates', 'pH'],
+        'libelle_unite': ['mg/L', 'unité pH'],
+        'limite_qualite_parametre': ["<=50 mg/L", ">=6,5 et <=9 unité pH"],
+    })
+    return find_depassements(df_mesures, df_parametres)
+
+def test_detect_alerts_regroupe_par_prelevement():
+    df_alerts = post_tweet.detect_alerts(_prelevements(), _depassements())
+
+    # P2 : conclusion non conforme ; P1 : dépassement des nitrates ; P3 : conforme
+    assert df_alerts['code_prelevement'].tolist() == ['P2', 'P1']
+    alerts = df_alerts.set_index('code_prelevement')
+    assert alerts.loc['P2', 'depassements'] == []
+    assert alerts.loc['P1', 'depassements'] == ["Nitrates : 62 mg/L (limite <=50 mg/L)"]
+    assert alerts.loc['P1', 'code_commune'] == '59350'
+
+def test_detect_alerts_sans_non_conformite():
+    df_prelevements = _prelevements().iloc[[0, 2]]
+    df_alerts = post_tweet.detect_alerts(df_prelevements, pd.DataFrame(columns=['code_prelevement']))
+    assert df_alerts.empty
+    assert 'depassements' in df_alerts.columns
+
+def test_format_alert_message_tronque():
+    alert = {
+        'code_commune': '59350',
+        'date_prelevement': '2024-01-03',
+        'conclusion_conformite_prelevement': None,
+        'depassements': ["Paramètre très long : 1 mg/L (limite <=0,5 mg/L)"] * 20,
+    }
+    message = post_tweet.format_alert_message(alert, "Lille")
+    assert len(message) <= post_tweet.MAX_MESSAGE_LENGTH
+    assert message.startswith("⚠️ Eau potable – Lille : prélèvement du 03/01/2024 non conforme.")
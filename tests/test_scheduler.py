@@ -0,0 +1,141 @@
+# tests/test_scheduler.py
+
+import sys
+import time
+
+import pytest
+
+from src.pipeline import scheduler
+from src.pipeline.scheduler import (
+    STATUS_BLOCKED,
+    STATUS_FAILED,
+    STATUS_SUCCESS,
+    STATUS_UP_TO_DATE,
+    is_stage_up_to_date,
+    run_stages,
+    select_stages,
+)
+
+# Aucune ressource GCS / BigQuery : les dates de modification sont lues dans ce dictionnaire
+@pytest.fixture
+def mtimes(monkeypatch):
+    resources = {}
+    monkeypatch.setattr(scheduler, "get_resource_mtime", lambda resource: resources.get(resource))
+    return resources
+
+def _stage(run=lambda: None, depends_on=(), **options):
+    return {'run': run, 'depends_on': list(depends_on), 'inputs': [], 'outputs': [], **options}
+
+def _failing(error=RuntimeError("boom")):
+    def run():
+        raise error
+    return run
+
+# ----------------------------------------------------------------------
+# Sélection des étapes
+# ----------------------------------------------------------------------
+
+def test_select_stages_keeps_whole_graph_without_names():
+    stages = {'a': _stage(), 'b': _stage(depends_on=['a'])}
+    assert select_stages(stages, None) is stages
+
+def test_select_stages_drops_dependencies_outside_selection():
+    stages = {'a': _stage(), 'b': _stage(depends_on=['a']), 'c': _stage(depends_on=['a', 'b'])}
+    selected = select_stages(stages, ['b', 'c'])
+    assert list(selected) == ['b', 'c']
+    assert selected['b']['depends_on'] == []
+    assert selected['c']['depends_on'] == ['b']
+    # Le graphe d'origine n'est pas modifié
+    assert stages['c']['depends_on'] == ['a', 'b']
+
+def test_select_stages_rejects_unknown_names():
+    with pytest.raises(ValueError, match="inconnues"):
+        select_stages({'a': _stage()}, ['a', 'z'])
+
+# ----------------------------------------------------------------------
+# Exécution du graphe
+# ----------------------------------------------------------------------
+
+def test_failure_blocks_only_downstream_stages(mtimes):
+    stages = {
+        'extract': _stage(_failing()),
+        'transform': _stage(depends_on=['extract']),
+        'load': _stage(depends_on=['transform']),
+        'independent': _stage(),
+    }
+    results = run_stages(stages, max_workers=2)
+    assert results['extract']['status'] == STATUS_FAILED
+    assert results['extract']['error'] == "boom"
+    assert results['transform']['status'] == STATUS_BLOCKED
+    assert results['load']['status'] == STATUS_BLOCKED
+    assert results['independent']['status'] == STATUS_SUCCESS
+
+def test_retries_until_success(mtimes):
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("erreur transitoire")
+
+    results = run_stages({'flaky': _stage(flaky, retries=1)})
+    assert results['flaky']['status'] == STATUS_SUCCESS
+    assert len(calls) == 2
+
+def test_failure_after_last_retry(mtimes):
+    calls = []
+
+    def always_failing():
+        calls.append(1)
+        raise RuntimeError("toujours en erreur")
+
+    results = run_stages({'stage': _stage(always_failing, retries=2)})
+    assert results['stage']['status'] == STATUS_FAILED
+    assert len(calls) == 3
+
+def test_system_exit_becomes_stage_failure(mtimes):
+    stages = {'exiting': _stage(lambda: sys.exit(3)), 'after': _stage(depends_on=['exiting'])}
+    results = run_stages(stages)
+    assert results['exiting']['status'] == STATUS_FAILED
+    assert "code 3" in results['exiting']['error']
+    assert results['after']['status'] == STATUS_BLOCKED
+
+def test_up_to_date_stage_is_skipped_unless_forced(mtimes):
+    calls = []
+    mtimes.update({"gs:in": 100.0, "gs:out": 200.0})
+    stages = {'stage': _stage(lambda: calls.append(1), inputs=["gs:in"], outputs=["gs:out"])}
+
+    assert run_stages(stages)['stage']['status'] == STATUS_UP_TO_DATE
+    assert calls == []
+    assert run_stages(stages, force=True)['stage']['status'] == STATUS_SUCCESS
+    assert calls == [1]
+
+# ----------------------------------------------------------------------
+# Fraîcheur des sorties
+# ----------------------------------------------------------------------
+
+def test_stage_without_outputs_is_never_up_to_date(mtimes):
+    assert is_stage_up_to_date(_stage()) == (False, "aucune sortie déclarée")
+
+def test_missing_output_is_not_up_to_date(mtimes):
+    up_to_date, reason = is_stage_up_to_date(_stage(outputs=["gs:out"]))
+    assert not up_to_date
+    assert "gs:out" in reason
+
+def test_newer_input_makes_stage_stale(mtimes):
+    mtimes.update({"gs:in": 300.0, "gs:out": 200.0})
+    up_to_date, reason = is_stage_up_to_date(_stage(inputs=["gs:in"], outputs=["gs:out"]))
+    assert not up_to_date
+    assert "gs:in" in reason
+
+def test_max_age_hours(mtimes):
+    now = time.time()
+    stage = _stage(outputs=["gs:out"], max_age_hours=20)
+
+    mtimes["gs:out"] = now - 2 * 3600
+    assert is_stage_up_to_date(stage) == (True, "sorties à jour")
+
+    mtimes["gs:out"] = now - 21 * 3600
+    up_to_date, reason = is_stage_up_to_date(stage)
+    assert not up_to_date
+    assert "20 h" in reason
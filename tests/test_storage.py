@@ -0,0 +1,29 @@
+# tests/test_storage.py
+
+import os
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from src.utils.storage import LocalStorage
+
+def test_local_writer_publishes_on_close(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    with storage.open("Geojson/a.geojson", 'w') as writer:
+        writer.write('{"features": []}')
+    assert storage.read_bytes("Geojson/a.geojson") == b'{"features": []}'
+    assert os.listdir(tmp_path / "Geojson") == ["a.geojson"]
+
+def test_local_writer_aborts_on_exception(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    storage.write_bytes("Geojson/a.geojson", b"contours valides")
+
+    with pytest.raises(ValueError):
+        with storage.open("Geojson/a.geojson", 'w') as writer:
+            writer.write('{"type": "FeatureCollection", "features": [')
+            raise ValueError("flux source invalide")
+
+    # Objet existant intact, pas de fichier temporaire résiduel
+    assert storage.read_bytes("Geojson/a.geojson") == b"contours valides"
+    assert os.listdir(tmp_path / "Geojson") == ["a.geojson"]